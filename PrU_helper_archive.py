@@ -0,0 +1,216 @@
+# PrU_helper_archive.py
+# hot/cold archiving: finished records are moved out of the live table into compressed, read-only segments
+
+# the tables and their rules are listed in my_db_archives (see PrU_helper_db.py)
+# each segment holds the archived records of one year, as gzip compressed JSON lines, and is never changed:
+# archiving more records of that year writes a new segment and the manifest switches to it
+# the manifest (manifest.json) lists the segments, and the highest 'id' archived, so the ids are never used again
+# the records are written to the segments first, then the manifest lists them as 'moving', then they are removed
+# from the live table; if the program stops in between, finishArchiveMove() completes the move
+
+import gzip
+import json
+import os
+import shutil
+from datetime import datetime, timedelta
+from PrU_helper_db import *
+from PrU_helper_json import *
+
+ARCHIVE_MANIFEST = "manifest.json"
+
+##################
+# helper functions
+
+def _saveManifest(table_name, manifest):
+    folder = archiveFolder(table_name)
+    os.makedirs(folder, exist_ok=True)
+    writeFileAtomic(os.path.join(folder, ARCHIVE_MANIFEST), lambda f: json.dump(manifest, f, indent=4))
+
+def _writeSegment(file_path, records):
+    """
+    Write the records of a segment, the file only appears once it's complete.
+    """
+    with gzip.open(file_path + ".tmp", 'wt', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(dict(record), ensure_ascii=False))
+            f.write('\n')
+    os.replace(file_path + ".tmp", file_path)
+
+def _readSegment(table_name, file_name):
+    """
+    Stream the records of a segment.
+    """
+    my_record_class = recordClass(table_name)
+    with gzip.open(os.path.join(archiveFolder(table_name), file_name), 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield my_record_class.fromDict(json.loads(line))
+
+def _removeUnlisted(table_name, manifest):
+    """
+    Delete the segment files the manifest doesn't list anymore, replaced or left by an interrupted archiving.
+    """
+    folder = archiveFolder(table_name)
+    listed = {segment['file'] for segment in manifest['segments'].values()} | {ARCHIVE_MANIFEST}
+    for file_name in os.listdir(folder):
+        if file_name not in listed:
+            os.remove(os.path.join(folder, file_name))
+
+##################
+# functions to archive records
+
+def finishArchiveMove(table_name):
+    """
+    Remove from the live table the records the manifest lists as 'moving', they are already in the segments.
+    It does nothing when no archiving was interrupted.
+
+    :param table_name: The name of the table.
+    :return: The number of records removed from the live table.
+    """
+    with lockTables(table_name):
+        manifest = loadArchiveManifest(table_name)
+        moving = set(manifest.get('moving', ()))
+        if not moving:
+            return 0
+        data = loadJTable(table_name)
+        keep = [record for record in data if record['id'] not in moving]
+        if not saveJTable(table_name, keep):
+            raise OSError(f"Could not save table {table_name}")
+        del manifest['moving']
+        _saveManifest(table_name, manifest)
+        _removeUnlisted(table_name, manifest)
+    return len(data) - len(keep)
+
+def recoverArchives():
+    """
+    Finish the archivings that were interrupted, for every table in my_db_archives.
+
+    :return: The number of records removed from the live tables.
+    """
+    return sum(finishArchiveMove(table_name) for table_name in my_db_archives)
+
+def archiveTable(table_name='appointment_join', older_than_days=None, today=None):
+    """
+    Move the finished records of a table, older than a number of days, to the archive segments of their year.
+    A record is finished when its 'status' is one of the values listed in my_db_archives.
+
+    :param table_name: The name of the table, a key of my_db_archives.
+    :param older_than_days: Archive the records with a date older than this, J_DB_ARCHIVE_AFTER_DAYS when None.
+    :param today: The date the age is counted from (a date), today when None.
+    :return: The number of records archived.
+    """
+    if table_name not in my_db_archives:
+        raise ValueError(f"The table {table_name} is not in my_db_archives")
+    date_key, finished_statuses = my_db_archives[table_name]
+    finished_statuses = {setMember(table_name, 'status', status) for status in finished_statuses} - {None}
+    days = J_DB_ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    cutoff = ((today or datetime.today().date()) - timedelta(days=days)).strftime('%Y-%m-%d')
+    cutoff_int = encodeDate(cutoff)
+
+    with lockTables(table_name):
+        finishArchiveMove(table_name)
+        data = loadJTable(table_name)
+        by_year = {}
+        for record in data:
+            # the values kept by the records are compared: dates as integers YYYYMMDD, 'status' as its IntEnum member
+            record_date, status = rawValue(record, date_key), setMember(table_name, 'status', rawValue(record, 'status'))
+            if status not in finished_statuses or record_date is None:
+                continue
+            if type(record_date) is int and record_date < cutoff_int:
+                by_year.setdefault(f"{record_date // 10000:04d}", []).append(record)
+            elif isinstance(record_date, str) and record_date < cutoff:     # an invalid date kept as a string, they sort like the dates
+                by_year.setdefault(record_date[:4], []).append(record)
+        if not by_year:
+            return 0
+
+        # write the new segments, the old ones are still listed by the manifest
+        manifest = loadArchiveManifest(table_name)
+        manifest['generation'] += 1
+        folder = archiveFolder(table_name)
+        os.makedirs(folder, exist_ok=True)
+        moving = []
+        for year, records in sorted(by_year.items()):
+            segment = manifest['segments'].get(year)
+            if segment is not None:
+                by_id = {record['id']: record for record in _readSegment(table_name, segment['file'])}
+            else:
+                by_id = {}
+            by_id.update((record['id'], record) for record in records)
+            merged = sorted(by_id.values(), key=lambda record: record['id'])
+            file_name = f"{year}.{manifest['generation']}.jsonl.gz"
+            _writeSegment(os.path.join(folder, file_name), merged)
+            dates = [record[date_key] for record in merged]
+            manifest['segments'][year] = {'file': file_name, 'rows': len(merged), 'min_date': min(dates), 'max_date': max(dates)}
+            moving.extend(record['id'] for record in records)
+
+        # the manifest switches to the new segments, then the records leave the live table
+        manifest['max_id'] = maxJRecordId(table_name, data)
+        manifest['moving'] = moving
+        _saveManifest(table_name, manifest)
+        finishArchiveMove(table_name)
+    return len(moving)
+
+def dropArchive(table_name):
+    """
+    Delete every archive segment of a table, e.g. when the table is reset.
+
+    :param table_name: The name of the table.
+    """
+    with lockTables(table_name):
+        shutil.rmtree(archiveFolder(table_name), ignore_errors=True)
+        bumpTableVersion(table_name)    # the reports read the archive too
+
+##################
+# functions to read the archive
+
+def archiveSegments(table_name, start_date=None, end_date=None):
+    """
+    Get the segments that can hold records with a date between start_date and end_date.
+
+    :param table_name: The name of the table.
+    :param start_date: The first date 'YYYY-MM-DD', or None for no limit.
+    :param end_date: The last date 'YYYY-MM-DD', or None for no limit.
+    :return: The list of segments, each a dictionary with 'file', 'rows', 'min_date' and 'max_date', in year order.
+    """
+    if table_name not in my_db_archives:
+        return []
+    manifest = loadArchiveManifest(table_name)
+    if manifest.get('moving'):
+        finishArchiveMove(table_name)   # the live table must not return the records being moved
+        manifest = loadArchiveManifest(table_name)
+    return [segment for year, segment in sorted(manifest['segments'].items())
+            if (start_date is None or segment['max_date'] >= start_date) and (end_date is None or segment['min_date'] <= end_date)]
+
+def iterArchive(table_name, start_date=None, end_date=None):
+    """
+    Stream the archived records of the segments that can hold a date between start_date and end_date.
+    The records of those segments are not filtered by date.
+
+    :param table_name: The name of the table.
+    :param start_date: The first date 'YYYY-MM-DD', or None for no limit.
+    :param end_date: The last date 'YYYY-MM-DD', or None for no limit.
+    :return: A generator of records, in 'id' order within each segment.
+    """
+    for segment in archiveSegments(table_name, start_date, end_date):
+        yield from _readSegment(table_name, segment['file'])
+
+def isArchived(table_name, record_id):
+    """
+    Check if a record was moved to the archive, e.g. to explain why it can't be edited.
+
+    :param table_name: The name of the table.
+    :param record_id: The 'id' of the record.
+    :return: True if the record is in a segment.
+    """
+    return any(record['id'] == record_id for record in iterArchive(table_name))
+
+def archiveStats(table_name):
+    """
+    Get the number of archived records of a table, per year.
+
+    :param table_name: The name of the table.
+    :return: A dictionary {year: number of records}.
+    """
+    return {year: segment['rows'] for year, segment in sorted(loadArchiveManifest(table_name)['segments'].items())}
+
+##################
+# out of sight, not out of mind
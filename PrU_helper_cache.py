@@ -0,0 +1,97 @@
+# PrU_helper_cache.py
+# a bounded cache for report results, invalidated when the tables they read change
+
+# each result is stored under (report name, parameters, version of every table read)
+# the versions come from tableVersion(), bumped by addJRecord(), updateJRecord() and initJTable(overwrite=True)
+# so a result is only reused while none of its tables was written
+
+import functools
+import threading
+from collections import OrderedDict
+from PrU_helper_db import *
+from PrU_helper_json import *
+
+# the results are kept by the current database (see PrU_helper_database.py), as
+# (name, args, kwargs) -> (versions, result), most recently used last
+_report_cache_lock = threading.Lock()
+_report_cache_stats = {'hits': 0, 'misses': 0}
+_report_tables = {}     # report name -> names of the tables it reads
+
+##################
+# functions to manage the cache
+
+def _tableVersions(tables):
+    return tuple(tableVersion(table_name) for table_name in tables)
+
+def getCachedReport(name, tables, function, args=(), kwargs=None):
+    """
+    Get the result of a report from the cache, or run it and keep its result.
+
+    :param name: The name of the report.
+    :param tables: The names of the tables the report reads.
+    :param function: The function that computes the report.
+    :param args: The positional arguments for the function, they must be hashable.
+    :param kwargs: The keyword arguments for the function, their values must be hashable.
+    :return: The result of the function, shared with the cache (don't change it).
+    """
+    kwargs = kwargs or {}
+    tables = tuple(tables)
+    _report_tables.setdefault(name, tables)
+    cache_key = (name, tuple(args), tuple(sorted(kwargs.items())))
+    versions = _tableVersions(tables)
+    report_cache = currentDatabase().cache
+    with _report_cache_lock:
+        cached = report_cache.get(cache_key)
+        if cached is not None and cached[0] == versions:
+            report_cache.move_to_end(cache_key)
+            _report_cache_stats['hits'] += 1
+            return cached[1]
+        _report_cache_stats['misses'] += 1
+
+    result = function(*args, **kwargs)
+
+    with _report_cache_lock:
+        # drop every result that read an older version of one of these tables, it can't be used again
+        current = dict(zip(tables, versions))
+        for other_key, (other_versions, _) in list(report_cache.items()):
+            other_tables = _report_tables.get(other_key[0], ())
+            if any(current.get(table_name, version) != version for table_name, version in zip(other_tables, other_versions)):
+                del report_cache[other_key]
+        report_cache[cache_key] = (versions, result)
+        report_cache.move_to_end(cache_key)
+        while len(report_cache) > J_DB_REPORT_CACHE_SIZE:
+            report_cache.popitem(last=False)   # least recently used
+    return result
+
+def cachedReport(*tables):
+    """
+    Decorator for a function that computes a report from the given tables, its results are cached.
+    The name of the report is the name of the function.
+
+    :param tables: The names of the tables the report reads.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            return getCachedReport(function.__name__, tables, function, args, kwargs)
+        return wrapper
+    return decorator
+
+def clearReportCache():
+    """
+    Discard every cached report result of the current database.
+    """
+    with _report_cache_lock:
+        currentDatabase().cache.clear()
+
+def reportCacheInfo():
+    """
+    Get the statistics of the report cache, the size is the one of the current database.
+
+    :return: A dictionary with 'hits', 'misses', 'size' and 'max_size'.
+    """
+    with _report_cache_lock:
+        return dict(_report_cache_stats, size=len(currentDatabase().cache), max_size=J_DB_REPORT_CACHE_SIZE)
+
+##################
+# cache me if you can
@@ -0,0 +1,226 @@
+# PrU_helper_clinics.py
+# many clinics served by one program: a router from clinic ids to database handles, and reports across every clinic
+
+# the clinics and their folders are listed in my_db_clinics (see PrU_helper_db.py)
+# each clinic is a JDatabase (see PrU_helper_database.py): its own tables, caches, indexes and locks
+# a report across the clinics runs once per clinic, in parallel threads, each one on the database of its clinic,
+# and the results are merged here
+
+import heapq
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PrU_helper_db import *
+from PrU_helper_database import *
+from PrU_helper_json import *
+from PrU_helper_reports import *
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+_router = None
+_router_lock = threading.Lock()
+
+##################
+# the router
+
+class ClinicRouter:
+    """
+    Maps clinic ids to their database handles, one handle per clinic for the whole program.
+    """
+
+    def __init__(self, clinics=None):
+        """
+        :param clinics: A dictionary {clinic_id: folder}, my_db_clinics when None.
+        """
+        self._databases = {}
+        self._lock = threading.Lock()
+        for clinic_id, folder in (my_db_clinics if clinics is None else clinics).items():
+            self.addClinic(clinic_id, folder)
+
+    def addClinic(self, clinic_id, folder):
+        """
+        Add a clinic, its folder is created if it doesn't exist.
+
+        :param clinic_id: The id of the clinic.
+        :param folder: The folder holding its tables.
+        :return: The JDatabase of the clinic.
+        """
+        os.makedirs(folder, exist_ok=True)
+        with self._lock:
+            if clinic_id not in self._databases:
+                self._databases[clinic_id] = JDatabase(clinic_id, folder)
+            return self._databases[clinic_id]
+
+    def clinicIds(self):
+        """
+        Get the ids of the clinics, in the order they were added.
+        """
+        return list(self._databases)
+
+    def route(self, clinic_id):
+        """
+        Get the database of a clinic.
+
+        :param clinic_id: The id of the clinic.
+        :return: The JDatabase.
+        :raises ValueError: If the clinic is unknown.
+        """
+        try:
+            return self._databases[clinic_id]
+        except KeyError:
+            raise ValueError(f"Unknown clinic {clinic_id!r}, add it to my_db_clinics") from None
+
+    def fanOut(self, function, *args, clinic_ids=None, **kwargs):
+        """
+        Run a function once per clinic, in parallel, each call on the database of its clinic.
+        Threads are used, not processes: the handles keep their caches and locks, and most of the work reads mapped files.
+
+        :param function: The function to run, e.g. getRevenueForDateRange.
+        :param args: The positional arguments for the function.
+        :param clinic_ids: The clinics to run it on, every clinic when None.
+        :param kwargs: The keyword arguments for the function.
+        :return: A dictionary {clinic_id: result}, in the order of the clinics.
+        :raises Exception: The first error raised by a call, once every call is finished.
+        """
+        clinic_ids = self.clinicIds() if clinic_ids is None else list(clinic_ids)
+        databases = [self.route(clinic_id) for clinic_id in clinic_ids]
+
+        def runOn(database):
+            with useDatabase(database):
+                return function(*args, **kwargs)
+
+        if len(databases) <= 1:
+            return {clinic_id: runOn(database) for clinic_id, database in zip(clinic_ids, databases)}
+        with ThreadPoolExecutor(max_workers=min(J_DB_CLINIC_WORKERS, len(databases))) as pool:
+            futures = [pool.submit(runOn, database) for database in databases]
+        return {clinic_id: future.result() for clinic_id, future in zip(clinic_ids, futures)}
+
+def clinicRouter():
+    """
+    Get the router of the clinics in my_db_clinics, shared by the whole program.
+    """
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ClinicRouter()
+        return _router
+
+##################
+# the reports across every clinic
+
+def getRevenueForAllClinics(start_date_str, end_date_str):
+    """
+    Get the totals of the report 'Sum of total revenue for a range of dates' for every clinic, see queryRevenueForDateRange().
+
+    Args:
+    - start_date_str (str): The first date in the format 'YYYY-MM-DD', included.
+    - end_date_str (str): The last date in the format 'YYYY-MM-DD', included.
+
+    Returns:
+    - tuple: (dictionary {clinic_id: (number of appointments, total price)}, total price of every clinic)
+    """
+    def clinicRevenue():
+        # only the totals are needed, no row is built or joined
+        query = queryRevenueForDateRange(start_date_str, end_date_str, ordered=False)
+        result = query.aggregate(appointments=('count', None), total=('sum', 'price'))
+        return result['appointments'], result['total'] or 0
+
+    totals = clinicRouter().fanOut(clinicRevenue)
+    return totals, sum(total_price for count, total_price in totals.values())
+
+def getDoctorLeaderboardForAllClinics(start_date_str, end_date_str, top_n=J_DB_LEADERBOARD_SIZE):
+    """
+    Get the rankings of the doctors of every clinic, see getDoctorLeaderboard().
+    The top_n of each clinic are enough: a doctor belongs to one clinic, so the overall top_n is among them.
+
+    Returns:
+    - tuple: (busiest doctors, top earners), as in getDoctorLeaderboard(), each doctor with its 'clinic'.
+    """
+    results = clinicRouter().fanOut(getDoctorLeaderboard, start_date_str, end_date_str, top_n)
+    busiest, earners = [], []
+    for clinic_id, (clinic_busiest, clinic_earners) in results.items():
+        busiest.extend(dict(doctor, clinic=clinic_id) for doctor in clinic_busiest)
+        earners.extend(dict(doctor, clinic=clinic_id) for doctor in clinic_earners)
+    return (heapq.nlargest(top_n, busiest, key=lambda doctor: (doctor['appointments'], doctor['revenue'])),
+            heapq.nlargest(top_n, earners, key=lambda doctor: (doctor['revenue'], doctor['appointments'])))
+
+##################
+# functions to print the reports
+
+def printRevenueForAllClinics():
+    """
+    Prompts the user for two dates and prints the revenue of each clinic between those dates, and the total.
+    """
+    if not my_db_clinics:
+        console.print("Only one clinic is set up, add the clinics to my_db_clinics in PrU_helper_db.py.", style="bold yellow")
+        pause()
+        return
+
+    # Prompt the user to input two dates
+    start_date_str = getUserInput("start_date", ("date", None))
+    end_date_str = getUserInput("end_date", ("date", None))
+
+    if start_date_str is None or end_date_str is None:
+        console.print("Invalid date input. Exiting.", style="bold red")
+        pause()
+        return
+
+    if start_date_str > end_date_str:   # 'YYYY-MM-DD' strings sort like the dates
+        start_date_str, end_date_str = end_date_str, start_date_str  # get them in right order
+
+    totals, total_price = getRevenueForAllClinics(start_date_str, end_date_str)
+
+    table = Table(show_header=True, header_style="bold magenta", title=f"Revenue from {start_date_str} to {end_date_str}", title_style="bold blue")
+    table.add_column("Clinic", style="dim", justify="left")
+    table.add_column("Appointments Done", style="dim", justify="left")
+    table.add_column("Price (EUR)", style="dim", justify="left")
+    for clinic_id, (count, clinic_price) in totals.items():
+        table.add_row(str(clinic_id), str(count), str(clinic_price))
+    table.add_row("Total = ", str(sum(count for count, clinic_price in totals.values())), str(total_price), style="bold green on yellow")
+    console.print(table)
+    pause()
+
+def printDoctorLeaderboardForAllClinics():
+    """
+    Prompts the user for two dates and prints the busiest doctors and the top earners of every clinic between those dates.
+    """
+    if not my_db_clinics:
+        console.print("Only one clinic is set up, add the clinics to my_db_clinics in PrU_helper_db.py.", style="bold yellow")
+        pause()
+        return
+
+    # Prompt the user to input two dates
+    start_date_str = getUserInput("start_date", ("date", None))
+    end_date_str = getUserInput("end_date", ("date", None))
+
+    if start_date_str is None or end_date_str is None:
+        console.print("Invalid date input. Exiting.", style="bold red")
+        pause()
+        return
+
+    if start_date_str > end_date_str:   # 'YYYY-MM-DD' strings sort like the dates
+        start_date_str, end_date_str = end_date_str, start_date_str  # get them in right order
+
+    busiest, earners = getDoctorLeaderboardForAllClinics(start_date_str, end_date_str)
+
+    if not busiest:
+        console.print(f"No appointments found between {start_date_str} and {end_date_str}.", style="bold yellow")
+        pause()
+        return
+
+    for title, doctors in ((f"Busiest doctors of every clinic from {start_date_str} to {end_date_str}", busiest),
+                           (f"Top earners of every clinic from {start_date_str} to {end_date_str}", earners)):
+        table = Table(show_header=True, header_style="bold magenta", title=title, title_style="bold blue")
+        for header in ("Rank", "Clinic", "Doctor Name", "Appointments", "Revenue (EUR)", "Utilization"):
+            table.add_column(header, style="dim", justify="left")
+        for rank, doctor in enumerate(doctors, start=1):
+            utilization = f"{doctor['utilization']:.0%}" if doctor['utilization'] is not None else "-"
+            table.add_row(str(rank), str(doctor['clinic']), doctor['name'] or f"Unknown Doctor {doctor['doctor_id']}",
+                          str(doctor['appointments']), str(doctor['revenue']), utilization)
+        console.print(table)
+    pause()
+
+##################
+# many doors, one front desk
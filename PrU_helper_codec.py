@@ -0,0 +1,124 @@
+# PrU_helper_codec.py
+# conversions between the value types in my_db_schema and compact integers
+
+# this module only imports PrU_helper_db, so every other module can import it
+
+from datetime import datetime
+from PrU_helper_db import *
+
+NULL_INT = -2**63   # stands for None in a packed 'int' column
+NULL_CODE = 0       # stands for None in a packed 'date', 'FK' or 'set' column
+
+_set_codes = {}     # tuple of allowed values -> {lower case value: code}
+
+##################
+# dates are kept as integers in the YYYYMMDD form, so they sort and compare like the strings
+
+def encodeDate(date_str):
+    """
+    Convert a date string to an integer.
+
+    :param date_str: A date in the format 'YYYY-MM-DD', or None.
+    :return: The date as an integer YYYYMMDD, or NULL_CODE for None.
+    :raises ValueError: If date_str is not a valid date in the format 'YYYY-MM-DD'.
+    """
+    if date_str is None:
+        return NULL_CODE
+    parsed_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+    return parsed_date.year * 10000 + parsed_date.month * 100 + parsed_date.day
+
+def decodeDate(date_int):
+    """
+    Convert an integer YYYYMMDD back to a date string.
+
+    :param date_int: The date as an integer YYYYMMDD, or NULL_CODE.
+    :return: The date in the format 'YYYY-MM-DD', or None for NULL_CODE.
+    """
+    if not date_int:
+        return None
+    return f"{date_int // 10000:04d}-{date_int // 100 % 100:02d}-{date_int % 100:02d}"
+
+##################
+# 'set' values are kept as their position in the schema tuple, starting at 1
+
+def encodeSet(value_type, value):
+    """
+    Convert a 'set' value to its code, the comparison ignores upper and lower case.
+
+    :param value_type: The schema tuple, value_type[1] holds the allowed values.
+    :param value: One of the allowed values, its code (e.g. an IntEnum member, see setEnum()), or None.
+    :return: The position of the value in value_type[1] starting at 1, or NULL_CODE for None.
+    :raises ValueError: If the value is not one of the allowed values.
+    """
+    if value is None:
+        return NULL_CODE
+    if isinstance(value, int) and not isinstance(value, bool):
+        if 0 < value <= len(value_type[1]):
+            return int(value)
+    else:
+        codes = _set_codes.get(value_type[1])
+        if codes is None:
+            codes = _set_codes[value_type[1]] = {allowed.lower(): code for code, allowed in enumerate(value_type[1], start=1)}
+        code = codes.get(str(value).lower())
+        if code is not None:
+            return code
+    raise ValueError(f"'{value}' is not one of {value_type[1]}")
+
+def decodeSet(value_type, code):
+    """
+    Convert a 'set' code back to its value.
+
+    :param value_type: The schema tuple, value_type[1] holds the allowed values.
+    :param code: The code returned by encodeSet().
+    :return: The value as written in the schema, or None for NULL_CODE.
+    """
+    if not code:
+        return None
+    return value_type[1][code - 1]
+
+##################
+# one value at a time, following the schema
+
+def encodeValue(value_type, value):
+    """
+    Convert one value to the integer used to store it, following its schema type.
+
+    :param value_type: The schema tuple for the key, e.g. ("date", None).
+    :param value: The value as found in a record.
+    :return: The value as an integer.
+    :raises ValueError: If the value can't be converted.
+    """
+    match value_type[0]:
+        case 'int':
+            return NULL_INT if value is None else int(value)
+        case 'FK':
+            return NULL_CODE if value is None else int(value)
+        case 'date':
+            return encodeDate(value)
+        case 'set':
+            return encodeSet(value_type, value)
+        case _:
+            raise ValueError(f"Unsupported type for encoding: {value_type[0]}")
+
+def decodeValue(value_type, value):
+    """
+    Convert an integer returned by encodeValue() back to the value used in a record.
+
+    :param value_type: The schema tuple for the key, e.g. ("date", None).
+    :param value: The value as an integer.
+    :return: The value as found in a record.
+    """
+    match value_type[0]:
+        case 'int':
+            return None if value == NULL_INT else value
+        case 'FK':
+            return None if value == NULL_CODE else value
+        case 'date':
+            return decodeDate(value)
+        case 'set':
+            return decodeSet(value_type, value)
+        case _:
+            return value
+
+##################
+# nothing to decode here
@@ -0,0 +1,157 @@
+# PrU_helper_database.py
+# database handles: one per clinic, each with its own folder, caches, indexes and locks
+
+# every helper reads and writes the database of the current context, the default one is J_DB_FOLDER
+# a handle is made current for a block with:  with useDatabase(my_database): ...
+# the current database is kept in a context variable, so each thread (and each task) can work on its own clinic
+# this module only imports PrU_helper_db, all the other modules can import it
+
+import contextvars
+import functools
+import inspect
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from PrU_helper_db import *
+
+##################
+# the database handle
+
+class JDatabase:
+    """
+    A database: the folder holding its tables, and the state the helpers keep about them in memory.
+    Nothing is shared between two handles, except the write listeners and the record classes (they follow my_db_schema).
+    """
+
+    def __init__(self, name, folder):
+        """
+        :param name: The name of the database, e.g. the id of the clinic.
+        :param folder: The folder holding its tables, it replaces J_DB_FOLDER.
+        """
+        self.name = name
+        self.folder = folder
+        self.versions = {}              # table_name -> number of writes made to the table by this program
+        self.locks = {}                 # table_name -> [threading.RLock, depth, open lock file or None]
+        self.locks_guard = threading.Lock()
+        self.indexes = {}               # (table_name, key) -> index, see getIndex() in PrU_helper_query.py
+        self.cache = OrderedDict()      # report results, see PrU_helper_cache.py
+        self._state = {}                # name -> state kept by another module, see state()
+        self._state_guard = threading.Lock()
+
+    def __repr__(self):
+        return f"JDatabase({self.name!r}, {self.folder!r})"
+
+    def state(self, name, factory=dict):
+        """
+        Get the state a module keeps for this database, e.g. the latest snapshot versions, creating it on first use.
+
+        :param name: The name of the state, e.g. 'snapshot.latest'.
+        :param factory: The function building the empty state.
+        :return: The state, shared by every thread working on this database.
+        """
+        with self._state_guard:
+            if name not in self._state:
+                self._state[name] = factory()
+            return self._state[name]
+
+    def path(self, *parts):
+        """
+        Get the path of a file inside the folder of the database.
+        """
+        return os.path.join(self.folder, *parts)
+
+_default_database = JDatabase('default', J_DB_FOLDER)
+_current_database = contextvars.ContextVar('current_database', default=_default_database)
+
+##################
+# functions to pick the database
+
+def currentDatabase():
+    """
+    Get the database the helpers work on in this context.
+
+    :return: The JDatabase, the default one (J_DB_FOLDER) unless another one was made current.
+    """
+    return _current_database.get()
+
+def defaultDatabase():
+    """
+    Get the database of J_DB_FOLDER.
+    """
+    return _default_database
+
+def databaseFolder():
+    """
+    Get the folder of the current database, it replaces J_DB_FOLDER in every path.
+    """
+    return _current_database.get().folder
+
+@contextmanager
+def useDatabase(database):
+    """
+    Make a database current for a block, e.g. with useDatabase(router.route('north')): loadJTable('patient').
+
+    :param database: The JDatabase.
+    """
+    token = _current_database.set(database)
+    try:
+        yield database
+    finally:
+        _current_database.reset(token)
+
+def selectDatabase(database):
+    """
+    Make a database current for the rest of this context (e.g. the main thread), until another one is selected.
+
+    :param database: The JDatabase.
+    """
+    _current_database.set(database)
+
+def acceptsDatabase(function):
+    """
+    Decorator: the helper takes an extra keyword argument database=<JDatabase>, and runs on that database instead of the
+    current one, e.g. loadJTable('patient', database=north). Generators get the database for each step they run
+    (each next()), the code iterating them keeps its own current database in between.
+    """
+    if inspect.isgeneratorfunction(function):
+        @functools.wraps(function)
+        def generatorWrapper(*args, database=None, **kwargs):
+            if database is None:
+                yield from function(*args, **kwargs)
+                return
+            generator = function(*args, **kwargs)
+            step, value = generator.send, None
+            try:
+                while True:
+                    token = _current_database.set(database)
+                    try:
+                        item = step(value)
+                    except StopIteration as stop:
+                        return stop.value
+                    finally:
+                        _current_database.reset(token)
+                    try:
+                        step, value = generator.send, (yield item)
+                    except GeneratorExit:
+                        raise
+                    except BaseException as err:     # thrown in by the caller, passed on to the generator
+                        step, value = generator.throw, err
+            finally:
+                token = _current_database.set(database)
+                try:
+                    generator.close()   # its cleanup runs on the database too
+                finally:
+                    _current_database.reset(token)
+        return generatorWrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, database=None, **kwargs):
+        if database is None:
+            return function(*args, **kwargs)
+        with useDatabase(database):
+            return function(*args, **kwargs)
+    return wrapper
+
+##################
+# one folder per clinic
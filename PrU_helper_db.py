@@ -6,6 +6,8 @@
 
 J_DB_FOLDER = "json"   # define a subfolder where to store the json files
 
+J_DB_FIXED_WIDTH = True   # tables with only int, date, FK and set keys are stored in fixed-width .dat files
+
 # list the tables, the data files will share the same name as set here
 
 my_db_tables = [
@@ -41,5 +43,62 @@ my_db_schema = {
     }
 }
 
+# the keys indexed in memory by the query engine (see PrU_helper_query.py)
+# an index is built the first time a query can use it, and rebuilt after the table changes
+
+my_db_indexes = {
+    'patient': ['id'],
+    'doctor': ['id'],
+    'appointment_join': ['id', 'booking_date', 'patient_id', 'doctor_id']
+}
+
+# the clinics served by this program, each with its own folder of tables (see PrU_helper_clinics.py)
+# leave it empty to use only J_DB_FOLDER, e.g. {'north': "json_north", 'south': "json_south"}
+
+my_db_clinics = {}
+
+J_DB_CLINIC_WORKERS = 4   # clinics read at the same time by a report across every clinic
+
+J_DB_EXPORT_FOLDER = "export"   # define a subfolder where to write the CSV and JSONL exports
+
+J_DB_REPORT_CACHE_SIZE = 32   # the most report results kept in memory, the least recently used are dropped first
+
+# the tables whose finished records are moved to compressed, read-only archive segments, one per year (see PrU_helper_archive.py)
+# each table lists the date key that picks the segment, and the values of 'status' of the records that can't change anymore
+
+my_db_archives = {
+    'appointment_join': ('booking_date', ('Canceled', 'Done'))
+}
+
+J_DB_ARCHIVE_FOLDER = "archive"   # define a subfolder of J_DB_FOLDER where to store the archive segments
+
+J_DB_ARCHIVE_AFTER_DAYS = 365   # finished records are archived when their date is older than this number of days
+
+# the tables saved as json files write the records changed by each update to a delta file (<table>.delta.jsonl) instead of
+# rewriting the whole file; the delta is merged into the json file once it grows past this fraction of the json file size
+
+J_DB_DELTA_MAX_RATIO = 0.5
+
+# every write is also recorded in the change feed of its table (<table>.changes.jsonl, see PrU_helper_feed.py),
+# so the other programs using the folder can patch what they keep in memory instead of reloading the table
+
+J_DB_CHANGE_LOG_MAX_BYTES = 4 * 1024 * 1024   # the change feed keeps its newest entries once it's bigger than this
+
+J_DB_CHANGE_POLL_SECONDS = 1.0   # how often a subscriber checks the change feed, see ChangeFeed.subscribe()
+
+J_DB_HISTORY_PAGE_SIZE = 20   # appointments shown per page in the appointment history of a patient
+
+J_DB_LEADERBOARD_SIZE = 10   # doctors shown in each ranking of the doctor leaderboard
+
+J_DB_DOCTOR_DAILY_SLOTS = 16   # appointments an 'Available' doctor can take in a day, the capacity behind the utilization in the leaderboard
+
+J_DB_RECURRENCE_MAX_OCCURRENCES = 366   # the most appointments a recurring booking can create at once, see PrU_helper_recurrence.py
+
+J_DB_VALIDATE_ON_START = False   # check every table against the schema when the program starts (python PrU_main.py --validate does it on demand)
+
+J_DB_WARMUP_ON_START = True   # load the tables and build their indexes in the background when the program starts (see PrU_helper_warmup.py)
+
+J_DB_WARMUP_WORKERS = 4   # tables warmed up at the same time
+
 ##################
 # this.is(the_end)
\ No newline at end of file
@@ -0,0 +1,146 @@
+# PrU_helper_export.py
+# streaming export of tables and reports to CSV or JSONL files, optionally compressed with gzip
+
+# rows go straight from the query engine (and its FK joins) to the file, a chunk at a time,
+# so neither the full list of rows nor a rich Table is ever built
+
+import csv
+import gzip
+import io
+import json
+import os
+from itertools import chain
+from PrU_helper_db import *
+from PrU_helper_json import *
+from PrU_helper_query import *
+from PrU_helper_reports import *
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_CHUNK_SIZE = 5000    # rows formatted in memory before each write to the file
+
+# report name -> (function building its query, names of its parameters)
+# the queries are built with ordered=False, the rows are streamed in file order ('id' order)
+EXPORT_REPORTS = {
+    'appointments_for_date': (queryAppointmentsForDate, ('date_str',)),
+    'appointments_for_patient': (queryAppointmentsForPatient, ('patient_id',)),
+    'revenue_for_date_range': (queryRevenueForDateRange, ('start_date_str', 'end_date_str'))
+}
+
+##################
+# functions to write the files
+
+def openExportFile(file_path, compress=False):
+    """
+    Open a file for writing text, creating its folder if needed.
+
+    :param file_path: The path of the file.
+    :param compress: Compress the file with gzip.
+    :return: The open file.
+    """
+    folder = os.path.dirname(file_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    if compress:
+        return gzip.open(file_path, 'wt', encoding='utf-8', newline='')
+    return open(file_path, 'w', encoding='utf-8', newline='')
+
+def writeRows(rows, file_path, file_format='csv', compress=False, columns=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Write rows to a CSV or JSONL file, formatting chunk_size rows in memory before each write.
+
+    :param rows: An iterable of dictionaries (or records), consumed once.
+    :param file_path: The path of the file.
+    :param file_format: 'csv' or 'jsonl'.
+    :param compress: Compress the file with gzip.
+    :param columns: The keys to write, in order. The keys of the first row when None.
+    :param chunk_size: The number of rows formatted before each write.
+    :return: The number of rows written.
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {file_format}, use one of {EXPORT_FORMATS}")
+
+    rows = iter(rows)
+    first_row = next(rows, None)
+    if columns is None:
+        columns = list(first_row) if first_row is not None else []
+
+    count = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n') if file_format == 'csv' else None
+    with openExportFile(file_path, compress) as f:
+        if writer is not None:
+            writer.writerow(columns)
+        if first_row is None:
+            f.write(buffer.getvalue())
+            return 0
+
+        for row in chain([first_row], rows):
+            values = [row.get(key) for key in columns]
+            if writer is not None:
+                writer.writerow(['' if value is None else value for value in values])
+            else:
+                buffer.write(json.dumps(dict(zip(columns, values)), ensure_ascii=False))
+                buffer.write('\n')
+            count += 1
+            if count % chunk_size == 0:
+                f.write(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate(0)
+        f.write(buffer.getvalue())
+    return count
+
+##################
+# functions to export tables and reports
+
+def exportTable(table_name, file_path, file_format='csv', compress=False, resolve_fks=True):
+    """
+    Export every record of a table, streaming it from its file.
+
+    :param table_name: The name of the table.
+    :param file_path: The path of the file to write.
+    :param file_format: 'csv' or 'jsonl'.
+    :param compress: Compress the file with gzip.
+    :param resolve_fks: Add the display key of each FK key, e.g. 'patient_name' for 'patient_id'.
+    :return: The number of rows written.
+    """
+    query = Query(table_name)
+    columns = list(my_db_schema[table_name])
+    if resolve_fks:
+        for fk_key, (target_table, display_key) in foreignKeys(table_name).items():
+            query.join(fk_key)
+            columns.append(joinedKey(fk_key, display_key))
+    return writeRows(query, file_path, file_format, compress, columns)
+
+def exportReport(report_name, file_path, file_format='csv', compress=False, **params):
+    """
+    Export the rows of a report, see EXPORT_REPORTS.
+
+    :param report_name: The name of the report, a key of EXPORT_REPORTS.
+    :param file_path: The path of the file to write.
+    :param file_format: 'csv' or 'jsonl'.
+    :param compress: Compress the file with gzip.
+    :param params: The parameters of the report, e.g. date_str='2024-05-01'.
+    :return: The number of rows written.
+    """
+    if report_name not in EXPORT_REPORTS:
+        raise ValueError(f"Unknown report: {report_name}, use one of {tuple(EXPORT_REPORTS)}")
+    build_query, param_names = EXPORT_REPORTS[report_name]
+    query = build_query(*(params[name] for name in param_names), ordered=False)
+    columns = list(my_db_schema[query.table_name])
+    for fk_key, (target_table, display_key) in foreignKeys(query.table_name).items():
+        columns.append(joinedKey(fk_key, display_key))
+    return writeRows(query, file_path, file_format, compress, columns)
+
+def exportFileName(name, file_format='csv', compress=False):
+    """
+    Get the default path for an export, inside J_DB_EXPORT_FOLDER.
+
+    :param name: The name of the table or report.
+    :param file_format: 'csv' or 'jsonl'.
+    :param compress: Add the '.gz' extension.
+    :return: The file path.
+    """
+    return os.path.join(J_DB_EXPORT_FOLDER, f"{name}.{file_format}" + (".gz" if compress else ""))
+
+##################
+# exported, end of file
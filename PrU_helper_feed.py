@@ -0,0 +1,218 @@
+# PrU_helper_feed.py
+# the change feed of the tables: read the writes made by other programs, instead of reloading the whole table
+
+# every write appends one entry to <table>.changes.jsonl in the folder of the database (see appendChange() in PrU_helper_json.py):
+#   {"seq": 12, "writer": "4242.1403", "stamp": [...], "changes": [[old record, new record], ...]}
+# the sequence numbers of a table go up by one with each write; "changes" is null when the whole table may have changed (a reset)
+# a reader keeps a position in the feed (inode, offset, last seq) and reads only the lines added after it
+# when the feed was trimmed past the position, or a write is missing, the reader is told to reload the table
+
+import json
+import os
+import threading
+from bisect import bisect_left, insort
+from PrU_helper_db import *
+from PrU_helper_database import *
+from PrU_helper_json import *
+
+##################
+# functions to read the feed
+
+def feedPosition(table_name):
+    """
+    Get the position of the end of the change feed of a table, to read the writes made after now with readChanges().
+    Take it before loading the table: the writes in between are read again later, so the patches must not mind that.
+
+    :param table_name: The name of the table.
+    :return: A tuple (inode of the feed, offset, last sequence number).
+    """
+    try:
+        with open(changeLogPath(table_name), 'rb') as f:
+            last, offset = lastChange(f)
+            return (os.fstat(f.fileno()).st_ino, offset, last['seq'] if last else 0)
+    except FileNotFoundError:
+        return (None, 0, 0)
+
+def readChanges(table_name, position):
+    """
+    Read the entries of the change feed of a table written after a position.
+
+    :param table_name: The name of the table.
+    :param position: The position returned by feedPosition() or by the last call.
+    :return: A tuple (list of entries, new position, True if no entry is missing between the position and the new one).
+    """
+    inode, offset, seq = position
+    try:
+        with open(changeLogPath(table_name), 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != inode or stat.st_size < offset:
+                offset = 0     # the feed was trimmed (a new file), read it again from the start
+            f.seek(offset)
+            data = f.read(stat.st_size - offset)
+    except FileNotFoundError:
+        return [], (None, 0, 0), seq == 0
+
+    end = data.rfind(b'\n') + 1     # a line being appended is read next time
+    entries, complete = [], True
+    for line in data[:end].split(b'\n'):
+        try:
+            entry = json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            continue    # an empty line, or one cut by an interrupted append
+        if entry['seq'] <= seq:
+            continue    # already read before the feed was trimmed
+        if entry['seq'] != seq + 1:
+            complete = False
+        entries.append(entry)
+        seq = entry['seq']
+    return entries, (stat.st_ino, offset + end, seq), complete
+
+def patchChanges(table_name, position, old_stamp, stamp):
+    """
+    Get the changes that bring what was read at a stamp up to another one, if the change feed holds all of them.
+    Read the new stamp with tableVersion() before calling it.
+
+    :param table_name: The name of the table.
+    :param position: The position in the feed of what was read, see feedPosition().
+    :param old_stamp: The tableVersion() of what was read.
+    :param stamp: The tableVersion() to bring it up to.
+    :return: A tuple (list of entries, new position), or None if the table must be loaded again:
+             an entry is missing, the whole table changed, or a write isn't in the feed yet.
+    """
+    entries, position, complete = readChanges(table_name, position)
+    if not complete or any(entry['changes'] is None for entry in entries):
+        return None
+    feed_stamp = stamp[2]
+    if feed_stamp is None or (feed_stamp[0], feed_stamp[2]) != (position[0], position[1]):
+        return None     # the feed grew after the stamp was read, the entries may not match it
+    if entries:
+        if entries[-1]['stamp'] != json.loads(json.dumps(stamp[1])):
+            return None     # the files were written after the last entry, by a write still in progress or one outside the feed
+    elif old_stamp[1] != stamp[1]:
+        return None
+    return entries, position
+
+def patchIndex(index, moves):
+    """
+    Apply changed rows to an index, see createIndex() in PrU_helper_query.py.
+    The index passed is left as-is (other threads may be reading it), the lists changed are copied.
+    A move that is already in the index changes nothing, so the changes read twice (see feedPosition()) are harmless.
+
+    :param index: A tuple ({value: [positions]}, sorted list of values or None).
+    :param moves: A list of (position, old values, new value), one per changed row; the old values are [] for a new row.
+    :return: The new index, as a tuple.
+    """
+    positions, values = index
+    positions = dict(positions)
+    values = None if values is None else list(values)
+    copied = set()
+
+    def bucket(value):
+        if value not in copied:
+            positions[value] = list(positions.get(value, ()))
+            copied.add(value)
+        return positions[value]
+
+    for position, old_values, new_value in moves:
+        for old_value in old_values:
+            if old_value == new_value or old_value not in positions:
+                continue
+            slots = bucket(old_value)
+            i = bisect_left(slots, position)
+            if i < len(slots) and slots[i] == position:
+                del slots[i]
+                if not slots:
+                    del positions[old_value]
+                    copied.discard(old_value)
+                    if values is not None and type(old_value) is int:
+                        del values[bisect_left(values, old_value)]
+        slots = bucket(new_value)
+        i = bisect_left(slots, position)
+        if i == len(slots) or slots[i] != position:
+            slots.insert(i, position)
+            if len(slots) == 1 and values is not None and type(new_value) is int:
+                insort(values, new_value)
+    return positions, values
+
+##################
+# the feed, for the clients that keep tables in memory
+
+class ChangeFeed:
+    """
+    Follows the change feeds of some tables of a database, e.g. to invalidate the records kept by a screen.
+    poll() only reads the lines added since the last call; subscribe() calls a function for them from a thread.
+    """
+
+    def __init__(self, tables=None, database=None, include_own=False):
+        """
+        :param tables: The names of the tables, every table in my_db_tables when None.
+        :param database: The JDatabase, the current one when None.
+        :param include_own: Also get the writes made through this database handle, they're skipped otherwise.
+        """
+        self.database = database or currentDatabase()
+        self.tables = tuple(tables or my_db_tables)
+        self.include_own = include_own
+        with useDatabase(self.database):
+            self._positions = {table_name: feedPosition(table_name) for table_name in self.tables}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def poll(self):
+        """
+        Get the entries written since the last call (or since the feed was created).
+        A table with missing entries gets one entry with "changes" None: reload it.
+
+        :return: A dictionary {table_name: list of entries}, only the tables with new entries.
+        """
+        own = writerKey(self.database)
+        result = {}
+        with useDatabase(self.database):
+            for table_name in self.tables:
+                inode, offset, seq = self._positions[table_name]
+                try:
+                    stat = os.stat(changeLogPath(table_name))
+                    if (stat.st_ino, stat.st_size) == (inode, offset):
+                        continue    # nothing new, only a stat was needed
+                except FileNotFoundError:
+                    if inode is None:
+                        continue
+                entries, self._positions[table_name], complete = readChanges(table_name, self._positions[table_name])
+                if not complete:
+                    entries = [{'seq': self._positions[table_name][2], 'writer': None, 'stamp': None, 'changes': None}]
+                elif not self.include_own:
+                    entries = [entry for entry in entries if entry['writer'] != own]
+                if entries:
+                    result[table_name] = entries
+        return result
+
+    def subscribe(self, callback, interval=J_DB_CHANGE_POLL_SECONDS):
+        """
+        Call a function from a thread each time the feed has new entries, until stop() is called.
+
+        :param callback: The function, called with the result of poll().
+        :param interval: The seconds between two polls.
+        """
+        if self._thread is not None:
+            raise RuntimeError("This change feed already has a subscriber")
+        self._stop.clear()
+
+        def follow():
+            while not self._stop.wait(interval):
+                changes = self.poll()
+                if changes:
+                    callback(changes)
+
+        self._thread = threading.Thread(target=follow, name="change-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the subscriber thread, if there's one.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+##################
+# what did I miss?
@@ -1,17 +1,31 @@
 # PrU_helper_json.py
 # helper functions for json file handling
 
+import hashlib
 import json
 import os
+import threading
 import beaupy
+from contextlib import contextmanager
 from datetime import datetime, date
 from PrU_helper_db import *
+from PrU_helper_database import *
+from PrU_helper_mmap import *
+from PrU_helper_records import *
 from rich.console import Console
 from rich.table import Table
 
 # initialize the console from the rich library
 console = Console()
 
+# the write counters and the locks of the tables belong to the current database, see PrU_helper_database.py
+_write_listeners = {}   # table_name -> functions called after each write, see addWriteListener()
+
+try:
+    import fcntl    # file locks between programs, not available on Windows
+except ImportError:
+    fcntl = None
+
 ##################
 # helper functions
 
@@ -64,28 +78,395 @@ def daysFromToday(date_str):
 def isListOfDicts(data):
     """
     Check if the provided data is a list of dictionaries.
+    The records built by recordClass() count as dictionaries.
 
     :param data: The data to check.
     :return: True if the data is a list of dictionaries, False otherwise.
     """
-    if isinstance(data, list) and all(isinstance(item, dict) for item in data):
+    if isinstance(data, list) and all(isinstance(item, (dict, JRecord)) for item in data):
         return True
     return False
 
 ##################
 # functions to manage files
 
+@acceptsDatabase
+def tableFilePath(table_name):
+    """
+    Get the path of the file that stores a table.
+    
+    :param table_name: The name of the table.
+    :return: The path of the fixed-width .dat file for tables with only fixed-size keys, or of the .json file otherwise.
+    """
+    if isFixedWidthTable(table_name):
+        return fixedTablePath(table_name)
+    return os.path.join(databaseFolder(), table_name) + ".json"
+
+@acceptsDatabase
+def deltaFilePath(table_name):
+    """
+    Get the path of the delta file of a table stored in a json file.
+    It holds the records written since the json file was last saved in full, one JSON line each, after a header line.
+    
+    :param table_name: The name of the table.
+    :return: The path of the .delta.jsonl file.
+    """
+    return os.path.join(databaseFolder(), table_name) + ".delta.jsonl"
+
+def _fileStamp(file_path):
+    """
+    Get (inode, mtime, size) of a file, they change every time it's written or replaced, or None if it doesn't exist.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+@acceptsDatabase
+def tableVersion(table_name):
+    """
+    Get a version stamp for a table, it changes every time the table is written.
+    
+    :param table_name: The name of the table.
+    :return: A tuple with the number of writes made by this program, the (inode, mtime, size) of the file, for writes made
+             by other programs, and the one of the change feed, which grows with every write even when the mtime doesn't move.
+    """
+    file_stamp = _fileStamp(tableFilePath(table_name))
+    if not isFixedWidthTable(table_name):
+        file_stamp = (file_stamp, _fileStamp(deltaFilePath(table_name)))    # an update only appends to the delta file
+    return (currentDatabase().versions.get(table_name, 0), file_stamp, _fileStamp(changeLogPath(table_name)))
+
+@acceptsDatabase
+def bumpTableVersion(table_name, changes=None):
+    """
+    Record that a table was written, so the cached data built from it is discarded,
+    add the changes to the change feed of the table (see appendChange()) for the other programs,
+    and tell the write listeners of the table (see addWriteListener()).
+    Call it with the write lock of the table held, so the change feed follows the order of the writes.
+    
+    :param table_name: The name of the table.
+    :param changes: The records written, as a list of (old record, new record) with None for the old record of an insert,
+                    or None if the whole table may have changed.
+    """
+    versions = currentDatabase().versions
+    versions[table_name] = versions.get(table_name, 0) + 1
+    try:
+        appendChange(table_name, changes)
+    except Exception as err:    # the readers reload a table whose last change is missing from the feed
+        console.print(f"Error writing the change feed of table {table_name}: {err}", style="bold red")
+    for listener in _write_listeners.get(table_name, []):
+        try:
+            listener(table_name, changes)
+        except Exception as err:    # a listener must never fail the write
+            console.print(f"Error in a write listener of table {table_name}: {err}", style="bold red")
+
+def changeLogPath(table_name):
+    """
+    Get the path of the change feed of a table: one JSON line per write, see appendChange().
+    
+    :param table_name: The name of the table.
+    :return: The path of the .changes.jsonl file, inside the folder of the current database.
+    """
+    return os.path.join(databaseFolder(), table_name) + ".changes.jsonl"
+
+def fileStampKey(table_name):
+    """
+    Get the stamp of the files of a table (see tableVersion()) as it's written in the change feed, lists instead of tuples.
+    """
+    return json.loads(json.dumps(tableVersion(table_name)[1]))
+
+def writerKey(database=None):
+    """
+    Get the key written in the change feed entries of this program and database handle, see appendChange().
+    """
+    return f"{os.getpid()}.{id(database or currentDatabase())}"
+
+def lastChange(f):
+    """
+    Read the last complete entry of a change feed, reading the open file (binary) backwards from its end.
+    
+    :param f: The change feed, open in binary mode.
+    :return: A tuple (the entry as a dictionary or None if the file holds none, the offset of the end of its line).
+    """
+    end = f.seek(0, os.SEEK_END)
+    position, step, tail = end, 2048, b''
+    while position > 0:
+        step = min(step * 2, position)
+        position -= step
+        f.seek(position)
+        tail = f.read(step) + tail
+        lines = tail.split(b'\n')
+        line_end = position + len(tail)
+        for number in range(len(lines) - 1, 0 if position > 0 else -1, -1):    # the first line may be cut, unless it's the start of the file
+            try:
+                return json.loads(lines[number]), min(end, line_end + 1)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                line_end -= len(lines[number]) + 1     # an empty line, or one cut by an interrupted append
+        tail = lines[0] if position > 0 else b''
+    return None, 0
+
+def appendChange(table_name, changes):
+    """
+    Add one entry to the change feed of a table, with the next sequence number of the table.
+    The entry holds the sequence ('seq'), the program and handle that wrote it ('writer', see writerKey()), the stamp of the files after the write ('stamp')
+    and the changes as [old record, new record] pairs of dictionaries ('changes'), None if the whole table may have changed.
+    The feed keeps its newest entries once it's bigger than J_DB_CHANGE_LOG_MAX_BYTES.
+    
+    :param table_name: The name of the table.
+    :param changes: The changes passed to bumpTableVersion().
+    :return: The sequence number of the entry.
+    """
+    log_path = changeLogPath(table_name)
+    with lockTables(table_name):    # already held by the writers, it keeps the sequence numbers in order
+        with open(log_path, 'a+b') as f:
+            last, last_end = lastChange(f)
+            entry = {
+                'seq': (last['seq'] if last else 0) + 1,
+                'writer': writerKey(),
+                'stamp': fileStampKey(table_name),
+                'changes': None if changes is None else [[None if old_record is None else dict(old_record),
+                                                          None if new_record is None else dict(new_record)]
+                                                         for old_record, new_record in changes]
+            }
+            line = json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n'
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    line = b'\n' + line    # end the line cut by an interrupted append
+            f.write(line)
+            size = f.tell()
+        if size > J_DB_CHANGE_LOG_MAX_BYTES:
+            _trimChangeLog(log_path)
+    return entry['seq']
+
+def _trimChangeLog(log_path):
+    """
+    Keep the newest entries of a change feed, about half of J_DB_CHANGE_LOG_MAX_BYTES.
+    The readers that were behind the entries dropped see a gap in the sequence numbers and reload the table.
+    """
+    with open(log_path, 'rb') as f:
+        f.seek(max(0, os.fstat(f.fileno()).st_size - J_DB_CHANGE_LOG_MAX_BYTES // 2))
+        kept = f.read()
+    kept = kept[kept.find(b'\n') + 1:]     # from the first complete line
+    writeFileAtomic(log_path, lambda f: f.write(kept), binary=True)
+
+def addWriteListener(table_name, listener):
+    """
+    Call a function after every write to a table made by this program, e.g. to keep aggregates up to date.
+    The function gets (table_name, changes), see bumpTableVersion(); with changes None it must rebuild what it keeps.
+    It's called for the writes to every database, with the written one current (see currentDatabase()).
+    
+    :param table_name: The name of the table.
+    :param listener: The function to call.
+    """
+    _write_listeners.setdefault(table_name, []).append(listener)
+
+def writeFileAtomic(file_path, write, binary=False):
+    """
+    Write a file through a temporary file that replaces it once it's on disk,
+    so readers and a crash only ever see the old file or the new one.
+    
+    :param file_path: The path of the file.
+    :param write: A function that writes the content to the open file it receives.
+    :param binary: Open the file in binary mode, text (utf-8) otherwise.
+    """
+    temp_path = file_path + ".tmp"
+    with open(temp_path, 'wb' if binary else 'w', **({} if binary else {'encoding': 'utf-8'})) as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, file_path)
+
+@contextmanager
+@acceptsDatabase
+def lockTables(*table_names):
+    """
+    Hold the write lock of one or more tables, e.g. with lockTables('patient', 'appointment_join'): ...
+    The locks are taken in name order, so two writers never wait on each other.
+    They are shared by the threads of this program, and by other programs through a .lock file in the folder of the database (where fcntl exists).
+    Each database has its own locks, see PrU_helper_database.py.
+    A thread can take the same lock again, e.g. saveJTable() inside addJRecord().
+    
+    :param table_names: The names of the tables.
+    """
+    database = currentDatabase()
+    held = []
+    try:
+        for table_name in sorted(set(table_names)):
+            with database.locks_guard:
+                lock = database.locks.setdefault(table_name, [threading.RLock(), 0, None])
+            lock[0].acquire()
+            held.append(lock)
+            if lock[1] == 0 and fcntl is not None:
+                try:
+                    lock[2] = open(database.path(f".{table_name}.lock"), 'a')
+                    fcntl.flock(lock[2].fileno(), fcntl.LOCK_EX)
+                except OSError:     # e.g. the folder doesn't exist yet, only this program can write it then
+                    if lock[2] is not None:
+                        lock[2].close()
+                    lock[2] = None
+            lock[1] += 1
+        yield
+    finally:
+        for lock in reversed(held):
+            lock[1] -= 1
+            if lock[1] == 0 and lock[2] is not None:
+                lock[2].close()     # also releases the file lock
+                lock[2] = None
+            lock[0].release()
+
+@acceptsDatabase
+def archiveFolder(table_name):
+    """
+    Get the folder holding the archive segments of a table, see PrU_helper_archive.py.
+    """
+    return os.path.join(databaseFolder(), J_DB_ARCHIVE_FOLDER, table_name)
+
+@acceptsDatabase
+def loadArchiveManifest(table_name):
+    """
+    Load the manifest of the archive of a table, it lists the segments and the highest 'id' archived.
+    
+    :param table_name: The name of the table.
+    :return: A dictionary with 'max_id', 'generation' and 'segments' ({year: {'file', 'rows', 'min_date', 'max_date'}}),
+             and 'moving' (the ids being moved) while an archiving is not finished.
+    """
+    try:
+        with open(os.path.join(archiveFolder(table_name), "manifest.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'max_id': 0, 'generation': 0, 'segments': {}}
+
+@acceptsDatabase
+def loadDelta(table_name):
+    """
+    Load the records written to the delta file of a json table, oldest first.
+    A delta file left from an older version of the json file (the program stopped while the table was saved in full) is ignored.
+    
+    :param table_name: The name of the table.
+    :return: The list of dictionaries, empty if there's no delta file.
+    """
+    try:
+        with open(deltaFilePath(table_name), 'r', encoding='utf-8') as f:
+            try:
+                header = json.loads(f.readline())
+            except json.JSONDecodeError:
+                return []
+            if not _deltaMatches(table_name, header):
+                return []
+            records = []
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue    # a line cut by an interrupted append
+            return records
+    except FileNotFoundError:
+        return []
+
+def _jsonDigest(file_path):
+    """
+    Get the sha1 of the content of a json file, or None if it doesn't exist.
+    It's kept until the (inode, mtime, size) of the file change, so checking a delta file doesn't read the whole json file each time.
+    """
+    digests = currentDatabase().state('json.digests')    # file_path -> ((inode, mtime, size), sha1)
+    try:
+        with open(file_path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            known = digests.get(file_path)
+            if known is not None and known[0] == stamp:
+                return known[1]
+            digest = hashlib.sha1(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+    digests[file_path] = (stamp, digest)
+    return digest
+
+def _deltaHeader(table_name):
+    """
+    Read the header line of the delta file of a json table, see _appendDelta().
+
+    :return: The header as a dictionary, or None if there's no delta file or its header is cut.
+    """
+    try:
+        with open(deltaFilePath(table_name), 'rb') as f:
+            header = json.loads(f.readline())
+    except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    return header if isinstance(header, dict) else None
+
+def _deltaMatches(table_name, header):
+    """
+    Check if the header of a delta file was written for the content of the current json file (see _jsonDigest()):
+    the delta file still counts once the folder is copied or restored, not once the json file is saved in full.
+    """
+    return isinstance(header, dict) and header.get('sha1') == _jsonDigest(tableFilePath(table_name))
+
+def _appendDelta(table_name, records):
+    """
+    Append records to the delta file of a json table, the json file is not touched.
+    """
+    with open(deltaFilePath(table_name), 'a+b') as f:
+        if f.tell() == 0:   # a new delta file, it belongs to the current content of the json file only
+            f.write(json.dumps({'sha1': _jsonDigest(tableFilePath(table_name))}).encode() + b'\n')
+        else:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')     # end the line cut by an interrupted append
+        f.write(b''.join(json.dumps(dict(record), ensure_ascii=False).encode('utf-8') + b'\n' for record in records))
+        f.flush()
+        os.fsync(f.fileno())
+
+def _removeDelta(table_name):
+    """
+    Remove the delta file of a json table, if there's one.
+    """
+    try:
+        os.remove(deltaFilePath(table_name))
+    except FileNotFoundError:
+        pass
+
+def _deltaFits(table_name, changes):
+    """
+    Check if the changes of a save can go to the delta file: they're all inserts or updates (no deletes),
+    the json file exists, and the delta file belongs to it (see loadDelta()) and is still small next to it, see J_DB_DELTA_MAX_RATIO.
+    """
+    if not changes or any(new_record is None or new_record.get('id') is None for old_record, new_record in changes):
+        return False
+    base_stamp = _fileStamp(tableFilePath(table_name))
+    delta_stamp = _fileStamp(deltaFilePath(table_name))
+    if base_stamp is None:
+        return False
+    if delta_stamp is not None and not _deltaMatches(table_name, _deltaHeader(table_name)):
+        return False    # an old delta file, ignored by loadJTable(): the records appended to it would be lost, the full save replaces it
+    return (delta_stamp[2] if delta_stamp else 0) <= base_stamp[2] * J_DB_DELTA_MAX_RATIO
+
+@acceptsDatabase
 def loadJTable(table_name):
     """
     Load a JSON file and return the data.
+    Tables in my_db_schema are returned as records, see recordClass(), which read like dictionaries.
     
     :param table_name: The name of the table (file) to load.
     :return: The data in the file as a list of dictionaries, or an empty list if the file is not found or invalid.
     """
-    file_path = os.path.join(J_DB_FOLDER, table_name) + ".json"
+    if isFixedWidthTable(table_name):
+        try:
+            return readFixedTable(table_name)
+        except FileNotFoundError:
+            return []
+        except Exception as err:
+            console.print(f"Error loading table {table_name}: {err}", style="bold red")
+            return []
+
+    file_path = tableFilePath(table_name)
+    my_record_class = recordClass(table_name)
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+            # each record is converted as soon as it's parsed, so the full list of dicts is never built
+            data = json.load(f, object_hook=my_record_class.fromDict if my_record_class else None)
     except FileNotFoundError:
         return []
     except json.JSONDecodeError:
@@ -95,31 +476,111 @@ def loadJTable(table_name):
         console.print(f"Error loading table {table_name}: {err}", style="bold red")
         return []
     else:
-        if isListOfDicts(data):
-            return data
-        else:
+        if not isListOfDicts(data):
             return []
+        delta = loadDelta(table_name)
+        if delta:
+            # the latest version of each record in the delta replaces the one in the json file
+            positions = {record.get('id'): position for position, record in enumerate(data)}
+            for item in delta:
+                record = my_record_class.fromDict(item) if my_record_class else item
+                position = positions.get(record.get('id'))
+                if position is None:
+                    positions[record.get('id')] = len(data)
+                    data.append(record)
+                else:
+                    data[position] = record
+        return data
 
-def saveJTable(table_name, my_table):
+@acceptsDatabase
+def saveJTable(table_name, my_table, changes=None):
     """
     Save a list to a JSON file.
+    When the records changed since the table was loaded are known, only they are appended to the delta file (see loadDelta()),
+    until it's time to merge it; fixed-width tables are always written in full.
     
     :param table_name: The name of the table (file) to save.
     :param my_table: The list of dictionaries to save.
+    :param changes: The records changed since the table was loaded, as (old record, new record), for the write listeners
+                    and the delta file. None when unknown, the table is written in full and the listeners rebuild what they keep.
     :return: 1 on success, or 0 on failure.
     """
     if isListOfDicts(my_table):
-        file_path = os.path.join(J_DB_FOLDER, table_name) + ".json"
-        try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(my_table, f, indent=4)
+        file_path = tableFilePath(table_name)
+        with lockTables(table_name):
+            try:
+                if isFixedWidthTable(table_name):
+                    writeFixedTable(table_name, my_table)
+                elif _deltaFits(table_name, changes):
+                    _appendDelta(table_name, [new_record for old_record, new_record in changes])
+                else:
+                    # the old file is replaced only once the new one is complete, the records of the delta file are in it
+                    data = json.dumps([dict(record) for record in my_table], indent=4).encode('utf-8')
+                    digest = hashlib.sha1(data).hexdigest()
+                    if (_deltaHeader(table_name) or {}).get('sha1') == digest:
+                        _removeDelta(table_name)    # it would match the new file too; the old file holds the same records until it's replaced
+                    writeFileAtomic(file_path, lambda f: f.write(data), binary=True)
+                    currentDatabase().state('json.digests')[file_path] = (_fileStamp(file_path), digest)
+                    _removeDelta(table_name)   # left behind, it would be ignored (see loadDelta())
                 return 1
-        except Exception as e:
-            console.print(f"Error saving table {table_name}: {e}", style="bold red")
-            return 0
+            except Exception as e:
+                console.print(f"Error saving table {table_name}: {e}", style="bold red")
+                changes = None
+                return 0
+            finally:
+                bumpTableVersion(table_name, changes)    # even a failed write may have changed the file
     else:
         return 0
 
+def _migratedRecords(table_name, json_path):
+    """
+    Read the records of the old json file of a table now stored in a fixed-width file, see initJTable().
+    The existing data never stops the program: a value that can't be stored in its column (e.g. a status removed
+    from the schema) is reported and kept as None, a key that's not in the schema is reported and dropped,
+    and an unreadable file is reported and gives no record. python PrU_main.py --validate checks the result.
+    
+    :param table_name: The name of the table.
+    :param json_path: The path of the old json file.
+    :return: The list of dictionaries, with the keys of the schema only.
+    """
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as err:
+        console.print(f"--- Can't read {json_path}, the {table_name} table starts empty (the file is kept): {err}", style="bold red")
+        return []
+    if not isinstance(data, list):
+        console.print(f"--- {json_path} doesn't hold a list of records, the {table_name} table starts empty (the file is kept)", style="bold red")
+        return []
+
+    schema = my_db_schema[table_name]
+    records, skipped, bad_values, dropped_keys = [], 0, {}, {}
+    for item in data:
+        if not isinstance(item, dict):
+            skipped += 1
+            continue
+        record = {}
+        for key, value_type in schema.items():
+            try:
+                checkFixedValue(value_type, item.get(key))
+                record[key] = item.get(key)
+            except ValueError:
+                record[key] = None
+                bad_values.setdefault(key, []).append(item.get(key))
+        for key in item.keys() - schema.keys():
+            dropped_keys[key] = dropped_keys.get(key, 0) + 1
+        records.append(record)
+
+    if skipped:
+        console.print(f"--- {table_name}: {skipped} item(s) of {json_path} are not records, skipped", style="bold yellow")
+    for key, values in bad_values.items():
+        examples = ", ".join(sorted({repr(value) for value in values})[:5])
+        console.print(f"--- {table_name}: {len(values)} '{key}' value(s) don't match the schema ({examples}), stored as empty", style="bold yellow")
+    for key, count in dropped_keys.items():
+        console.print(f"--- {table_name}: the key '{key}' is not in the schema, dropped from {count} record(s)", style="bold yellow")
+    return records
+
+@acceptsDatabase
 def initJTable(table_name, overwrite=False):
     """
     Initialize a JSON table file with an empty list.
@@ -128,11 +589,17 @@ def initJTable(table_name, overwrite=False):
     :param overwrite: Boolean indicating whether to overwrite the file if it exists.
     :return: 1 if the table is initialized or overwritten, 0 if the file exists and is not overwritten, or -1 on failure.
     """
-    file_path = os.path.join(J_DB_FOLDER, table_name) + ".json"
+    file_path = tableFilePath(table_name)
+    json_path = os.path.join(databaseFolder(), table_name) + ".json"
     
     try:
         if os.path.exists(file_path) and not overwrite:
             return 0  # file exists, keep it as-is, no changes
+
+        if file_path != json_path and os.path.exists(json_path) and not overwrite:
+            # the table moved to a fixed-width file, copy the records from the old json file (left as-is)
+            success = saveJTable(table_name, _migratedRecords(table_name, json_path))
+            return 0 if success == 1 else -1
         
         success = saveJTable(table_name, [])
         return success if success == 1 else -1  # return result of saveJTable (if success) or -1 on failure
@@ -143,6 +610,26 @@ def initJTable(table_name, overwrite=False):
 ##################
 # functions to manage json records
 
+@acceptsDatabase
+def maxJRecordId(table_name, data=None):
+    """
+    Get the highest 'id' used in a table, new records get the ids after it.
+    
+    :param table_name: The name of the table.
+    :param data: The records of the table, if they're already loaded.
+    :return: The highest 'id', or 0 if the table is empty. The ids of the archived records are never used again.
+    """
+    archived_max_id = loadArchiveManifest(table_name)['max_id'] if table_name in my_db_archives else 0
+    if data is None and isFixedWidthTable(table_name):
+        try:
+            return max(maxFixedId(table_name), archived_max_id)   # only the 'id' of each record is read
+        except FileNotFoundError:
+            return archived_max_id
+    if data is None:
+        data = loadJTable(table_name)
+    return max([r['id'] for r in data] + [archived_max_id])
+
+@acceptsDatabase
 def addJRecord(table_name, record):
     """
     Add a new record to the JSON table, assigning a new ID.
@@ -151,10 +638,27 @@ def addJRecord(table_name, record):
     :param record: The dictionary representing the new record.
     :return: 1 on success, or 0 on failure.
     """
-    data = loadJTable(table_name)
-    record['id'] = max([r['id'] for r in data]) + 1 if data else 1
-    data.append(record)
-    success = saveJTable(table_name, data)
+    with lockTables(table_name):    # no other writer can take the same 'id'
+        if isFixedWidthTable(table_name):
+            # only the 'id' of each record is read, and only the new record is written
+            try:
+                record['id'] = maxJRecordId(table_name) + 1
+                appendFixedRecord(table_name, record)
+                bumpTableVersion(table_name, [(None, record)])
+            except FileNotFoundError:
+                record['id'] = 1
+                if not saveJTable(table_name, [record], [(None, record)]):
+                    return 0
+            except Exception as err:
+                console.print(f"Error adding record to table {table_name}: {err}", style="bold red")
+                return 0
+            printDict(record)
+            return 1
+
+        data = loadJTable(table_name)
+        record['id'] = maxJRecordId(table_name, data) + 1
+        data.append(record)
+        success = saveJTable(table_name, data, [(None, record)])
     if success:
         printDict(record)
     return success
@@ -176,6 +680,47 @@ def getKeyMatch(data, **kwargs):
                 its_a_match.append(item)
     return its_a_match
 
+@acceptsDatabase
+def getJRecord(table_name, record_id):
+    """
+    Get one record from a table by its 'id'.
+    Fixed-width tables only read the bytes of that record, the other tables are loaded and searched.
+    
+    :param table_name: The name of the table (file) to read.
+    :param record_id: The 'id' of the record.
+    :return: The matching dictionary, or None if it's not found.
+    """
+    if isFixedWidthTable(table_name):
+        try:
+            return getFixedRecord(table_name, record_id)
+        except FileNotFoundError:
+            return None
+        except Exception as err:
+            console.print(f"Error reading table {table_name}: {err}", style="bold red")
+            return None
+    my_matches = getKeyMatch(loadJTable(table_name), id=record_id)
+    return my_matches[0] if my_matches else None
+
+@acceptsDatabase
+def iterJTable(table_name):
+    """
+    Iterate over the records of a table.
+    Fixed-width tables are streamed from the mapped file, the other tables are loaded first.
+    
+    :param table_name: The name of the table (file) to read.
+    :return: A generator of dictionaries.
+    """
+    if isFixedWidthTable(table_name):
+        try:
+            yield from iterFixedRecords(table_name)
+        except FileNotFoundError:
+            return
+        except Exception as err:
+            console.print(f"Error reading table {table_name}: {err}", style="bold red")
+        return
+    yield from loadJTable(table_name)
+
+@acceptsDatabase
 def updateJRecord(table_name, record_id, update_info):
     """
     Update a record in the JSON table.
@@ -185,18 +730,36 @@ def updateJRecord(table_name, record_id, update_info):
     :param update_info: A dictionary of fields to update with their new values.
     :return: 1 on success, or 0 on failure.
     """
-    data = loadJTable(table_name)
     update_info.pop('id', None)  # Ensure the 'id' key is removed, if present
-    my_record = getKeyMatch(data, id=record_id)[0] # Get the first matching record from the list returned
-    if my_record:
-        my_record.update(update_info)   # put update_info on my_record
-        success = saveJTable(table_name, data)
-        if success:
+    if isFixedWidthTable(table_name):
+        # patch the bytes of this record only, in place
+        try:
+            with lockTables(table_name):
+                old_record = getFixedRecord(table_name, record_id)
+                my_record = updateFixedRecord(table_name, record_id, update_info)
+                if my_record:
+                    bumpTableVersion(table_name, [(old_record, my_record)])
+        except Exception as err:
+            console.print(f"Error updating table {table_name}: {err}", style="bold red")
+            return 0
+        if my_record:
             printDict(my_record)
-        return success
-    else:
+            return 1
         return 0
 
+    with lockTables(table_name):    # no other writer can change the table between the load and the save
+        data = loadJTable(table_name)
+        my_matches = getKeyMatch(data, id=record_id)
+        my_record = my_matches[0] if my_matches else None # Get the first matching record from the list returned
+        if not my_record:
+            return 0
+        old_record = my_record.copy()
+        my_record.update(update_info)   # put update_info on my_record
+        success = saveJTable(table_name, data, [(old_record, my_record)])
+    if success:
+        printDict(my_record)
+    return success
+
 def getUserInput(key, value_type):
     """
     Prompts the user for a value of a specified type and casts it to that type.
@@ -251,6 +814,7 @@ def getUserInput(key, value_type):
                 console.print(f"[bold red]Unsupported type: {value_type[0]}[/bold red]")
                 return None
 
+@acceptsDatabase
 def putDict(dict_schema):
     """
     Collects user inputs based on the structure of a dictionary schema.
@@ -361,6 +925,7 @@ def printDict(data_dict):
             case _:
                 console.print(f"[bold blue]{key}[/bold blue] = [bold green]{value}[/bold green]")
 
+@acceptsDatabase
 def printDictsAsTable(dict_list):
     """
     Prints a list of dictionaries as a formatted table.
@@ -422,6 +987,7 @@ def printDictsAsTable(dict_list):
 ##################
 # functions to manage appointments
 
+@acceptsDatabase
 def selectRecordByID(my_table, display_key='name'):
     """
     Presents a list of records for the user to select from and returns the selected record's ID.
@@ -515,6 +1081,7 @@ def updateAppointment(my_booking_table='appointment_join', booking1='patient_id'
         """
         update_info = {}
         today = datetime.today().date()
+        Status = setEnum(my_booking_table, 'status')
         my_schema = my_db_schema[my_booking_table]
         
         for key, value in record.items():
@@ -531,9 +1098,9 @@ def updateAppointment(my_booking_table='appointment_join', booking1='patient_id'
                 if booking_date < today:    # dates in the past can't be changed, but the status can be updated
                     console.print("The booking date is in the past.", style="bold yellow")
                     while True:
-                        new_status = console.input("You can only change the status to 'Canceled' or 'Done'. Enter the new status: ")
-                        if new_status.lower() in ['canceled', 'done']:
-                            update_info['status'] = new_status.capitalize()
+                        new_status = setMember(my_booking_table, 'status', console.input("You can only change the status to 'Canceled' or 'Done'. Enter the new status: "))
+                        if new_status in (Status.Canceled, Status.Done):
+                            update_info['status'] = new_status.name
                             return update_info
                         else:
                             console.print("Invalid input. Please enter 'Canceled' or 'Done'.", style="bold red")
@@ -546,21 +1113,23 @@ def updateAppointment(my_booking_table='appointment_join', booking1='patient_id'
         return update_info
 
     # main function starts here
+    Status = setEnum(my_booking_table, 'status')
     appointments = loadJTable(my_booking_table)
     printDictsAsTable(appointments)
     
+    live_ids = {appointment['id'] for appointment in appointments}   # the archived appointments are not in the live table
     while True:
         try:
             op = int(console.input("Type the ID number for the record you want to update: "))
         except ValueError:
-            console.print(f"Error: Type a number between 1 and {len(appointments)}", style="bold green")
+            console.print(f"Error: Type one of the ID numbers in the table", style="bold green")
             continue
         else:
-            if 1 <= op <= len(appointments):
+            if op in live_ids:
                 my_matches = getKeyMatch(appointments, id=op) # returns list
                 my_record = my_matches[0] # gets first item in the list, the first match
                 if my_record:
-                    if my_record['status'].lower() in ['canceled', 'done']:
+                    if setMember(my_booking_table, 'status', rawValue(my_record, 'status')) in (Status.Canceled, Status.Done):
                         console.print(f"Record cannot be updated because the status is '{my_record['status']}'.", style="bold red")
                         pause()
                         return None
@@ -585,200 +1154,13 @@ def updateAppointment(my_booking_table='appointment_join', booking1='patient_id'
                     console.print("Record not found.", style="bold red")
                     pause()
                 break   # didn't find it, my_record is empty, returns None
-            else:
-                console.print(f"Error: Type a number between 1 and {len(appointments)}", style="bold green")
+            elif 0 < op <= loadArchiveManifest(my_booking_table)['max_id']:
+                console.print(f"Appointment {op} is finished and archived, it can't be updated.", style="bold red")
                 pause()
-
-##################
-# functions to print reports
-
-def printAppointmentsForDate(my_appointments = 'appointment_join', table1='patient', table2='doctor'):
-    """
-    Prompts the user for a date and prints a table of appointments for that specific date.
-    Supports joins inside my_appointments up to two tables, table1 and table2.
-    
-    """
-    # Prompt user to input a date
-    console.print("You must enter a date that exists in the database", style="bold blue")
-    date_input = getUserInput("appointment_date", ("date", None))
-
-    if date_input is None:
-        console.print("Invalid date input. Exiting.", style="bold red")
-        pause()
-        return    # exit early
-
-    # Load the appointments data
-    appointments = loadJTable(my_appointments)
-
-    # Filter appointments for the specified date
-    filtered_appointments = [appointment for appointment in appointments if appointment.get('booking_date') == date_input]
-
-    if not filtered_appointments:
-        console.print(f"No appointments found for {date_input}.", style="bold yellow")
-        pause()
-        return  # exit early
-
-    # Load patient and doctor data for name resolution, gets 'id' and 'name'
-    patient_data = {item['id']: item['name'] for item in loadJTable(table1)}
-    doctor_data = {item['id']: item['name'] for item in loadJTable(table2)}
-
-    # Initialize the rich.table
-    table = Table(show_header=True, header_style="bold magenta")
-
-    # Define the rich.table columns
-    keys = ['id', 'booking_date', 'patient_id', 'doctor_id', 'price', 'status']
-    column_headers = {
-        'id': 'ID',
-        'booking_date': 'Booking Date',
-        'patient_id': 'Patient Name',
-        'doctor_id': 'Doctor Name',
-        'price': 'Price',
-        'status': 'Status'
-    }
-    for key in keys:
-        table.add_column(column_headers[key], style="dim", justify="left")
-
-    # Add rows to the table
-    for appointment in filtered_appointments:
-        row = []
-        for key in keys:
-            if key == 'patient_id':     # replace 'id' with name
-                patient_name = patient_data.get(appointment.get(key), "Unknown Patient")
-                row.append(patient_name)
-            elif key == 'doctor_id':        # replace 'id' with name
-                doctor_name = doctor_data.get(appointment.get(key), "Unknown Doctor")
-                row.append(doctor_name)
-            else:
-                row.append(str(appointment.get(key, "")))
-        table.add_row(*row)
-
-    # Print the table
-    console.print(table)
-    pause()
-
-def printAppointmentsForPatient():
-    """
-    Prints a table of all appointments for a specific patient selected by the user.
-    """
-    
-    # Get the selected patient's ID
-    patient_id = selectRecordByID('patient')  # safe to call with default args
-
-    if patient_id is None:
-        console.print("No valid patient selected. Exiting.", style="bold red")
-        pause()
-        return
-
-    # Load the appointments data
-    appointments = loadJTable('appointment_join')
-
-    # Filter appointments for the selected patient
-    filtered_appointments = [appointment for appointment in appointments if appointment.get('patient_id') == patient_id]
-
-    if not filtered_appointments:
-        console.print(f"No appointments found for patient ID {patient_id}.", style="bold yellow")
-        pause()
-        return
-
-    # Load doctor data for name resolution
-    doctor_data = {item['id']: item['name'] for item in loadJTable('doctor')}
-    patient_data = {item['id']: item['name'] for item in loadJTable('patient')}
-
-    # Initialize the table
-    table = Table(show_header=True, header_style="bold magenta")
-
-    # Define table columns
-    keys = ['id', 'booking_date', 'patient_id', 'doctor_id', 'price', 'status']
-    column_headers = {
-        'id': 'ID',
-        'booking_date': 'Booking Date',
-        'patient_id': 'Patient Name',
-        'doctor_id': 'Doctor Name',
-        'price': 'Price',
-        'status': 'Status'
-    }
-    for key in keys:
-        table.add_column(column_headers[key], style="dim", justify="left")
-
-    # Add rows to the table
-    for appointment in filtered_appointments:
-        row = []
-        for key in keys:
-            if key == 'patient_id':
-                patient_name = patient_data.get(appointment.get(key), "Unknown Patient")
-                row.append(patient_name)
-            elif key == 'doctor_id':
-                doctor_name = doctor_data.get(appointment.get(key), "Unknown Doctor")
-                row.append(doctor_name)
+                return None
             else:
-                row.append(str(appointment.get(key, "")))
-        table.add_row(*row)
-
-    # Print the table
-    console.print(table)
-    pause()
-
-def printRevenueForDateRange():
-    """
-    Prompts the user for two dates and prints a table of all appointments between those dates with individual prices and the total price.
-    """
-    # Prompt the user to input two dates
-    start_date_str = getUserInput("start_date", ("date", None))
-    end_date_str = getUserInput("end_date", ("date", None))
-
-    if start_date_str is None or end_date_str is None:
-        console.print("Invalid date input. Exiting.", style="bold red")
-        pause()
-        return
-
-    # Convert strings to date
-    start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-    end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-
-    if start_date > end_date:
-        start_date, end_date = end_date, start_date  # get them in right order
-
-    # Load the appointments data
-    appointments = loadJTable('appointment_join')
-
-    # Filter appointments between the specified dates, where status = 'realizada'. 
-    # Status must be updated after the appointment for revenue to be accounted for.
-    filtered_appointments = [appointment for appointment in appointments 
-        if start_date <= datetime.strptime(appointment.get('booking_date'), '%Y-%m-%d').date() <= end_date
-        and appointment.get('status').lower() == 'realizada']
-
-    if not filtered_appointments:
-        console.print(f"No appointments found between {start_date_str} and {end_date_str}.", style="bold yellow")
-        pause()
-        return
-
-    # Load patient and doctor data for name resolution
-    patient_data = {item['id']: item['name'] for item in loadJTable('patient')}
-    doctor_data = {item['id']: item['name'] for item in loadJTable('doctor')}
-
-    # Initialize the table
-    table = Table(show_header=True, header_style="bold magenta")
-    table.add_column("Booking Date", style="dim", justify="left")
-    table.add_column("Patient Name", style="dim", justify="left")
-    table.add_column("Doctor Name", style="dim", justify="left")
-    table.add_column("Price (EUR)", style="dim", justify="left")
-
-    # Add rows to the table and calculate the total price
-    total_price = 0
-    for appointment in filtered_appointments:   # follows 'id' order, not the 'date order'
-        booking_date = appointment.get('booking_date', "")
-        patient_name = patient_data.get(appointment.get('patient_id'), "Unknown Patient")
-        doctor_name = doctor_data.get(appointment.get('doctor_id'), "Unknown Doctor")
-        price = appointment.get('price', 0)
-        total_price += price
-        table.add_row(booking_date, patient_name, doctor_name, str(price))
-
-    # Add the total row
-    table.add_row("", "", "Total = ", str(total_price), style="bold green on yellow")
-
-    # Print the table
-    console.print(table)
-    pause()
+                console.print(f"Error: Type one of the ID numbers in the table", style="bold green")
+                pause()
 
 ##################
 # What does the Python interpreter say to its friends when it reaches the end of a file?
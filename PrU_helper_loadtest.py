@@ -0,0 +1,297 @@
+# PrU_helper_loadtest.py
+# a load test of the storage layer: many booking clerks writing and reading at the same time
+
+# each clerk is a thread or a process running a mix of bookings (addJRecord), updates (updateJRecord) and reports,
+# against a temporary database folder seeded with a few patients, doctors and appointments
+# every write carries a token (a unique price, or a unique name) so the tables can be checked at the end:
+# - lost bookings: a booking that returned success but isn't in the table
+# - lost updates: a record whose last update is not the value in the table (each clerk only updates its own records)
+# - duplicate ids: two records with the same 'id'
+# run it as a regression gate for changes to the storage layer, it exits with 1 if a check fails:
+#   python PrU_helper_loadtest.py --clerks 8 --mode both --operations 200 --mix book=0.2,update=0.3,report=0.5 --max-p99 250
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from PrU_helper_db import *
+from PrU_helper_database import *
+from PrU_helper_json import *
+from PrU_helper_reports import *
+import PrU_helper_json
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+LOADTEST_MIX = {'book': 0.2, 'update': 0.3, 'report': 0.5}   # the share of each operation
+LOADTEST_SEED_ROWS = {'patient': 200, 'doctor': 20, 'appointment_join': 2000}
+LOADTEST_WRITE_TABLES = ('appointment_join', 'patient')     # a fixed-width table and a json table, written in turns
+LOADTEST_TOKEN_BASE = 1000000   # the tokens are above every seeded price
+LOADTEST_TOKEN_CLERK = 100000   # the tokens of one clerk, so at most this many operations per clerk
+
+##################
+# helper functions
+
+def _seedDatabase(folder, rows=None):
+    """
+    Write the tables of a new database: patients, doctors and 'Booked' appointments around today.
+    """
+    rows = dict(LOADTEST_SEED_ROWS, **(rows or {}))
+    today = datetime.today().date()
+    with useDatabase(JDatabase(folder, folder)):
+        saveJTable('patient', [{'id': i, 'name': f"Patient {i}", 'date_of_birth': '1980-01-01', 'status': 'Active'}
+                               for i in range(1, rows['patient'] + 1)])
+        saveJTable('doctor', [{'id': i, 'name': f"Doctor {i}", 'salary': 3000, 'status': 'Available'}
+                              for i in range(1, rows['doctor'] + 1)])
+        saveJTable('appointment_join', [{'id': i, 'booking_date': (today + timedelta(days=i % 60 - 30)).strftime('%Y-%m-%d'),
+                                         'patient_id': i % rows['patient'] + 1, 'doctor_id': i % rows['doctor'] + 1,
+                                         'price': 50 + i % 100, 'status': 'Booked'}
+                                        for i in range(1, rows['appointment_join'] + 1)])
+    return rows
+
+def _percentile(values, fraction):
+    """
+    Get the value below which a fraction of the values fall (nearest rank), or None if there are none.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def _chooseOperation(rng, mix):
+    point = rng.random() * sum(mix.values())
+    for operation, share in mix.items():
+        point -= share
+        if point < 0:
+            return operation
+    return operation
+
+def _runClerk(database, clerk, clerks, operations, mix, rows, seed):
+    """
+    Run the operations of one clerk, in a thread (database is the JDatabase shared by the threads)
+    or in a worker process (database is the folder, the process opens its own handle).
+
+    :return: A dictionary with 'latencies' ({operation: [seconds]}), 'booked' (tokens of the successful bookings, per table),
+             'updated' ({(table_name, id): last token}) and 'errors' (the number of failed operations).
+    """
+    PrU_helper_json.console.quiet = True    # addJRecord() and updateJRecord() print the record they wrote
+    rng = random.Random(seed + clerk)
+    today = datetime.today().date()
+    result = {'latencies': {}, 'booked': {table_name: [] for table_name in LOADTEST_WRITE_TABLES}, 'updated': {}, 'errors': 0}
+    # each clerk only updates its own records, so the last value written is known
+    owned = {table_name: [record_id for record_id in range(1, rows[table_name] + 1) if record_id % clerks == clerk]
+             for table_name in LOADTEST_WRITE_TABLES}
+
+    if not isinstance(database, JDatabase):
+        database = JDatabase(database, database)
+    with useDatabase(database):
+        for number in range(operations):
+            operation = _chooseOperation(rng, mix)
+            table_name = LOADTEST_WRITE_TABLES[number % len(LOADTEST_WRITE_TABLES)]
+            token = LOADTEST_TOKEN_BASE + clerk * LOADTEST_TOKEN_CLERK + number
+            start = time.perf_counter()
+            try:
+                match operation:
+                    case 'book':
+                        if table_name == 'patient':
+                            record = {'name': f"token {token}", 'date_of_birth': '1990-01-01', 'status': 'Active'}
+                        else:
+                            record = {'booking_date': (today + timedelta(days=rng.randrange(30))).strftime('%Y-%m-%d'),
+                                      'patient_id': rng.randrange(1, rows['patient'] + 1), 'doctor_id': rng.randrange(1, rows['doctor'] + 1),
+                                      'price': token, 'status': 'Booked'}
+                        success = addJRecord(table_name, record)
+                        if success:
+                            result['booked'][table_name].append(token)
+                    case 'update':
+                        if not owned[table_name]:
+                            continue
+                        record_id = rng.choice(owned[table_name])
+                        update_info = {'name': f"token {token}"} if table_name == 'patient' else {'price': token}
+                        success = updateJRecord(table_name, record_id, update_info)
+                        if success:
+                            result['updated'][(table_name, record_id)] = token
+                    case _:
+                        day = (today + timedelta(days=rng.randrange(-30, 30))).strftime('%Y-%m-%d')
+                        match rng.randrange(3):
+                            case 0:
+                                getAppointmentsForDate(day)
+                            case 1:
+                                getRevenueForDateRange(min(day, today.strftime('%Y-%m-%d')), max(day, today.strftime('%Y-%m-%d')))
+                            case _:
+                                getAppointmentsForPatient(rng.randrange(1, rows['patient'] + 1))
+                        success = 1
+            except Exception:
+                success = 0
+            result['latencies'].setdefault(operation, []).append(time.perf_counter() - start)
+            if not success:
+                result['errors'] += 1
+    return result
+
+def _checkTables(folder, results):
+    """
+    Check the tables written by the clerks against what each clerk recorded.
+
+    :return: A dictionary with 'lost_bookings', 'lost_updates' and 'duplicate_ids', per table.
+    """
+    checks = {'lost_bookings': {}, 'lost_updates': {}, 'duplicate_ids': {}}
+    with useDatabase(JDatabase(folder, folder)):
+        for table_name in LOADTEST_WRITE_TABLES:
+            records = loadJTable(table_name)
+            token_key = 'name' if table_name == 'patient' else 'price'
+            ids = Counter(record['id'] for record in records)
+            checks['duplicate_ids'][table_name] = sum(count - 1 for count in ids.values() if count > 1)
+
+            found = Counter(record.get(token_key) for record in records)
+            booked = [token for result in results for token in result['booked'][table_name]]
+            as_value = (lambda token: f"token {token}") if table_name == 'patient' else (lambda token: token)
+            checks['lost_bookings'][table_name] = sum(1 for token in booked if found[as_value(token)] == 0)
+
+            by_id = {record['id']: record for record in records}
+            updated = {record_id: token for result in results for (updated_table, record_id), token in result['updated'].items()
+                       if updated_table == table_name}
+            checks['lost_updates'][table_name] = sum(1 for record_id, token in updated.items()
+                                                     if by_id.get(record_id, {}).get(token_key) != as_value(token))
+    return checks
+
+##################
+# functions to run the load test
+
+def runLoadTest(clerks=8, mode='threads', operations=200, mix=None, rows=None, seed=1, keep_folder=False):
+    """
+    Run the load test on a new temporary database, its folder is deleted at the end.
+
+    :param clerks: The number of clerks working at the same time.
+    :param mode: 'threads' (one program, shared handles) or 'processes' (one program per clerk, file locks only).
+    :param operations: The number of operations of each clerk.
+    :param mix: The share of each operation, {'book': x, 'update': y, 'report': z}, LOADTEST_MIX when None.
+    :param rows: The number of seeded records per table, LOADTEST_SEED_ROWS when None.
+    :param seed: The seed of the random choices, the same seed runs the same operations.
+    :param keep_folder: Keep the temporary folder, e.g. to look at the tables after a failure.
+    :return: A dictionary with 'mode', 'clerks', 'operations' (total), 'seconds', 'throughput' (operations per second),
+             'latency' ({operation: {'count', 'p50', 'p99'}} in milliseconds, 'all' for every operation), 'errors',
+             'lost_bookings', 'lost_updates', 'duplicate_ids' (each {table_name: count}) and 'folder'.
+    """
+    if mode not in ('threads', 'processes'):
+        raise ValueError(f"Unknown mode {mode!r}, use 'threads' or 'processes'")
+    if operations > LOADTEST_TOKEN_CLERK:
+        raise ValueError(f"At most {LOADTEST_TOKEN_CLERK} operations per clerk")
+    mix = dict(mix or LOADTEST_MIX)
+    folder = tempfile.mkdtemp(prefix="loadtest_")
+    try:
+        rows = _seedDatabase(folder, rows)
+        database = JDatabase(folder, folder) if mode == 'threads' else folder
+        arguments = [(database, clerk, clerks, operations, mix, rows, seed) for clerk in range(clerks)]
+        Executor = ThreadPoolExecutor if mode == 'threads' else ProcessPoolExecutor
+        start = time.perf_counter()
+        with Executor(max_workers=clerks) as pool:
+            results = list(pool.map(_runClerk, *zip(*arguments)))
+        seconds = time.perf_counter() - start
+
+        latencies = {}
+        for result in results:
+            for operation, values in result['latencies'].items():
+                latencies.setdefault(operation, []).extend(values)
+        latencies['all'] = [value for values in latencies.values() for value in values]
+        report = {
+            'mode': mode,
+            'clerks': clerks,
+            'operations': len(latencies['all']),
+            'seconds': seconds,
+            'throughput': len(latencies['all']) / seconds if seconds else 0,
+            'latency': {operation: {'count': len(values),
+                                    'p50': _percentile(values, 0.50) * 1000,
+                                    'p99': _percentile(values, 0.99) * 1000}
+                        for operation, values in latencies.items() if values},
+            'errors': sum(result['errors'] for result in results),
+            'folder': folder if keep_folder else None
+        }
+        report.update(_checkTables(folder, results))
+        return report
+    finally:
+        if not keep_folder:
+            shutil.rmtree(folder, ignore_errors=True)
+
+def checkLoadTest(report, max_p99_ms=None, min_throughput=None):
+    """
+    Check the results of a load test, as a regression gate.
+
+    :param report: The dictionary returned by runLoadTest().
+    :param max_p99_ms: The highest p99 latency allowed for any operation, in milliseconds, or None.
+    :param min_throughput: The lowest throughput allowed, in operations per second, or None.
+    :return: The list of the failed checks, as messages, empty if every check passed.
+    """
+    failures = []
+    for check in ('lost_bookings', 'lost_updates', 'duplicate_ids'):
+        for table_name, count in report[check].items():
+            if count:
+                failures.append(f"{report['mode']}: {count} {check.replace('_', ' ')} in {table_name}")
+    if report['errors']:
+        failures.append(f"{report['mode']}: {report['errors']} operations failed")
+    if max_p99_ms is not None:
+        for operation, latency in report['latency'].items():
+            if latency['p99'] > max_p99_ms:
+                failures.append(f"{report['mode']}: p99 of {operation} is {latency['p99']:.1f} ms, above {max_p99_ms} ms")
+    if min_throughput is not None and report['throughput'] < min_throughput:
+        failures.append(f"{report['mode']}: {report['throughput']:.1f} operations/s, below {min_throughput}")
+    return failures
+
+def printLoadTestReport(report):
+    """
+    Prints the results of a load test: the latency of each operation, the throughput and the checks.
+
+    Args:
+    - report (dict): The dictionary returned by runLoadTest().
+    """
+    title = f"{report['clerks']} clerks ({report['mode']}): {report['operations']} operations in {report['seconds']:.2f} s, {report['throughput']:.1f}/s"
+    table = Table(show_header=True, header_style="bold magenta", title=title, title_style="bold blue")
+    for header in ("Operation", "Count", "p50 (ms)", "p99 (ms)"):
+        table.add_column(header, style="dim", justify="left")
+    for operation, latency in report['latency'].items():
+        table.add_row(operation, str(latency['count']), f"{latency['p50']:.1f}", f"{latency['p99']:.1f}")
+    console.print(table)
+    for check in ('lost_bookings', 'lost_updates', 'duplicate_ids'):
+        counts = ", ".join(f"{table_name}: {count}" for table_name, count in report[check].items())
+        style = "bold red" if any(report[check].values()) else "bold green"
+        console.print(f"{check.replace('_', ' ').capitalize()}: {counts}", style=style)
+    console.print(f"Failed operations: {report['errors']}", style="bold red" if report['errors'] else "bold green")
+
+def _parseMix(text):
+    """
+    Parse a mix given as book=0.2,update=0.3,report=0.5.
+    """
+    mix = {}
+    for part in text.split(','):
+        operation, share = part.split('=')
+        if operation.strip() not in LOADTEST_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown operation {operation!r}, use {', '.join(LOADTEST_MIX)}")
+        mix[operation.strip()] = float(share)
+    return mix
+
+# the load test only starts when this file is run, not when it's imported (e.g. by its worker processes)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of the storage layer, many booking clerks at the same time.")
+    parser.add_argument('--clerks', type=int, default=8, help="clerks working at the same time")
+    parser.add_argument('--mode', choices=('threads', 'processes', 'both'), default='both')
+    parser.add_argument('--operations', type=int, default=200, help="operations of each clerk")
+    parser.add_argument('--mix', type=_parseMix, default=LOADTEST_MIX, help="e.g. book=0.2,update=0.3,report=0.5")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--max-p99', type=float, default=None, help="fail if the p99 latency of an operation is above this, in ms")
+    parser.add_argument('--min-throughput', type=float, default=None, help="fail if fewer operations per second are done")
+    options = parser.parse_args()
+
+    failures = []
+    for mode in (('threads', 'processes') if options.mode == 'both' else (options.mode,)):
+        report = runLoadTest(options.clerks, mode, options.operations, options.mix, seed=options.seed)
+        printLoadTestReport(report)
+        failures += checkLoadTest(report, options.max_p99, options.min_throughput)
+    for failure in failures:
+        console.print(failure, style="bold red")
+    raise SystemExit(1 if failures else 0)
+
+##################
+# take a number, please
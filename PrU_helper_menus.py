@@ -4,6 +4,9 @@
 import beaupy
 from PrU_helper_json import *
 from PrU_helper_db import *
+from PrU_helper_export import *
+from PrU_helper_transaction import *
+from PrU_helper_recurrence import *
 from rich.console import Console
 
 console = Console()
@@ -112,16 +115,17 @@ def printMenuEditTable(my_table_name):
                 console.print("Returning to main menu.", style="bold blue")
                 break   # returns None
 
-def printMenuEditJoinTable(menu_list=['Book Appointment', 'Edit Appointment', 'Go Back'], join_table_name='appointment_join'):
+def printMenuEditJoinTable(menu_list=['Book Appointment', 'Edit Appointment', 'Book Recurring Appointments', 'Go Back'], join_table_name='appointment_join'):
     """
     Display a menu for managing join tables, such as booking or editing appointments.
 
     Args:
-    - menu_list (list): A list of three menu options in the following order:
+    - menu_list (list): A list of four menu options in the following order:
         1. Create a new join (e.g., book an appointment)
         2. Edit an existing join (e.g., edit an appointment)
-        3. Go back to the previous menu
-      Defaults to ['Book Appointment', 'Edit Appointment', 'Go Back'].
+        3. Create a series of joins (e.g., book weekly appointments)
+        4. Go back to the previous menu
+      Defaults to ['Book Appointment', 'Edit Appointment', 'Book Recurring Appointments', 'Go Back'].
     - join_table_name (str): The name of the join table to be managed. Defaults to 'appointment_join'.
 
     """
@@ -135,10 +139,14 @@ def printMenuEditJoinTable(menu_list=['Book Appointment', 'Edit Appointment', 'G
             case 1:  # (1) Create a new join --> book appointment
                 appointment = bookAppointment()  # no args required, uses defaults
                 if beaupy.confirm("Book this appointment?"):
-                    if addJRecord(join_table_name, appointment):
+                    try:
+                        # checks the values and that the patient and the doctor exist, before anything is written
+                        with Transaction() as transaction:
+                            appointment = transaction.insert(join_table_name, appointment)
+                        printDict(appointment)
                         console.print("Appointment booked successfully.", style="bold green")
-                    else:
-                        console.print("Booking failed.", style="bold red")
+                    except TransactionError as err:
+                        console.print(f"Booking failed: {err}", style="bold red")
                 else:
                     console.print("Booking cancelled.", style="bold red")
                 pause()
@@ -146,8 +154,52 @@ def printMenuEditJoinTable(menu_list=['Book Appointment', 'Edit Appointment', 'G
             case 2:  # (2) Edit an existing join --> update appointment
                 updateAppointment()
 
-            case 3:  # (3) Go Back --> Go back to the main loop
+            case 3:  # (3) Create a series of joins --> book recurring appointments, see PrU_helper_recurrence.py
+                printBookRecurringAppointments(join_table_name)
+
+            case 4:  # (4) Go Back --> Go back to the main loop
                 break  # return None
 
+def printMenuExport():
+    """
+    Displays a menu to export a table or a report to a CSV or JSONL file, optionally compressed with gzip.
+    The rows are streamed to the file, see PrU_helper_export.py.
+    
+    Returns:
+    - None
+    """
+    menu_list = [f"Table: {table}" for table in my_db_tables] + [f"Report: {report}" for report in EXPORT_REPORTS] + ["Go Back"]
+    console.print("Select what to export:", style="bold blue")
+    op = beaupy.select(menu_list, cursor="->", cursor_style='green')
+    if op == "Go Back":
+        return
+
+    kind, name = op.split(': ', 1)
+    params = {}
+    if kind == 'Report':
+        for param in EXPORT_REPORTS[name][1]:
+            if param == 'patient_id':
+                params[param] = selectRecordByID('patient')
+                if params[param] is None:
+                    return
+            else:
+                params[param] = getUserInput(param, ("date", None))
+
+    console.print("Select the file format:", style="bold blue")
+    file_format = beaupy.select(list(EXPORT_FORMATS), cursor="->", cursor_style='green')
+    compress = beaupy.confirm("Compress the file with gzip?")
+    file_path = exportFileName(name, file_format, compress)
+
+    try:
+        if kind == 'Table':
+            count = exportTable(name, file_path, file_format, compress)
+        else:
+            count = exportReport(name, file_path, file_format, compress, **params)
+    except Exception as err:
+        console.print(f"Error exporting {name}: {err}", style="bold red")
+    else:
+        console.print(f"Exported {count} rows to {file_path}", style="bold green")
+    pause()
+
 ##################
 # nothing more to see
\ No newline at end of file
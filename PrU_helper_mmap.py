@@ -0,0 +1,615 @@
+# PrU_helper_mmap.py
+# fixed-width binary table files, read and patched in place through mmap
+
+# a table can be stored this way when every key in its schema has a fixed size (int, date, FK, set)
+# tables with 'text' keys, like 'patient' and 'doctor', keep using the json files
+# the file starts with a header (magic bytes + struct format), followed by one record after the other
+
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from PrU_helper_db import *
+from PrU_helper_database import *
+from PrU_helper_codec import *
+from PrU_helper_records import *
+
+try:
+    import fcntl    # file locks between programs, not available on Windows
+except ImportError:
+    fcntl = None
+
+FIXED_MAGIC = b'PRUFIX01'
+FIXED_HEADER = struct.Struct('<8s32s')    # magic bytes, struct format of the records
+FIXED_TYPES = {
+    'int': 'q',     # 8 bytes, big enough for any salary or price
+    'date': 'i',    # 4 bytes, YYYYMMDD
+    'FK': 'i',      # 4 bytes, the 'id' of the other table
+    'set': 'B'      # 1 byte, the position in the schema tuple
+}
+
+UNDO_ENTRY = struct.Struct('<QQ')  # inode of the fixed-width file, slot of the record; followed by the old bytes of the record
+VIEW_CHUNK_RECORDS = 4096   # records copied at a time by FixedFileView.raw()
+
+_layouts = {}   # table_name -> struct.Struct, or None if the table can't be stored with a fixed width
+_pinned_files = {}  # file path -> number of FixedFileView mapping it in this program
+_pinned_guard = threading.Lock()
+
+##################
+# helper functions
+
+def fixedLayout(table_name):
+    """
+    Build the struct used to pack the records of a table, following my_db_schema.
+
+    :param table_name: The name of the table.
+    :return: A struct.Struct, or None if any key in the schema doesn't have a fixed size.
+    """
+    if table_name not in _layouts:
+        formats = []
+        for value_type in my_db_schema.get(table_name, {}).values():
+            if value_type[0] not in FIXED_TYPES:
+                formats = []
+                break
+            formats.append(FIXED_TYPES[value_type[0]])
+        _layouts[table_name] = struct.Struct('<' + ''.join(formats)) if formats else None
+    return _layouts[table_name]
+
+def isFixedWidthTable(table_name):
+    """
+    Check if a table is stored in a fixed-width file instead of a json file.
+
+    :param table_name: The name of the table.
+    :return: True if J_DB_FIXED_WIDTH is enabled and the schema only has fixed-size keys.
+    """
+    return J_DB_FIXED_WIDTH and fixedLayout(table_name) is not None
+
+def fixedTablePath(table_name):
+    """
+    Get the path of the fixed-width file for a table.
+
+    :param table_name: The name of the table.
+    :return: The file path, inside the folder of the current database (see PrU_helper_database.py).
+    """
+    return os.path.join(databaseFolder(), table_name) + ".dat"
+
+def fixedUndoPath(table_name):
+    """
+    Get the path of the .undo file of a table, keeping the old bytes of the records updated in place while a FixedFileView maps its file.
+
+    :param table_name: The name of the table.
+    :return: The file path, next to the fixed-width file.
+    """
+    return os.path.join(databaseFolder(), table_name) + ".undo"
+
+def _fieldRanges(table_name):
+    """
+    Get the byte range of each key inside one packed record, as (key, start, end) in the schema order.
+    The struct formats use '<', so there's no padding between the fields.
+    """
+    ranges, offset = [], 0
+    for key, value_type in my_db_schema[table_name].items():
+        size = struct.calcsize('<' + FIXED_TYPES[value_type[0]])
+        ranges.append((key, offset, offset + size))
+        offset += size
+    return ranges
+
+def _idField(table_name):
+    """
+    Get the struct and the byte offset of the 'id' inside one packed record.
+    """
+    for key, start, end in _fieldRanges(table_name):
+        if key == 'id':
+            return struct.Struct('<' + FIXED_TYPES[my_db_schema[table_name][key][0]]), start
+    raise ValueError(f"The table {table_name} has no 'id' key in its schema")
+
+def packRecord(table_name, record):
+    """
+    Pack a record into the bytes stored in the fixed-width file.
+    Keys that are not in the schema are not stored.
+
+    :param table_name: The name of the table.
+    :param record: The dictionary to pack.
+    :return: The packed bytes.
+    :raises ValueError: If a value doesn't match its schema type.
+    """
+    schema = my_db_schema[table_name]
+    if isinstance(record, JRecord) and record._table_name == table_name and len(record._columns) == len(schema):
+        values = record.packedValues()     # the values are already kept as integers
+    else:
+        values = [encodeValue(value_type, record.get(key)) for key, value_type in schema.items()]
+    try:
+        return fixedLayout(table_name).pack(*values)
+    except struct.error as err:
+        raise ValueError(f"Record {record.get('id')} doesn't fit the {table_name} layout: {err}")
+
+def checkFixedValue(value_type, value):
+    """
+    Check if a value can be stored in a fixed-width column of its schema type.
+
+    :param value_type: The schema tuple for the key, e.g. ("date", None).
+    :param value: The value as found in a record.
+    :raises ValueError: If the value doesn't match its schema type or doesn't fit the column.
+    """
+    try:
+        struct.pack('<' + FIXED_TYPES[value_type[0]], encodeValue(value_type, value))
+    except (struct.error, TypeError) as err:
+        raise ValueError(f"'{value}' doesn't fit a {value_type[0]} column: {err}")
+
+def unpackRecord(table_name, values):
+    """
+    Convert the tuple unpacked from the fixed-width file back to a record.
+
+    :param table_name: The name of the table.
+    :param values: The tuple of integers, in the schema order.
+    :return: The record, see recordClass().
+    """
+    return recordClass(table_name).fromPacked(values)
+
+@contextmanager
+def mapFixedTable(table_name, writable=False):
+    """
+    Open the fixed-width file of a table and map it in memory.
+
+    :param table_name: The name of the table.
+    :param writable: Map the file for writing, changes go straight to the file.
+    :return: A context manager giving (mmap, number of records).
+    :raises ValueError: If the file header doesn't match the current schema.
+    """
+    file_path = fixedTablePath(table_name)
+    with open(file_path, 'r+b' if writable else 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < FIXED_HEADER.size:
+            raise ValueError(f"File {file_path} is too short to hold a header")
+        access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+        with mmap.mmap(f.fileno(), 0, access=access) as mm:
+            yield mm, _mappedCount(table_name, mm, size)
+
+def _mappedCount(table_name, mm, size):
+    """
+    Check the header of a mapped fixed-width file against the schema, and count its records.
+    A partial record at the end of the file (e.g. an interrupted append) is not counted.
+    """
+    magic, record_format = FIXED_HEADER.unpack_from(mm, 0)
+    if magic != FIXED_MAGIC or record_format.rstrip(b'\0').decode() != fixedLayout(table_name).format:
+        raise ValueError(f"File {fixedTablePath(table_name)} doesn't match the schema of the {table_name} table")
+    return (size - FIXED_HEADER.size) // fixedLayout(table_name).size
+
+class FixedFileView:
+    """
+    One version of a fixed-width file, mapped for reading until it's closed, e.g. by a snapshot (see PrU_helper_snapshot.py).
+    The file is not copied: the writers replace it (see _writeFixedFile()) and the view keeps the old one, the records
+    appended later are past its count, and the records updated in place keep their old bytes in the .undo file
+    (see updateFixedRecords()), which the view reads them from.
+    It reads like a tuple of records; raw() and rawSlots() give the packed rows, as iterFixedRaw() and readFixedSlots() do.
+    """
+
+    def __init__(self, table_name):
+        """
+        :param table_name: The name of the table, a missing file gives an empty view.
+        :raises ValueError: If the file header doesn't match the current schema.
+        """
+        self.table_name = table_name
+        self.count = 0
+        self._layout = fixedLayout(table_name)
+        self._file = self._undo = self._mm = None
+        self._inode = None
+        self._undo_read = 0     # how far the .undo file was read
+        self._old_bytes = {}    # slot -> bytes of the record when the view was opened, for the records updated since
+        self._undo_guard = threading.Lock()
+        try:
+            self._file = open(fixedTablePath(table_name), 'rb')
+        except FileNotFoundError:
+            return
+        try:
+            with _pinned_guard:     # no update in place of this program runs meanwhile
+                self._undo = open(fixedUndoPath(table_name), 'a+b')
+                if fcntl is not None:
+                    fcntl.flock(self._undo.fileno(), fcntl.LOCK_SH)    # held until close(), the writers log the old bytes while it is
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_SH)    # waits for an update in place to finish
+                _pinned_files[self._file.name] = _pinned_files.get(self._file.name, 0) + 1
+                stat = os.fstat(self._file.fileno())
+                if stat.st_size < FIXED_HEADER.size:
+                    raise ValueError(f"File {self._file.name} is too short to hold a header")
+                self._inode = stat.st_ino
+                self._undo_read = os.fstat(self._undo.fileno()).st_size   # the updates logged before are already in the file
+                self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.count = _mappedCount(table_name, self._mm, stat.st_size)
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        except Exception:
+            self.close()
+            raise
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        if not 0 <= position < self.count:
+            raise IndexError(f"Position {position} is out of the {self.table_name} table")
+        return unpackRecord(self.table_name, self._layout.unpack(self._read(position, position + 1)))
+
+    def __iter__(self):
+        for values in self.raw():
+            yield unpackRecord(self.table_name, values)
+
+    def _readUndo(self):
+        """
+        Read the entries appended to the .undo file since the last call, keeping the first old bytes of each slot of this file.
+        It must be called after reading the mapped bytes: a writer logs the old bytes before it patches the record.
+        """
+        if self._undo is None:
+            return
+        entry_size = UNDO_ENTRY.size + self._layout.size
+        with self._undo_guard:
+            size = os.fstat(self._undo.fileno()).st_size
+            if size - self._undo_read < entry_size:
+                return
+            self._undo.seek(self._undo_read)
+            data = self._undo.read(size - self._undo_read)
+            complete = len(data) - len(data) % entry_size   # an entry being written is read next time
+            for start in range(0, complete, entry_size):
+                inode, slot = UNDO_ENTRY.unpack_from(data, start)
+                if inode == self._inode and slot < self.count:
+                    self._old_bytes.setdefault(slot, data[start + UNDO_ENTRY.size:start + entry_size])
+            self._undo_read += complete
+
+    def _read(self, start, stop):
+        """
+        Copy the packed records of the slots start to stop (not included), as they were when the view was opened.
+        """
+        size = self._layout.size
+        chunk = self._mm[FIXED_HEADER.size + start * size:FIXED_HEADER.size + stop * size]
+        self._readUndo()
+        if not self._old_bytes:
+            return chunk
+        chunk = bytearray(chunk)
+        slots = range(start, stop) if stop - start < len(self._old_bytes) else self._old_bytes
+        for slot in slots:
+            if start <= slot < stop and slot in self._old_bytes:
+                chunk[(slot - start) * size:(slot - start + 1) * size] = self._old_bytes[slot]
+        return chunk
+
+    def raw(self):
+        """
+        Iterate over the packed records, see iterFixedRaw().
+        """
+        for start in range(0, self.count, VIEW_CHUNK_RECORDS):
+            yield from self._layout.iter_unpack(self._read(start, min(start + VIEW_CHUNK_RECORDS, self.count)))
+
+    def rawSlots(self, slots):
+        """
+        Read the packed records at the given slots, see readFixedSlots().
+        """
+        size = self._layout.size
+        slots = [slot for slot in slots if 0 <= slot < self.count]
+        rows = [self._mm[FIXED_HEADER.size + slot * size:FIXED_HEADER.size + (slot + 1) * size] for slot in slots]
+        self._readUndo()
+        for slot, row in zip(slots, rows):
+            yield self._layout.unpack(self._old_bytes.get(slot, row))
+
+    def slotOf(self, record_id):
+        """
+        Find the slot of a record by its 'id', see fixedSlotOf(). The ids are never updated in place.
+        """
+        offset = _findOffset(self.table_name, self._mm, self.count, record_id) if self.count else None
+        return None if offset is None else (offset - FIXED_HEADER.size) // self._layout.size
+
+    def close(self):
+        """
+        Unmap the file and release its locks, the view is empty afterwards.
+        """
+        self.count = 0
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            with _pinned_guard:
+                if _pinned_files.get(self._file.name, 0) > 1:
+                    _pinned_files[self._file.name] -= 1
+                else:
+                    _pinned_files.pop(self._file.name, None)
+            self._file.close()
+            self._file = None
+        if self._undo is not None:
+            self._undo.close()  # releases the lock too
+            self._undo = None
+        self._old_bytes = {}
+
+def _viewsOpen(table_name, undo):
+    """
+    Check if a FixedFileView, of this program or another one, maps the fixed-width file of a table.
+    Otherwise undo (the open .undo file) keeps an exclusive lock (where fcntl exists) until it's closed, so no view opens meanwhile.
+    Must be called with _pinned_guard held.
+    """
+    if fcntl is not None:
+        try:
+            fcntl.flock(undo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        return False
+    return _pinned_files.get(fixedTablePath(table_name), 0) > 0
+
+def _findOffset(table_name, mm, count, record_id):
+    """
+    Find the byte offset of a record in the mapped file.
+    The ids are assigned by addJRecord() as max + 1, so the record with 'id' N is usually in slot N-1.
+    If it isn't there (e.g. older records were archived), the ids are searched as if they were sorted, as they are when
+    records are only appended or removed. If that fails too, every 'id' is checked, without unpacking the other fields.
+
+    :return: The byte offset of the record, or None if the 'id' is not found.
+    """
+    record_size = fixedLayout(table_name).size
+    id_struct, id_offset = _idField(table_name)
+    readId = lambda slot: id_struct.unpack_from(mm, FIXED_HEADER.size + slot * record_size + id_offset)[0]
+    slot = record_id - 1
+    if 0 <= slot < count and readId(slot) == record_id:
+        return FIXED_HEADER.size + slot * record_size
+    low, high = 0, count
+    while low < high:   # binary search
+        middle = (low + high) // 2
+        if readId(middle) < record_id:
+            low = middle + 1
+        else:
+            high = middle
+    if low < count and readId(low) == record_id:
+        return FIXED_HEADER.size + low * record_size
+    for slot in range(count):
+        offset = FIXED_HEADER.size + slot * record_size
+        if id_struct.unpack_from(mm, offset + id_offset)[0] == record_id:
+            return offset
+    return None
+
+##################
+# functions to read and write whole tables
+
+def writeFixedTable(table_name, my_table):
+    """
+    Write all the records of a table to its fixed-width file, replacing the file.
+
+    :param table_name: The name of the table.
+    :param my_table: The list of dictionaries to save.
+    :raises ValueError: If a value doesn't match its schema type.
+    """
+    packed = [packRecord(table_name, record) for record in my_table]   # fails before the file is touched
+    _writeFixedFile(table_name, packed)
+
+def writeFixedRaw(table_name, rows):
+    """
+    Write packed records (tuples of integers, as returned by iterFixedRaw()) to the fixed-width file of a table, replacing the file.
+
+    :param table_name: The name of the table.
+    :param rows: An iterable of tuples of integers, in the schema order.
+    :raises struct.error: If a value doesn't fit its column.
+    """
+    layout = fixedLayout(table_name)
+    _writeFixedFile(table_name, [layout.pack(*row) for row in rows])
+
+def _writeFixedFile(table_name, packed):
+    """
+    Write the header and the packed records through a temporary file that replaces the file once it's complete.
+    """
+    header = FIXED_HEADER.pack(FIXED_MAGIC, fixedLayout(table_name).format.encode())
+    file_path = fixedTablePath(table_name)
+    with open(file_path + ".tmp", 'wb') as f:
+        f.write(header)
+        f.write(b''.join(packed))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(file_path + ".tmp", file_path)   # the mapped readers keep the old file until they close it
+
+def iterFixedRaw(table_name, start=0, stop=None):
+    """
+    Iterate over the packed records of a table, without copying the file into memory.
+    The records are unpacked straight from a memoryview of the mapped file.
+
+    :param table_name: The name of the table.
+    :param start: The first slot to read.
+    :param stop: The slot to stop at (not read), the end of the file when None.
+    :return: A generator of tuples of integers, in the schema order (dates as YYYYMMDD, sets as codes).
+    """
+    layout = fixedLayout(table_name)
+    with mapFixedTable(table_name) as (mm, count):
+        stop = count if stop is None else max(start, min(stop, count))
+        with memoryview(mm) as view:
+            body = view[FIXED_HEADER.size + start * layout.size:FIXED_HEADER.size + stop * layout.size]
+            try:
+                yield from layout.iter_unpack(body)
+            finally:
+                body.release()  # the mmap can only be closed after every view is released
+
+def iterFixedRecords(table_name):
+    """
+    Iterate over the records of a table stored in a fixed-width file.
+
+    :param table_name: The name of the table.
+    :return: A generator of records.
+    """
+    for values in iterFixedRaw(table_name):
+        yield unpackRecord(table_name, values)
+
+def readFixedTable(table_name):
+    """
+    Read all the records of a table stored in a fixed-width file.
+
+    :param table_name: The name of the table.
+    :return: The list of records.
+    """
+    return list(iterFixedRecords(table_name))
+
+def readFixedSlots(table_name, slots):
+    """
+    Read the packed records at the given slots (positions in the file, starting at 0).
+
+    :param table_name: The name of the table.
+    :param slots: An iterable of slot numbers, slots past the end of the file are skipped.
+    :return: A generator of tuples of integers, in the schema order.
+    """
+    layout = fixedLayout(table_name)
+    with mapFixedTable(table_name) as (mm, count):
+        for slot in slots:
+            if 0 <= slot < count:
+                yield layout.unpack_from(mm, FIXED_HEADER.size + slot * layout.size)
+
+##################
+# functions to read and write one record
+
+def fixedCount(table_name):
+    """
+    Get the number of records in a fixed-width file, from its size.
+
+    :param table_name: The name of the table.
+    :return: The number of records.
+    """
+    with mapFixedTable(table_name) as (mm, count):
+        return count
+
+def fixedSlotOf(table_name, record_id):
+    """
+    Find the slot (position in the file, starting at 0) of a record, by its 'id'.
+
+    :param table_name: The name of the table.
+    :param record_id: The 'id' of the record.
+    :return: The slot number, or None if the 'id' is not found.
+    """
+    with mapFixedTable(table_name) as (mm, count):
+        offset = _findOffset(table_name, mm, count, record_id)
+    if offset is None:
+        return None
+    return (offset - FIXED_HEADER.size) // fixedLayout(table_name).size
+
+def maxFixedId(table_name):
+    """
+    Get the highest 'id' in a fixed-width file, reading only the 'id' of each record.
+    The result is kept with the inode and the number of records of the file: the ids are never changed in place and
+    a rewritten file is a new inode, so next time only the records appended since are read.
+
+    :param table_name: The name of the table.
+    :return: The highest 'id', or 0 if the table is empty.
+    """
+    record_size = fixedLayout(table_name).size
+    id_struct, id_offset = _idField(table_name)
+    known = currentDatabase().state('mmap.max_ids')   # table_name -> (inode, number of records, highest 'id')
+    inode = os.stat(fixedTablePath(table_name)).st_ino
+    with mapFixedTable(table_name) as (mm, count):
+        first, max_id = 0, 0
+        if table_name in known and known[table_name][0] == inode and known[table_name][1] <= count:
+            first, max_id = known[table_name][1], known[table_name][2]
+        for slot in range(first, count):
+            max_id = max(max_id, id_struct.unpack_from(mm, FIXED_HEADER.size + slot * record_size + id_offset)[0])
+    known[table_name] = (inode, count, max_id)
+    return max_id
+
+def appendFixedRecord(table_name, record):
+    """
+    Append one record at the end of a fixed-width file, the rest of the file is not touched.
+
+    :param table_name: The name of the table.
+    :param record: The dictionary to append, with its 'id' already assigned.
+    :raises ValueError: If a value doesn't match its schema type.
+    """
+    appendFixedRecords(table_name, [record])
+
+def appendFixedRecords(table_name, records, sync=False):
+    """
+    Append records at the end of a fixed-width file with one write, the rest of the file is not touched.
+
+    :param table_name: The name of the table.
+    :param records: The dictionaries to append, with their 'id' already assigned.
+    :param sync: Wait until the records are on disk.
+    :raises ValueError: If a value doesn't match its schema type.
+    """
+    packed = b''.join(packRecord(table_name, record) for record in records)   # fails before the file is touched
+    with mapFixedTable(table_name) as (mm, count):
+        end_of_records = FIXED_HEADER.size + count * fixedLayout(table_name).size
+    with open(fixedTablePath(table_name), 'r+b') as f:
+        f.seek(end_of_records)  # overwrites a partial record, if there's one
+        f.write(packed)
+        f.truncate()
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+
+def getFixedRecord(table_name, record_id):
+    """
+    Read one record from a fixed-width file, by its 'id'.
+
+    :param table_name: The name of the table.
+    :param record_id: The 'id' of the record.
+    :return: The record, or None if the 'id' is not found.
+    """
+    layout = fixedLayout(table_name)
+    with mapFixedTable(table_name) as (mm, count):
+        offset = _findOffset(table_name, mm, count, record_id)
+        if offset is None:
+            return None
+        return unpackRecord(table_name, layout.unpack_from(mm, offset))
+
+def updateFixedRecord(table_name, record_id, update_info):
+    """
+    Update one record in a fixed-width file in place, see updateFixedRecords().
+
+    :param table_name: The name of the table.
+    :param record_id: The 'id' of the record.
+    :param update_info: A dictionary of fields to update with their new values, the 'id' is ignored.
+    :return: The updated record, or None if the 'id' is not found.
+    :raises ValueError: If a value doesn't match its schema type.
+    """
+    result = updateFixedRecords(table_name, [(record_id, update_info)])[0]
+    return None if result is None else result[1]
+
+def updateFixedRecords(table_name, updates):
+    """
+    Update records in a fixed-width file in place, in one mapped pass: only the bytes of the fields that changed
+    are written, and the pages holding them are flushed to disk once.
+    While a FixedFileView maps the file, the old bytes of each patched record are appended to the .undo file first,
+    so the view keeps reading the records as they were; otherwise the .undo file is emptied.
+
+    :param table_name: The name of the table.
+    :param updates: A list of (record_id, update_info), update_info being a dictionary of fields with their new values, the 'id' is ignored.
+    :return: A list with (old record, updated record) for each update, or None if its 'id' is not found.
+    :raises ValueError: If a value doesn't match its schema type, nothing is written then.
+    """
+    layout = fixedLayout(table_name)
+    results, patched = [], {}    # patched: offset -> new bytes of the record
+    with _pinned_guard, open(fixedTablePath(table_name), 'r+b') as guard, mapFixedTable(table_name, writable=True) as (mm, count):
+        if fcntl is not None:
+            fcntl.flock(guard.fileno(), fcntl.LOCK_EX)     # waits for a FixedFileView being opened
+        for record_id, update_info in updates:
+            offset = _findOffset(table_name, mm, count, record_id)
+            if offset is None:
+                results.append(None)
+                continue
+            old_bytes = patched.get(offset, mm[offset:offset + layout.size])
+            record = unpackRecord(table_name, layout.unpack(old_bytes))
+            record.update({key: value for key, value in update_info.items() if key != 'id'})
+            patched[offset] = packRecord(table_name, record)   # fails before the file is touched
+            results.append((unpackRecord(table_name, layout.unpack(old_bytes)), record))
+        if not patched:
+            return results
+
+        with open(fixedUndoPath(table_name), 'a+b') as undo:
+            if _viewsOpen(table_name, undo):
+                inode = os.fstat(guard.fileno()).st_ino
+                undo.write(b''.join(UNDO_ENTRY.pack(inode, (offset - FIXED_HEADER.size) // layout.size) + mm[offset:offset + layout.size]
+                                    for offset in patched))
+                undo.flush()    # before the records change, see FixedFileView._readUndo()
+            elif os.fstat(undo.fileno()).st_size:
+                undo.truncate(0)    # no view reads the old bytes anymore
+            ranges = _fieldRanges(table_name)
+            first = last = None
+            for offset, new_bytes in patched.items():
+                for key, start, end in ranges:
+                    if mm[offset + start:offset + end] != new_bytes[start:end]:
+                        mm[offset + start:offset + end] = new_bytes[start:end]
+                        first = offset + start if first is None else min(first, offset + start)
+                        last = offset + end if last is None else max(last, offset + end)
+            if first is not None:
+                # flush() needs an offset aligned to the allocation granularity
+                aligned = first - first % mmap.ALLOCATIONGRANULARITY
+                mm.flush(aligned, last - aligned)
+    return results
+
+##################
+# the end, fixed width
@@ -0,0 +1,230 @@
+# PrU_helper_profiles.py
+# a summary of each patient's appointments: count by status, lifetime spend, last and next visit
+
+# the profiles are built with one pass over the appointments (live and archived) the first time they're needed,
+# then kept up to date from each write to the appointments table (see addWriteListener() in PrU_helper_json.py)
+# a profile is only read again from the table when a change can't be applied on its own, e.g. its last visit was canceled
+# the writes made by other programs are read from the change feed (see PrU_helper_feed.py): only their patients are read again
+# the appointments are never read with _profiles_lock held: a query may finish an archive move, which takes the table locks,
+# and the writers hold those while they call _onAppointmentsWrite(), so the profiles are built first and swapped in under the lock
+
+import threading
+from datetime import datetime
+from PrU_helper_db import *
+from PrU_helper_json import *
+from PrU_helper_query import *
+
+PROFILE_APPOINTMENTS = 'appointment_join'   # the table the profiles are built from
+PROFILE_KEY = 'patient_id'                  # the FK key of the patient
+PROFILE_SPEND_STATUS = 'Done'               # the status of the appointments that count as spend and visits, as in the revenue report
+PROFILE_BOOKED_STATUS = 'Booked'            # the status of the appointments that count as next visits
+
+_profiles_lock = threading.RLock()
+
+##################
+# helper functions
+
+def _profileState():
+    """
+    Get the profiles kept for the current database (see PrU_helper_database.py), as a dictionary with
+    'profiles' (patient_id -> profile, None until built), 'stamp' (the version of the appointments table they match),
+    'feed_position' (their position in the change feed of the table), 'stale' (the patients whose profile must be read again from the table),
+    'writes' (the number of writes applied, to tell if a profile read from the table is still current), 'building' (the builds running)
+    and 'written' (the patients written by this program while they run, None if the whole table was).
+    """
+    return currentDatabase().state('profiles', lambda: {'profiles': None, 'stamp': None, 'feed_position': None, 'stale': set(),
+                                                        'writes': 0, 'building': 0, 'written': set()})
+
+def _newProfile():
+    return {'by_status': {}, 'spend': 0, 'last_visit': None, 'upcoming': []}
+
+def _status(value):
+    """
+    Get the spelling of a 'status' value used in the schema, from the value kept by a record or written in a json file.
+    """
+    member = setMember(PROFILE_APPOINTMENTS, 'status', value)
+    return value if member is None else member.name
+
+def _applyAppointment(profiles, appointment, sign, today):
+    """
+    Add (sign 1) or remove (sign -1) one appointment from the profile of its patient.
+    """
+    patient_id = appointment.get(PROFILE_KEY)
+    if patient_id is None:
+        return
+    profile = profiles.setdefault(patient_id, _newProfile())
+    status = _status(rawValue(appointment, 'status'))
+    booking_date = appointment.get('booking_date')
+    by_status = profile['by_status']
+    by_status[status] = by_status.get(status, 0) + sign
+    if by_status[status] <= 0:
+        del by_status[status]
+
+    if status == PROFILE_SPEND_STATUS:
+        profile['spend'] += sign * (appointment.get('price') or 0)
+        if sign > 0 and booking_date is not None and (profile['last_visit'] is None or booking_date > profile['last_visit']):
+            profile['last_visit'] = booking_date
+        elif sign < 0 and booking_date == profile['last_visit']:
+            _profileState()['stale'].add(patient_id)     # the visit before it is only in the table
+    elif status == PROFILE_BOOKED_STATUS and booking_date is not None and booking_date >= today:
+        if sign > 0:
+            profile['upcoming'].append(booking_date)
+            profile['upcoming'].sort()
+        elif booking_date in profile['upcoming']:
+            profile['upcoming'].remove(booking_date)
+
+def _buildProfiles():
+    """
+    Build every profile with one grouped pass over the appointments, and one index lookup for the upcoming ones.
+    """
+    today = datetime.today().strftime('%Y-%m-%d')
+    profiles = {}
+    grouped = (Query(PROFILE_APPOINTMENTS).withArchive()
+               .groupBy(PROFILE_KEY, 'status', appointments=('count', None), spend=('sum', 'price'), last_visit=('max', 'booking_date')))
+    for row in grouped:
+        if row[PROFILE_KEY] is None:
+            continue
+        profile = profiles.setdefault(row[PROFILE_KEY], _newProfile())
+        profile['by_status'][row['status']] = row['appointments']
+        if row['status'] == PROFILE_SPEND_STATUS:
+            profile['spend'] = row['spend']
+            profile['last_visit'] = row['last_visit']
+    upcoming = (Query(PROFILE_APPOINTMENTS)
+                .where('status', '==', PROFILE_BOOKED_STATUS)
+                .where('booking_date', '>=', today)
+                .select(PROFILE_KEY, 'booking_date'))
+    for row in upcoming:
+        if row[PROFILE_KEY] is not None:
+            profiles.setdefault(row[PROFILE_KEY], _newProfile())['upcoming'].append(row['booking_date'])
+    for profile in profiles.values():
+        profile['upcoming'].sort()
+    return profiles
+
+def _readPatient(patient_id):
+    """
+    Build the profile of one patient from the table, with the index of the patient key.
+    """
+    today = datetime.today().strftime('%Y-%m-%d')
+    profiles = {}
+    for appointment in Query(PROFILE_APPOINTMENTS).where(PROFILE_KEY, '==', patient_id).withArchive():
+        _applyAppointment(profiles, appointment, 1, today)
+    return profiles.get(patient_id, _newProfile())
+
+def _onAppointmentsWrite(table_name, changes):
+    """
+    Write listener of the appointments table: apply each change to the profiles, or drop them all if the changes are unknown.
+    """
+    state = _profileState()
+    with _profiles_lock:
+        state['writes'] += 1
+        if state['building'] and state['written'] is not None:
+            # the profiles being built may have read the appointments before or after this write
+            state['written'] = None if changes is None else state['written'].union(
+                appointment[PROFILE_KEY] for pair in changes for appointment in pair if appointment is not None and appointment.get(PROFILE_KEY) is not None)
+        if state['profiles'] is None:
+            return
+        if changes is None:
+            state['profiles'] = None    # rebuilt when next needed
+            return
+        today = datetime.today().strftime('%Y-%m-%d')
+        for old_record, new_record in changes:
+            if old_record is not None:
+                _applyAppointment(state['profiles'], old_record, -1, today)
+            if new_record is not None:
+                _applyAppointment(state['profiles'], new_record, 1, today)
+        # the stamp is moved on by patientProfiles(), once the change feed shows no write from another program in between
+
+def _readOtherWrites(state, stamp):
+    """
+    Mark the patients of the appointments written by other programs as stale, from the change feed of the table.
+    The writes made through this database were already applied by _onAppointmentsWrite().
+
+    :return: True if the profiles now match the stamp, False if they must be built again.
+    """
+    patch = patchChanges(PROFILE_APPOINTMENTS, state['feed_position'], state['stamp'], stamp)
+    if patch is None:
+        return False
+    entries, state['feed_position'] = patch
+    own = writerKey()
+    for entry in entries:
+        if entry['writer'] == own:
+            continue
+        for old_record, new_record in entry['changes']:
+            for appointment in (old_record, new_record):
+                if appointment is not None and appointment.get(PROFILE_KEY) is not None:
+                    state['stale'].add(appointment[PROFILE_KEY])
+    state['stamp'] = stamp
+    return True
+
+addWriteListener(PROFILE_APPOINTMENTS, _onAppointmentsWrite)
+
+##################
+# functions to read the profiles
+
+def patientProfiles():
+    """
+    Get the profiles of every patient, building them if they're missing or the table was changed by another program.
+    They're built without _profiles_lock, the writes made meanwhile by this program mark their patients as stale.
+
+    :return: A dictionary {patient_id: profile}, shared (don't change it).
+    """
+    state = _profileState()
+    with _profiles_lock:
+        stamp = tableVersion(PROFILE_APPOINTMENTS)
+        if state['profiles'] is not None and (state['stamp'] == stamp or _readOtherWrites(state, stamp)):
+            return state['profiles']
+        if not state['building']:
+            state['written'] = set()
+        state['building'] += 1
+
+    try:
+        feed_position = feedPosition(PROFILE_APPOINTMENTS)  # before building, see feedPosition()
+        profiles = _buildProfiles()
+    except BaseException:
+        with _profiles_lock:
+            state['building'] -= 1
+        raise
+
+    with _profiles_lock:
+        state['building'] -= 1
+        if state['written'] is None:
+            return profiles     # the whole table was written while building, they're built again next time
+        # the writes of other programs made while building are read from the feed next time, see _readOtherWrites()
+        state['profiles'], state['stamp'], state['feed_position'] = profiles, stamp, feed_position
+        state['stale'] = set(state['written'])
+        state['writes'] += 1
+        return profiles
+
+def getPatientProfile(patient_id):
+    """
+    Get the summary of a patient's appointments.
+
+    :param patient_id: The 'id' of the patient.
+    :return: A dictionary with 'appointments' (the total), 'by_status' ({status: count}), 'spend' (sum of the prices of the
+             'Done' appointments), 'last_visit' (the date of the last 'Done' appointment) and 'next_visit' (the first 'Booked'
+             date from today on), the dates in the format 'YYYY-MM-DD' or None.
+    """
+    state = _profileState()
+    profiles = patientProfiles()
+    with _profiles_lock:
+        profile = profiles.get(patient_id, _newProfile())
+        writes = state['writes']
+        stale = patient_id in state['stale']
+    if stale:
+        profile = _readPatient(patient_id)     # without the lock, see patientProfiles()
+        with _profiles_lock:
+            if state['writes'] == writes and state['profiles'] is profiles:    # no write since it was read
+                profiles[patient_id] = profile
+                state['stale'].discard(patient_id)
+    today = datetime.today().strftime('%Y-%m-%d')
+    with _profiles_lock:
+        return {
+            'appointments': sum(profile['by_status'].values()),
+            'by_status': dict(profile['by_status']),
+            'spend': profile['spend'],
+            'last_visit': profile['last_visit'],
+            'next_visit': next((booking_date for booking_date in profile['upcoming'] if booking_date >= today), None)
+        }
+
+##################
+# know your patients
@@ -0,0 +1,826 @@
+# PrU_helper_query.py
+# a small query engine for the tables in my_db_tables
+
+# build a query by chaining calls, e.g.
+#   Query('appointment_join').where('booking_date', '==', '2024-05-01').orderBy('id').run()
+# the values in where() are written as in the json files, they're converted to the values kept in the records
+# (dates as YYYYMMDD integers, 'set' values as IntEnum members) so each row is compared without building strings
+# the planner uses the indexes listed in my_db_indexes, and falls back to a streaming scan of the table
+# join() adds columns from the tables referenced by the ("FK", (table, display_key)) keys in the schema
+# with Query(table_name, snapshot) every table is read from a pinned snapshot (see PrU_helper_snapshot.py),
+# otherwise fixed-width tables are streamed from their file and json tables from their newest version
+# the snapshot of a fixed-width table maps the file it pinned, so it's read packed too, and shares the indexes of the file while it's not written
+
+import heapq
+from bisect import bisect_left, bisect_right
+from enum import IntEnum
+from PrU_helper_db import *
+from PrU_helper_json import *
+from PrU_helper_feed import *
+from PrU_helper_snapshot import *
+from PrU_helper_archive import *
+
+QUERY_OPERATORS = ('==', '!=', '<', '<=', '>', '>=', 'in', 'between')
+QUERY_AGGREGATES = ('sum', 'count', 'min', 'max')
+RANGE_OPERATORS = ('<', '<=', '>', '>=', 'between')
+JOIN_CHUNK_SIZE = 10000     # the most rows kept in the hash table of a join
+
+# the indexes of the fixed-width files are kept by the current database (see PrU_helper_database.py), as
+# (table_name, key) -> (version, {value: [positions]}, sorted list of values, position in the change feed)
+                    # the indexes of the records in memory are kept in their TableVersion
+
+##################
+# helper functions
+
+def tableRows(table_name, snapshot=None):
+    """
+    Get the records of a table, from the snapshot or from the newest version of the table.
+    The records are shared by every query, they must not be changed (use updateJRecord()).
+
+    :param table_name: The name of the table.
+    :param snapshot: A Snapshot holding the table, or None.
+    :return: The tuple of records.
+    """
+    return _memoryVersion(table_name, snapshot).rows
+
+def _memoryVersion(table_name, snapshot=None):
+    """
+    Get the TableVersion the records of a table are read from.
+    """
+    if snapshot is not None and table_name in snapshot.tables:
+        return snapshot.version(table_name)
+    return latestVersion(table_name)
+
+def _mappedVersion(table_name, snapshot=None):
+    """
+    Get the TableVersion of a fixed-width table in the snapshot, mapping the file it pinned, or None to read the current file.
+    """
+    if snapshot is not None and table_name in snapshot.tables and snapshot.version(table_name).isMapped():
+        return snapshot.version(table_name)
+    return None
+
+def _isPacked(table_name, snapshot=None):
+    """
+    Check if the rows of a table are read packed from its fixed-width file (or the one pinned by the snapshot), instead of as records in memory.
+    """
+    if snapshot is not None and table_name in snapshot.tables:
+        return snapshot.version(table_name).isMapped()
+    return isFixedWidthTable(table_name)
+
+def _scanRaw(table_name, snapshot=None):
+    """
+    Stream the rows of a table with their positions, as (position, row).
+    Fixed-width rows are tuples of integers (no record is built), the other rows are records.
+    """
+    if _isPacked(table_name, snapshot):
+        version = _mappedVersion(table_name, snapshot)
+        if version is not None:
+            yield from enumerate(version.rows.raw())
+            return
+        try:
+            yield from enumerate(iterFixedRaw(table_name))
+        except FileNotFoundError:
+            return
+    else:
+        yield from enumerate(tableRows(table_name, snapshot))
+
+def _fetchRaw(table_name, positions, snapshot=None):
+    """
+    Get the rows of a table at the given positions, as (position, row).
+    """
+    if _isPacked(table_name, snapshot):
+        version = _mappedVersion(table_name, snapshot)
+        yield from zip(positions, readFixedSlots(table_name, positions) if version is None else version.rows.rawSlots(positions))
+    else:
+        rows = tableRows(table_name, snapshot)
+        for position in positions:
+            yield position, rows[position]
+
+def _getter(table_name, key, snapshot=None):
+    """
+    Get a function that reads the value of a key from a row returned by _scanRaw().
+    """
+    if _isPacked(table_name, snapshot):
+        schema = my_db_schema[table_name]
+        column = list(schema).index(key)
+        null = NULL_INT if schema[key][0] == 'int' else NULL_CODE
+        return lambda row: None if row[column] == null else row[column]
+    return _recordGetter(key)
+
+def _recordGetter(key):
+    """
+    Get a function that reads the value kept in a record for a key (dates as integers, 'set' values as IntEnum members).
+    """
+    return lambda record: getattr(record, key, None) if key in record._types else record.get(key)
+
+def _decode(table_name, key, value):
+    """
+    Convert a value kept in a record back to the value written in the json files.
+    """
+    match my_db_schema[table_name][key][0]:
+        case 'date':
+            return decodeDate(value) if type(value) is int else value
+        case 'set':
+            if isinstance(value, IntEnum):
+                return value.name
+            return setEnum(table_name, key)(value).name if type(value) is int else value   # a code read from a fixed-width file
+        case _:
+            return value
+
+def _toRecord(table_name, row, snapshot=None):
+    """
+    Convert a row returned by _scanRaw() to a record.
+    """
+    if _isPacked(table_name, snapshot):
+        return recordClass(table_name).fromPacked(row)
+    return row
+
+def _matches(value, op, literal):
+    """
+    Compare the value from a row with the literal from a where() clause.
+    Values that can't be compared, e.g. None or an invalid date kept as a string, don't match.
+    """
+    try:
+        match op:
+            case '==':
+                return value == literal
+            case '!=':
+                return value != literal
+            case 'in':
+                return value in literal
+            case 'between':
+                return value is not None and literal[0] <= value <= literal[1]
+            case '<':
+                return value is not None and value < literal
+            case '<=':
+                return value is not None and value <= literal
+            case '>':
+                return value is not None and value > literal
+            case '>=':
+                return value is not None and value >= literal
+    except TypeError:
+        return False
+
+def _sortKey(getters, row):
+    """
+    Key used to sort rows, None values go last.
+    """
+    return tuple((value is None, value) for value in (get(row) for get in getters))
+
+##################
+# functions to manage the indexes
+
+def getIndex(table_name, key, build=True, snapshot=None):
+    """
+    Get the index of a key, built from the current version of the table (or from its version in the snapshot).
+
+    :param table_name: The name of the table.
+    :param key: The key to index.
+    :param build: Build the index if it's missing or out of date, and the key is listed in my_db_indexes.
+    :param snapshot: A Snapshot holding the table, or None.
+    :return: A tuple ({value: [positions]}, sorted list of values or None), or None if there's no usable index.
+    """
+    version = _mappedVersion(table_name, snapshot)
+    if version is not None:
+        cached = version.indexes.get(key)
+        if cached is not None:
+            return cached
+        if tableVersion(table_name) == version.stamp:
+            # the file wasn't written since the snapshot was pinned, the index kept for the current file fits it
+            index = getIndex(table_name, key, build)
+            cached = currentDatabase().indexes.get((table_name, key))
+            if index is not None and cached is not None and cached[0] == version.stamp and cached[1] is index[0]:
+                version.indexes[key] = index
+                return index
+    elif _isPacked(table_name, snapshot):
+        cached = currentDatabase().indexes.get((table_name, key))
+        if cached is not None:
+            stamp = tableVersion(table_name)
+            if cached[0] == stamp:
+                return cached[1], cached[2]
+            patched = _patchPackedIndex(table_name, key, cached, stamp)     # only the rows written since it was built
+            if patched is not None:
+                currentDatabase().indexes[(table_name, key)] = patched
+                return patched[1], patched[2]
+    else:
+        cached = _memoryVersion(table_name, snapshot).indexes.get(key)
+        if cached is not None:
+            return cached
+    if not build or key not in my_db_indexes.get(table_name, []):
+        return None
+    return createIndex(table_name, key, snapshot)
+
+def createIndex(table_name, key, snapshot=None):
+    """
+    Build the index of a key with one pass over the table, replacing the old one.
+    Every key gets a hash index ({value: [positions]}), and 'int', 'date' and 'FK' keys also get
+    the sorted list of their values, used for ranges.
+
+    :param table_name: The name of the table.
+    :param key: The key to index, it must be in the schema.
+    :param snapshot: A Snapshot holding the table, or None.
+    :return: A tuple ({value: [positions]}, sorted list of values or None).
+    """
+    stamp = tableVersion(table_name)
+    feed_position = feedPosition(table_name)
+    packed_file = _isPacked(table_name, snapshot) and _mappedVersion(table_name, snapshot) is None
+    memory_version = None if packed_file else _memoryVersion(table_name, snapshot)
+    get = _getter(table_name, key, snapshot)
+    positions = {}
+    for position, row in _scanRaw(table_name, snapshot):
+        positions.setdefault(get(row), []).append(position)
+    values = None
+    if my_db_schema[table_name][key][0] in ('int', 'date', 'FK'):
+        values = sorted(value for value in positions if type(value) is int)
+    if memory_version is None:
+        currentDatabase().indexes[(table_name, key)] = (stamp, positions, values, feed_position)
+    else:
+        memory_version.indexes[key] = (positions, values)   # dropped with the version
+    return positions, values
+
+def _patchPackedIndex(table_name, key, cached, stamp):
+    """
+    Bring the index of a fixed-width file up to date with the change feed of the table, see patchChanges().
+
+    :return: The new cached index, or None if it must be built again.
+    """
+    old_stamp, positions, values, feed_position = cached
+    patch = patchChanges(table_name, feed_position, old_stamp, stamp)
+    if patch is None:
+        return None
+    entries, feed_position = patch
+    get = _getter(table_name, key)
+    layout = fixedLayout(table_name)
+    moves = []
+    try:
+        for entry in entries:
+            for old_record, new_record in entry['changes']:
+                slot = None if new_record is None else fixedSlotOf(table_name, new_record['id'])
+                if slot is None:
+                    return None     # a deleted record, the slots have moved
+                old_values = [] if old_record is None else [get(layout.unpack(packRecord(table_name, old_record)))]
+                moves.append((slot, old_values, get(layout.unpack(packRecord(table_name, new_record)))))
+    except (KeyError, ValueError):
+        return None
+    positions, values = patchIndex((positions, values), moves)
+    return stamp, positions, values, feed_position
+
+def dropIndexes(table_name=None):
+    """
+    Discard the indexes of the fixed-width files of a table, or of every table.
+    The indexes of the records in memory go away with their TableVersion.
+
+    :param table_name: The name of the table, or None for every table.
+    """
+    indexes = currentDatabase().indexes
+    for index_key in list(indexes):
+        if table_name is None or index_key[0] == table_name:
+            del indexes[index_key]
+
+def _lookup(index, op, literal):
+    """
+    Get the positions matching a where() clause from an index.
+
+    :return: The list of positions, or None if the index can't answer this operator.
+    """
+    positions, values = index
+    match op:
+        case '==':
+            return list(positions.get(literal, []))
+        case 'in':
+            return [position for value in literal for position in positions.get(value, [])]
+    if values is None or op not in RANGE_OPERATORS:
+        return None
+    match op:
+        case 'between':
+            start, end = bisect_left(values, literal[0]), bisect_right(values, literal[1])
+        case '<':
+            start, end = 0, bisect_left(values, literal)
+        case '<=':
+            start, end = 0, bisect_right(values, literal)
+        case '>':
+            start, end = bisect_right(values, literal), len(values)
+        case '>=':
+            start, end = bisect_left(values, literal), len(values)
+    return [position for value in values[start:end] for position in positions[value]]
+
+##################
+# functions to join tables through their FK keys
+
+def foreignKeys(table_name):
+    """
+    Get the FK keys of a table, from my_db_schema.
+
+    :param table_name: The name of the table.
+    :return: A dictionary {key: (referenced table, display key)}, empty if the table has no FK keys.
+    """
+    return {key: value_type[1] for key, value_type in my_db_schema.get(table_name, {}).items() if value_type[0] == 'FK'}
+
+def tableSize(table_name, snapshot=None):
+    """
+    Get the number of records in a table, fixed-width tables are not read, only their file size.
+
+    :param table_name: The name of the table.
+    :param snapshot: A Snapshot holding the table, or None.
+    :return: The number of records.
+    """
+    if _isPacked(table_name, snapshot) and _mappedVersion(table_name, snapshot) is None:
+        try:
+            return fixedCount(table_name)
+        except FileNotFoundError:
+            return 0
+    return len(tableRows(table_name, snapshot))
+
+def joinedKey(fk_key, column):
+    """
+    Get the name given to a joined column, e.g. ('patient_id', 'name') -> 'patient_name'.
+    """
+    prefix = fk_key[:-3] if fk_key.endswith('_id') else fk_key
+    return f"{prefix}_{column}"
+
+def _projectTargets(target_table, columns, wanted=None, snapshot=None, index=None):
+    """
+    Build the hash table {id: {column: value}} of the referenced table, streaming it.
+    With wanted, only those ids are kept, read through the 'id' index when it's given.
+    """
+    id_get = _getter(target_table, 'id', snapshot)
+    if wanted is not None and index is not None:
+        source = _fetchRaw(target_table, sorted(position for value in wanted for position in index[0].get(value, [])), snapshot)
+    else:
+        source = _scanRaw(target_table, snapshot)
+    lookup = {}
+    for position, row in source:
+        row_id = id_get(row)
+        if wanted is None or row_id in wanted:
+            record = _toRecord(target_table, row, snapshot)
+            lookup[row_id] = {column: record.get(column) for column in columns}
+    return lookup
+
+def hashJoin(rows, table_name, fk_key, columns=None, chunk_size=JOIN_CHUNK_SIZE, key=None, snapshot=None):
+    """
+    Join rows of a table with the table referenced by one of its FK keys.
+    The hash table is built on the smaller side: the referenced table when it has at most chunk_size records,
+    otherwise each chunk of chunk_size rows, looking up only the ids it needs through the 'id' index of the referenced
+    table (built once, before the first chunk). Either way the hash table stays bounded by chunk_size, and the rows
+    are streamed in their original order.
+
+    :param rows: An iterable of records (or dictionaries) of table_name.
+    :param table_name: The name of the table the rows belong to.
+    :param fk_key: A key with the type ("FK", (table, display_key)) in the schema of table_name.
+    :param columns: The keys to take from the referenced table, the display_key when None.
+    :param chunk_size: The most rows kept in the hash table.
+    :param key: A function that reads the FK value from a row, row.get(fk_key) when None.
+    :param snapshot: Read the referenced table from this Snapshot, or None.
+    :return: A generator of (row, {column: value}) tuples, with None instead of the dictionary when the FK doesn't match a record.
+    """
+    fk_keys = foreignKeys(table_name)
+    if fk_key not in fk_keys:
+        raise ValueError(f"The key {fk_key} is not an FK key of the {table_name} table")
+    target_table, display_key = fk_keys[fk_key]
+    columns = tuple(columns) if columns else (display_key,)
+    key = key or (lambda row: row.get(fk_key))
+
+    if tableSize(target_table, snapshot) <= chunk_size:
+        lookup = _projectTargets(target_table, columns, snapshot=snapshot)
+        for row in rows:
+            yield row, lookup.get(key(row))
+        return
+
+    # the 'id' index of the referenced table is got once, each chunk then reads only the records it needs
+    index = getIndex(target_table, 'id', snapshot=snapshot) or createIndex(target_table, 'id', snapshot)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield from _joinChunk(chunk, target_table, columns, key, snapshot, index)
+            chunk = []
+    yield from _joinChunk(chunk, target_table, columns, key, snapshot, index)
+
+def _joinChunk(chunk, target_table, columns, key, snapshot=None, index=None):
+    """
+    Join one chunk of rows, with a hash table holding only the ids used by the chunk.
+    """
+    if not chunk:
+        return
+    wanted = {key(row) for row in chunk} - {None}
+    lookup = _projectTargets(target_table, columns, wanted, snapshot, index)
+    for row in chunk:
+        yield row, lookup.get(key(row))
+
+##################
+# the query
+
+class Query:
+    """
+    A query over one table in my_db_tables, built by chaining where(), select(), orderBy(), limit() and groupBy().
+    Run it with run(), or iterate over it to get the rows one at a time.
+    With a snapshot, the table and the joined tables are read from it (see pinSnapshot()).
+    """
+
+    def __init__(self, table_name, snapshot=None):
+        if table_name not in my_db_schema:
+            raise ValueError(f"The table {table_name} is not in my_db_schema")
+        self.table_name = table_name
+        self.snapshot = snapshot
+        self._schema = my_db_schema[table_name]
+        self._filters = []          # (key, op, literal) with the literals converted
+        self._columns = None        # keys for select()
+        self._order = None          # (keys, descending)
+        self._limit = None
+        self._group = None          # (keys, {name: (function, key)})
+        self._joins = []            # (fk_key, columns)
+        self._archive = False       # also read the archive segments, see withArchive()
+
+    def _checkKey(self, key):
+        if key not in self._schema:
+            raise ValueError(f"The key {key} is not in the schema of the {self.table_name} table")
+
+    def _convert(self, key, value):
+        """
+        Convert a value written as in the json files to the value kept in the records.
+        """
+        if value is None:
+            return None
+        match self._schema[key][0]:
+            case 'date':
+                return encodeDate(value) if isinstance(value, str) else value
+            case 'set':
+                member = setMember(self.table_name, key, value)     # a value of any case, a code or a member
+                if member is None:
+                    raise ValueError(f"'{value}' is not one of {self._schema[key][1]}")
+                return member
+            case _:
+                return value
+
+    def where(self, key, op, value):
+        """
+        Keep only the rows where the key matches the value, every where() must match.
+
+        :param key: A key in the schema.
+        :param op: One of '==', '!=', '<', '<=', '>', '>=', 'in' (value is a list) or 'between' (value is a (start, end) tuple, both included).
+        :param value: The value to compare with, written as in the json files (e.g. '2024-05-01', 'Done').
+        :return: The query, to chain more calls.
+        """
+        self._checkKey(key)
+        if op not in QUERY_OPERATORS:
+            raise ValueError(f"Unsupported operator: {op}, use one of {QUERY_OPERATORS}")
+        match op:
+            case 'in':
+                literal = frozenset(self._convert(key, item) for item in value)
+            case 'between':
+                literal = (self._convert(key, value[0]), self._convert(key, value[1]))
+            case _:
+                literal = self._convert(key, value)
+        self._filters.append((key, op, literal))
+        return self
+
+    def select(self, *keys):
+        """
+        Return only these keys, as dictionaries. Without select() the rows are the records.
+        """
+        for key in keys:
+            self._checkKey(key)
+        self._columns = keys
+        return self
+
+    def orderBy(self, *keys, descending=False):
+        """
+        Sort the rows by these keys, None values go last.
+        After groupBy() the keys can also be the names of the aggregates.
+        """
+        self._order = (keys, descending)
+        return self
+
+    def limit(self, count):
+        """
+        Return at most this number of rows.
+        """
+        self._limit = count
+        return self
+
+    def join(self, fk_key, *columns):
+        """
+        Add columns from the table referenced by an FK key, see hashJoin().
+        The rows are returned as dictionaries, each joined column is named by joinedKey(), e.g. 'patient_name'.
+        The value is None when the FK doesn't match a record.
+
+        :param fk_key: A key with the type ("FK", (table, display_key)) in the schema.
+        :param columns: The keys to take from the referenced table, the display_key when none are given.
+        :return: The query, to chain more calls.
+        """
+        if fk_key not in foreignKeys(self.table_name):
+            raise ValueError(f"The key {fk_key} is not an FK key of the {self.table_name} table")
+        target_table, display_key = foreignKeys(self.table_name)[fk_key]
+        columns = columns or (display_key,)
+        for column in columns:
+            if column not in my_db_schema[target_table]:
+                raise ValueError(f"The key {column} is not in the schema of the {target_table} table")
+        self._joins.append((fk_key, columns))
+        return self
+
+    def withArchive(self):
+        """
+        Also return the archived records of the table (see PrU_helper_archive.py), after the live ones.
+        Only the segments that can hold rows matching the where() clauses on the date key of the archive are read,
+        so a query on recent dates reads none.
+
+        :return: The query, to chain more calls.
+        """
+        self._archive = self.table_name in my_db_archives
+        return self
+
+    def _archiveRange(self):
+        """
+        Get the range of dates ('YYYY-MM-DD' or None) allowed by the where() clauses on the date key of the archive.
+        """
+        date_key = my_db_archives[self.table_name][0]
+        start, end = None, None
+        for key, op, literal in self._filters:
+            if key != date_key:
+                continue
+            match op:
+                case '==':
+                    low, high = literal, literal
+                case 'between':
+                    low, high = literal
+                case 'in':
+                    low, high = (min(literal), max(literal)) if literal else (0, -1)
+                case '<' | '<=':
+                    low, high = None, literal
+                case '>' | '>=':
+                    low, high = literal, None
+                case _:
+                    continue
+            if type(low) is int:
+                start = low if start is None else max(start, low)
+            if type(high) is int:
+                end = high if end is None else min(end, high)
+        return (decodeDate(start) if start is not None else None, decodeDate(end) if end is not None else None)
+
+    def groupBy(self, *keys, **aggregates):
+        """
+        Group the rows by these keys (none for a single group) and compute the aggregates for each group.
+
+        :param keys: Keys in the schema.
+        :param aggregates: name=(function, key), the function is one of 'sum', 'count', 'min' or 'max',
+                           the key can be None for 'count' to count the rows.
+        :return: The query, each row returned is a dictionary with the keys and the aggregates.
+        """
+        for key in keys:
+            self._checkKey(key)
+        for name, (function, key) in aggregates.items():
+            if function not in QUERY_AGGREGATES:
+                raise ValueError(f"Unsupported aggregate: {function}, use one of {QUERY_AGGREGATES}")
+            if key is not None:
+                self._checkKey(key)
+        self._group = (keys, aggregates)
+        return self
+
+    ##################
+    # planning
+
+    def _plan(self):
+        """
+        Choose how to find the rows: the index that returns the fewest positions, or a full scan.
+
+        :return: A dictionary with 'access' ('index', 'id' or 'scan'), 'key', 'op', 'positions' and 'residual' (the where() clauses still to check).
+        """
+        fixed = _isPacked(self.table_name, self.snapshot)
+        best = None
+        for number, (key, op, literal) in enumerate(self._filters):
+            index = getIndex(self.table_name, key, snapshot=self.snapshot)
+            if index is not None:
+                positions = _lookup(index, op, literal)
+                access = 'index'
+            elif fixed and key == 'id' and op == '==':
+                version = _mappedVersion(self.table_name, self.snapshot)
+                try:
+                    if type(literal) is not int:
+                        slot = None
+                    elif version is not None:
+                        slot = version.rows.slotOf(literal)
+                    else:
+                        slot = fixedSlotOf(self.table_name, literal)    # direct probe in the mapped file
+                except FileNotFoundError:
+                    slot = None
+                positions = [] if slot is None else [slot]
+                access = 'id'
+            else:
+                continue
+            if positions is not None and (best is None or len(positions) < len(best['positions'])):
+                best = {'access': access, 'key': key, 'op': op, 'positions': sorted(positions), 'clause': number}
+        if best is None:
+            return {'access': 'scan', 'residual': list(self._filters)}
+        best['residual'] = [clause for number, clause in enumerate(self._filters) if number != best['clause']]
+        return best
+
+    def explain(self):
+        """
+        Describe how the query will run, without running it.
+
+        :return: A string, one step per line.
+        """
+        plan = self._plan()
+        if self.snapshot is not None and self.table_name in self.snapshot.tables:
+            version = self.snapshot.version(self.table_name)
+            storage = f"snapshot version {version.number}" + (", mapped fixed-width file" if version.isMapped() else "")
+        else:
+            storage = 'fixed-width mmap' if isFixedWidthTable(self.table_name) else 'json'
+        match plan['access']:
+            case 'scan':
+                steps = [f"Full scan of {self.table_name} ({storage}, streaming)"]
+            case 'id':
+                steps = [f"Id probe in {self.table_name} ({storage}): {len(plan['positions'])} row(s)"]
+            case _:
+                kind = 'range' if plan['op'] in RANGE_OPERATORS else 'hash'
+                steps = [f"Index {kind} lookup on {self.table_name}.{plan['key']} {plan['op']}: {len(plan['positions'])} row(s) ({storage})"]
+        for key, op, literal in plan['residual']:
+            if op in ('in', 'between'):
+                shown = [_decode(self.table_name, key, item) for item in literal]
+            else:
+                shown = _decode(self.table_name, key, literal)
+            steps.append(f"Filter: {key} {op} {shown!r}")
+        if self._archive:
+            segments = archiveSegments(self.table_name, *self._archiveRange())
+            rows = sum(segment['rows'] for segment in segments)
+            steps.append(f"Union with the archive: {len(segments)} segment(s), {rows} row(s) to filter")
+        if self._group is not None:
+            keys, aggregates = self._group
+            names = ', '.join(f"{name}={function}({key or '*'})" for name, (function, key) in aggregates.items())
+            steps.append(f"Group by: ({', '.join(keys)}) computing {names}")
+        elif self._columns is not None:
+            steps.append(f"Select: {', '.join(self._columns)}")
+        if self._group is None:
+            for fk_key, columns in self._joins:
+                target_table = foreignKeys(self.table_name)[fk_key][0]
+                side = target_table if tableSize(target_table, self.snapshot) <= JOIN_CHUNK_SIZE else f"chunks of {JOIN_CHUNK_SIZE} rows"
+                steps.append(f"Hash join: {fk_key} -> {target_table}.id, taking {', '.join(columns)} (hash table on {side})")
+        if self._order is not None:
+            keys, descending = self._order
+            how = 'top-N heap' if self._limit is not None else 'sort'
+            steps.append(f"Order by: {', '.join(keys)}{' descending' if descending else ''} ({how})")
+        if self._limit is not None:
+            steps.append(f"Limit: {self._limit}")
+        return '\n'.join(steps)
+
+    ##################
+    # running
+
+    def _liveRows(self, live_ids=None):
+        """
+        Stream the rows of the live table matching every where() clause, as returned by _scanRaw() (no record is built).
+
+        :param live_ids: A set to add the 'id' of each row to, or None.
+        """
+        plan = self._plan()
+        if plan['access'] == 'scan':
+            source = _scanRaw(self.table_name, self.snapshot)
+        else:
+            source = _fetchRaw(self.table_name, plan['positions'], self.snapshot)
+        checks = [(_getter(self.table_name, key, self.snapshot), op, literal) for key, op, literal in plan['residual']]
+        id_get = _getter(self.table_name, 'id', self.snapshot)
+        for position, row in source:
+            if all(_matches(get(row), op, literal) for get, op, literal in checks):
+                if live_ids is not None:
+                    live_ids.add(id_get(row))
+                yield row
+
+    def _archivedRows(self, live_ids):
+        """
+        Stream the archived records matching every where() clause, skipping any the live table already returned
+        (e.g. from a snapshot pinned before they were moved). Run it after _liveRows() has filled live_ids.
+        """
+        checks = [(_recordGetter(key), op, literal) for key, op, literal in self._filters]
+        for record in iterArchive(self.table_name, *self._archiveRange()):
+            if record['id'] not in live_ids and all(_matches(get(record), op, literal) for get, op, literal in checks):
+                yield record
+
+    def _sources(self):
+        """
+        Get the rows matching every where() clause, as a list of (rows, function giving the getter of a key for those rows):
+        the live rows as returned by _scanRaw(), then the archived records with withArchive().
+        """
+        live_ids = set() if self._archive else None
+        sources = [(self._liveRows(live_ids), lambda key: _getter(self.table_name, key, self.snapshot))]
+        if self._archive:
+            sources.append((self._archivedRows(live_ids), _recordGetter))
+        return sources
+
+    def _iterRows(self):
+        """
+        Stream the rows matching every where() clause, as records.
+        """
+        sources = self._sources()
+        for row in sources[0][0]:
+            yield _toRecord(self.table_name, row, self.snapshot)
+        for rows, makeGetter in sources[1:]:
+            yield from rows     # the archived rows are records already
+
+    def _iterGroups(self):
+        """
+        Aggregate the matching rows in one pass, keeping only one accumulator per group.
+        Fixed-width rows are aggregated on their packed integers, no record is built; the groups and the
+        values kept are decoded only once, at the end ('set' codes and IntEnum members are equal, so they share groups).
+        """
+        keys, aggregates = self._group
+        groups = {}
+        for rows, makeGetter in self._sources():
+            group_getters = [makeGetter(key) for key in keys]
+            value_getters = {name: (lambda row: 1) if key is None else makeGetter(key) for name, (function, key) in aggregates.items()}
+            for row in rows:
+                group = tuple(get(row) for get in group_getters)
+                totals = groups.get(group)
+                if totals is None:
+                    totals = groups[group] = {name: (0 if function in ('sum', 'count') else None) for name, (function, key) in aggregates.items()}
+                for name, (function, key) in aggregates.items():
+                    value = value_getters[name](row)
+                    if value is None:
+                        continue
+                    match function:
+                        case 'count':
+                            totals[name] += 1
+                        case 'sum':
+                            totals[name] += value
+                        case 'min':
+                            totals[name] = value if totals[name] is None else min(totals[name], value)
+                        case 'max':
+                            totals[name] = value if totals[name] is None else max(totals[name], value)
+        if not groups and not keys:     # a single group, even without rows
+            groups[()] = {name: (0 if function in ('sum', 'count') else None) for name, (function, key) in aggregates.items()}
+        for group, totals in groups.items():
+            row = {key: _decode(self.table_name, key, value) for key, value in zip(keys, group)}
+            for name, (function, key) in aggregates.items():
+                row[name] = totals[name] if function in ('sum', 'count') else _decode(self.table_name, key, totals[name])
+            yield row
+
+    def __iter__(self):
+        order_keys = self._order[0] if self._order else ()
+        if self._group is not None:
+            rows = self._iterGroups()
+            getters = [(lambda key: lambda row: row.get(key))(key) for key in order_keys]
+        else:
+            rows = self._iterRows()
+            getters = [_recordGetter(key) for key in order_keys]
+
+        if self._order is not None:
+            descending = self._order[1]
+            sort_key = lambda row: _sortKey(getters, row)
+            if self._limit is not None:     # keeps only limit rows in memory
+                rows = (heapq.nlargest if descending else heapq.nsmallest)(self._limit, rows, key=sort_key)
+            else:
+                rows = sorted(rows, key=sort_key, reverse=descending)
+        elif self._limit is not None:
+            rows = (row for _, row in zip(range(self._limit), rows))
+
+        if self._group is not None:
+            yield from rows
+            return
+        if not self._joins and self._columns is None:
+            yield from rows
+            return
+
+        pairs = ((row, {}) for row in rows)     # (record, joined columns)
+        for fk_key, columns in self._joins:
+            pairs = self._joinRows(pairs, fk_key, columns)
+        for row, joined in pairs:
+            if self._columns is not None:
+                output = {key: row.get(key) for key in self._columns}
+            else:
+                output = dict(row)
+            output.update(joined)
+            yield output
+
+    def _joinRows(self, pairs, fk_key, columns):
+        """
+        Add the joined columns of one FK key to each (record, joined columns) pair, see join().
+        """
+        for (row, joined), values in hashJoin(pairs, self.table_name, fk_key, columns, key=lambda pair: pair[0].get(fk_key), snapshot=self.snapshot):
+            for column in columns:
+                joined[joinedKey(fk_key, column)] = values[column] if values else None
+            yield row, joined
+
+    def run(self):
+        """
+        Run the query.
+
+        :return: The list of rows, records without select() and groupBy(), dictionaries otherwise.
+        """
+        return list(self)
+
+    def aggregate(self, **aggregates):
+        """
+        Compute aggregates over every matching row, e.g. aggregate(total=('sum', 'price')).
+
+        :return: A dictionary with one value per aggregate.
+        """
+        self.groupBy(**aggregates)
+        return self.run()[0]
+
+    def count(self):
+        """
+        Count the matching rows.
+        """
+        return self.aggregate(rows=('count', None))['rows']
+
+##################
+# every query has an end
@@ -0,0 +1,267 @@
+# PrU_helper_records.py
+# compact record classes, generated from my_db_schema
+
+# each table gets its own class with one slot per key in the schema, instead of a dict per record
+# dates are kept as integers YYYYMMDD and 'set' values as members of a small IntEnum (one object per value)
+# the records still read and write like dictionaries, giving back the same values found in the json files
+# loops that compare values use raw() (or rawValue()) and setMember(): integers are compared, nothing is decoded
+
+import keyword
+import sys
+from collections.abc import MutableMapping
+from enum import IntEnum
+from PrU_helper_db import *
+from PrU_helper_codec import *
+
+_record_classes = {}    # table_name -> record class
+_set_enums = {}         # (table_name, key) -> IntEnum
+_set_lookups = {}       # (table_name, key) -> {lower case value: IntEnum member}
+
+##################
+# the base class
+
+class JRecord(MutableMapping):
+    """
+    Base class for the records of a table, see recordClass().
+    Keys that are not in the schema are kept in a small dictionary, so nothing is lost when saving.
+    """
+    __slots__ = ('_extra',)
+
+    _table_name = None
+    _columns = ()       # the keys with a slot, in the schema order
+    _types = {}         # key -> schema type, only for the keys with a slot
+    _lookups = {}       # key -> {lower case value: IntEnum member}, for the 'set' keys
+    _members = {}       # key -> (None, member with code 1, member with code 2...), for the 'set' keys
+
+    def __init__(self, data=(), **kwargs):
+        self._extra = None
+        self.update(data, **kwargs)
+
+    @classmethod
+    def fromDict(cls, data):
+        """
+        Build a record from a dictionary, e.g. one record from a json file.
+        """
+        record = cls.__new__(cls)
+        record._extra = None
+        for key, value in data.items():
+            record[key] = value
+        return record
+
+    @classmethod
+    def fromPacked(cls, values):
+        """
+        Build a record from the integers stored in a fixed-width file, in the schema order.
+        The integers are used as they are, no strings are built.
+        """
+        record = cls.__new__(cls)
+        record._extra = None
+        for key, value in zip(cls._columns, values):
+            match cls._types[key]:
+                case 'int':
+                    value = None if value == NULL_INT else value
+                case 'set':
+                    members = cls._members[key]
+                    value = members[value] if value < len(members) else setEnum(cls._table_name, key)(value)   # an unknown code raises ValueError
+                case _:     # 'date' and 'FK'
+                    value = value or None
+            setattr(record, key, value)
+        return record
+
+    def __getitem__(self, key):
+        kind = self._types.get(key)
+        if kind is None:
+            if self._extra is None or key not in self._extra:
+                raise KeyError(key)
+            return self._extra[key]
+        try:
+            value = getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+        if kind == 'date' and type(value) is int:
+            return decodeDate(value)
+        if kind == 'set' and isinstance(value, IntEnum):
+            return value.name
+        return value
+
+    def raw(self, key, default=None):
+        """
+        Get the value kept for a key, without decoding it: dates as integers YYYYMMDD, 'set' values as IntEnum members.
+        """
+        if key in self._types:
+            return getattr(self, key, default)
+        return self._extra.get(key, default) if self._extra else default
+
+    def packedValues(self):
+        """
+        Get the integers stored in a fixed-width file for this record, in the schema order, the opposite of fromPacked().
+
+        :raises ValueError: If a value can't be stored, e.g. an invalid date kept as a string.
+        """
+        values = []
+        for key in self._columns:
+            value = getattr(self, key, None)
+            if value is None:
+                values.append(NULL_INT if self._types[key] == 'int' else NULL_CODE)
+            elif isinstance(value, str):    # an invalid date or an unknown 'set' value, kept as the original string
+                values.append(encodeValue(my_db_schema[self._table_name][key], value))
+            else:
+                values.append(int(value))
+        return values
+
+    def __setitem__(self, key, value):
+        kind = self._types.get(key)
+        if kind is None:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[sys.intern(key) if type(key) is str else key] = value   # the same key string for every record
+            return
+        if value is not None:
+            if kind == 'date' and isinstance(value, str):
+                try:
+                    value = encodeDate(value)
+                except ValueError:
+                    pass    # an invalid date is kept as the original string
+            elif kind == 'set':
+                if isinstance(value, str):
+                    value = self._lookups[key].get(value.lower()) or sys.intern(value)     # an unknown value is kept as the original string
+                elif type(value) is int and 0 < value < len(self._members[key]):
+                    value = self._members[key][value]
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if self._types.get(key) is None:
+            if self._extra is None or key not in self._extra:
+                raise KeyError(key)
+            del self._extra[key]
+            return
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        for key in self._columns:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.toDict()!r})"
+
+    def copy(self):
+        """
+        Get a shallow copy of the record, with the same class.
+        """
+        record = type(self).__new__(type(self))
+        record._extra = dict(self._extra) if self._extra else None
+        for key in self._columns:
+            if hasattr(self, key):
+                setattr(record, key, getattr(self, key))
+        return record
+
+    def toDict(self):
+        """
+        Get the record as a plain dictionary, with the same values found in the json files.
+        """
+        return {key: self[key] for key in self}
+
+##################
+# functions to build the classes
+
+def setEnum(table_name, key):
+    """
+    Get the IntEnum for a 'set' key in the schema.
+    The value of each member is its position in the schema tuple starting at 1, the same code used by encodeSet().
+
+    :param table_name: The name of the table.
+    :param key: The name of a key with the 'set' type.
+    :return: The IntEnum class, the member names are the values written in the schema.
+    """
+    if (table_name, key) not in _set_enums:
+        value_type = my_db_schema[table_name][key]
+        members = [(value, code) for code, value in enumerate(value_type[1], start=1)]
+        _set_enums[(table_name, key)] = IntEnum(f"{table_name}.{key}", members)
+    return _set_enums[(table_name, key)]
+
+def setMember(table_name, key, value):
+    """
+    Get the IntEnum member of a 'set' value, so it can be compared as an integer, e.g. setMember('doctor', 'status', 'available').
+
+    :param table_name: The name of the table.
+    :param key: The name of a key with the 'set' type.
+    :param value: A value as written in the json files (any case), its code, or its member.
+    :return: The member, or None if the value is None or isn't one of the values in the schema.
+    """
+    if value is None:
+        return None
+    enum = setEnum(table_name, key)
+    if isinstance(value, enum):
+        return value
+    if type(value) is int:
+        return enum(value) if 0 < value <= len(enum) else None
+    lookup = _set_lookups.get((table_name, key))
+    if lookup is None:
+        lookup = _set_lookups[(table_name, key)] = {member.name.lower(): member for member in enum}
+    return lookup.get(str(value).lower())
+
+def rawValue(record, key):
+    """
+    Get the value kept for a key by a record (see JRecord.raw()), or by a plain dictionary.
+    """
+    if isinstance(record, JRecord):
+        return record.raw(key)
+    return record.get(key)
+
+def recordClass(table_name):
+    """
+    Get the record class for a table, building it from my_db_schema on first use.
+
+    :param table_name: The name of the table.
+    :return: A subclass of JRecord, or None if the table is not in my_db_schema.
+    """
+    if table_name in _record_classes:
+        return _record_classes[table_name]
+    if table_name not in my_db_schema:
+        return None
+
+    columns, types, lookups, members = [], {}, {}, {}
+    for key, value_type in my_db_schema[table_name].items():
+        if not key.isidentifier() or keyword.iskeyword(key) or hasattr(JRecord, key):
+            continue    # can't be a slot, it's kept with the keys that are not in the schema
+        columns.append(key)
+        types[key] = value_type[0]
+        if value_type[0] == 'set':
+            lookups[key] = _set_lookups.setdefault((table_name, key), {member.name.lower(): member for member in setEnum(table_name, key)})
+            members[key] = (None,) + tuple(setEnum(table_name, key))
+
+    class_name = ''.join(word.title() for word in table_name.split('_')) + 'Record'
+    _record_classes[table_name] = type(class_name, (JRecord,), {
+        '__slots__': tuple(columns),
+        '_table_name': table_name,
+        '_columns': tuple(columns),
+        '_types': types,
+        '_lookups': lookups,
+        '_members': members
+    })
+    return _record_classes[table_name]
+
+def toRecord(table_name, data):
+    """
+    Convert a dictionary to a record of the table, records and unknown tables are returned as-is.
+
+    :param table_name: The name of the table.
+    :param data: The dictionary to convert.
+    :return: The record.
+    """
+    cls = recordClass(table_name)
+    if cls is None or isinstance(data, JRecord):
+        return data
+    return cls.fromDict(data)
+
+##################
+# slots all the way down
@@ -0,0 +1,152 @@
+# PrU_helper_recurrence.py
+# recurring appointments: a rule (daily, weekly or monthly, until a date or for a count) booked as one series
+
+# the rule is expanded into every date at once, from the ordinal of the first date (days) or its month number (months)
+# all the appointments of the series are checked, then committed in one transaction (see PrU_helper_transaction.py):
+# one write to the table, contiguous ids, and either the whole series is booked or none of it
+
+import beaupy
+import calendar
+from datetime import date, datetime
+from PrU_helper_db import *
+from PrU_helper_json import *
+from PrU_helper_transaction import *
+from rich.console import Console
+
+console = Console()
+
+RECURRENCE_RULES = {'daily': 1, 'weekly': 7, 'monthly': None}   # rule -> days between two dates, None for months
+
+##################
+# functions to expand the rules
+
+def expandRecurrence(start_date_str, rule, interval=1, end_date_str=None, count=None):
+    """
+    Get the dates of a recurrence rule, e.g. every 2 weeks from 2025-01-06 until 2025-12-31.
+    A monthly rule keeps the day of the first date, or the last day of the shorter months (the 31st becomes the 30th, then the 28th...).
+
+    :param start_date_str: The first date, 'YYYY-MM-DD'.
+    :param rule: 'daily', 'weekly' or 'monthly'.
+    :param interval: The number of days, weeks or months between two dates.
+    :param end_date_str: The last possible date, 'YYYY-MM-DD', included. Give this or the count.
+    :param count: The number of dates.
+    :return: The list of dates, 'YYYY-MM-DD', in order.
+    :raises ValueError: If the rule is invalid, or it gives more than J_DB_RECURRENCE_MAX_OCCURRENCES dates.
+    """
+    if rule not in RECURRENCE_RULES:
+        raise ValueError(f"Unknown recurrence {rule!r}, use one of {tuple(RECURRENCE_RULES)}")
+    if type(interval) is not int or interval < 1:
+        raise ValueError(f"The interval must be a positive integer, not {interval!r}")
+    if (end_date_str is None) == (count is None):
+        raise ValueError("Give either an end date or a number of appointments")
+    if count is not None and (type(count) is not int or count < 1):
+        raise ValueError(f"The number of appointments must be a positive integer, not {count!r}")
+    start = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+    end = None if end_date_str is None else datetime.strptime(end_date_str, '%Y-%m-%d').date()
+    if end is not None and end < start:
+        raise ValueError(f"The end date {end_date_str} is before the first date {start_date_str}")
+
+    days = RECURRENCE_RULES[rule]
+    if days is not None:
+        step = days * interval
+        stop = end.toordinal() + 1 if end is not None else start.toordinal() + step * count
+        steps = range(start.toordinal(), stop, step)
+    else:
+        first_month = start.year * 12 + start.month - 1
+        if count is None:
+            count = (end.year * 12 + end.month - 1 - first_month) // interval + 1
+        steps = range(first_month, first_month + interval * count, interval)
+    if len(steps) > J_DB_RECURRENCE_MAX_OCCURRENCES:
+        raise ValueError(f"The recurrence gives {len(steps)} appointments, the most is {J_DB_RECURRENCE_MAX_OCCURRENCES}")
+
+    if days is not None:
+        return [date.fromordinal(ordinal).isoformat() for ordinal in steps]
+    dates = []
+    for month_number in steps:
+        year, month = divmod(month_number, 12)
+        dates.append(date(year, month + 1, min(start.day, calendar.monthrange(year, month + 1)[1])).isoformat())
+    if end is not None and dates and dates[-1] > end.isoformat():
+        dates.pop()     # the last month can end after the end date
+    return dates
+
+##################
+# functions to book a series
+
+def bookRecurringAppointments(appointment, dates, my_booking_table='appointment_join', date_key='booking_date'):
+    """
+    Book one appointment per date, all in one transaction.
+    Every appointment is checked against the schema (the patient and the doctor must exist), and the dates
+    against the booking rule of getUserInput() (not in the past), before anything is written.
+
+    :param appointment: The dictionary of the appointment, as returned by bookAppointment(); its date is replaced by each date.
+    :param dates: The dates, 'YYYY-MM-DD', see expandRecurrence().
+    :param my_booking_table: The name of the booking table.
+    :param date_key: The date key of the booking table.
+    :return: The list of the appointments booked, with their ids (contiguous).
+    :raises TransactionError: If an appointment or a date is invalid, nothing is booked then.
+    """
+    if not dates:
+        raise TransactionError("The recurrence gives no date")
+    today = datetime.today().strftime('%Y-%m-%d')
+    if min(dates) < today:
+        raise TransactionError(f"Booking date cannot be in the past: {min(dates)}")
+    with Transaction() as transaction:
+        booked = [transaction.insert(my_booking_table, dict(appointment, **{date_key: date_str})) for date_str in dates]
+    return booked
+
+def askRecurrence(start_date_str):
+    """
+    Prompts the user for a recurrence rule starting at a date, and expands it.
+
+    Args:
+    - start_date_str (str): The first date in the format 'YYYY-MM-DD'.
+
+    Returns:
+    - list: The dates of the rule in the format 'YYYY-MM-DD', or None if the rule is invalid.
+    """
+    console.print("[bold blue]Repeat the appointment:[/bold blue]")
+    rule = beaupy.select(list(RECURRENCE_RULES), cursor="->", cursor_style='green')
+    if rule is None:
+        return None
+    interval = getUserInput(f"every how many {'months' if rule == 'monthly' else 'days' if rule == 'daily' else 'weeks'}", ('int', None))
+    console.print("[bold blue]End the series:[/bold blue]")
+    if beaupy.select(["On a date", "After a number of appointments"], cursor="->", cursor_style='green', return_index=True) == 0:
+        end_date_str, count = getUserInput("end_date", ('date', None)), None
+    else:
+        end_date_str, count = None, getUserInput("number of appointments", ('int', None))
+    try:
+        return expandRecurrence(start_date_str, rule, interval, end_date_str, count)
+    except ValueError as err:
+        console.print(f"Invalid recurrence: {err}", style="bold red")
+        return None
+
+def printBookRecurringAppointments(my_booking_table='appointment_join', date_key='booking_date'):
+    """
+    Prompts the user for an appointment and a recurrence rule, shows the dates and books the whole series once confirmed.
+
+    Args:
+    - my_booking_table (str): The name of the booking table (default is 'appointment_join').
+    - date_key (str): The date key of the booking table (default is 'booking_date').
+    """
+    appointment = bookAppointment(my_booking_table)    # the date entered is the first one of the series
+    dates = askRecurrence(appointment[date_key])
+    if not dates:
+        pause()
+        return
+
+    console.print(f"{len(dates)} appointment(s), from {dates[0]} to {dates[-1]}:", style="bold blue")
+    console.print(", ".join(dates), style="dim")
+    if not beaupy.confirm("Book these appointments?"):
+        console.print("Booking cancelled.", style="bold red")
+        pause()
+        return
+    try:
+        booked = bookRecurringAppointments(appointment, dates, my_booking_table, date_key)
+    except TransactionError as err:
+        console.print(f"Booking failed, no appointment was booked: {err}", style="bold red")
+    else:
+        console.print(f"{len(booked)} appointments booked, ids {booked[0]['id']} to {booked[-1]['id']}.", style="bold green")
+    pause()
+
+##################
+# same time next week?
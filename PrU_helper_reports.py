@@ -0,0 +1,432 @@
+# PrU_helper_reports.py
+# functions to print reports, built on the query engine
+
+import beaupy
+import heapq
+from datetime import datetime
+from PrU_helper_db import *
+from PrU_helper_json import *
+from PrU_helper_query import *
+from PrU_helper_cache import *
+from PrU_helper_snapshot import *
+from PrU_helper_profiles import *
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+##################
+# helper functions
+
+def joinForeignKeys(query):
+    """
+    Join a query with the display key of every FK key in its table, e.g. 'patient_id' adds 'patient_name'.
+
+    Args:
+    - query (Query): The query to join.
+
+    Returns:
+    - Query: The same query.
+    """
+    for fk_key in foreignKeys(query.table_name):
+        query.join(fk_key)
+    return query
+
+def printAppointmentsTable(appointments, my_appointments='appointment_join'):
+    """
+    Prints the rows returned by a report query as a table, one column per key in the schema.
+    FK keys are shown with the display key of the record they point to.
+
+    Args:
+    - appointments (list of dict): The rows returned by the query, see joinForeignKeys().
+    - my_appointments (str): The name of the appointments table.
+    """
+    fk_keys = foreignKeys(my_appointments)
+
+    # Initialize the rich.table
+    table = Table(show_header=True, header_style="bold magenta")
+
+    # Define the rich.table columns, following the schema
+    keys = list(my_db_schema[my_appointments])
+    for key in keys:
+        if key in fk_keys:
+            table_name, display_key = fk_keys[key]
+            header = f"{table_name.title()} {display_key.title()}"     # e.g. 'Patient Name'
+        elif key == 'id':
+            header = 'ID'
+        else:
+            header = key.replace('_', ' ').title()
+        table.add_column(header, style="dim", justify="left")
+
+    # Add rows to the table, replacing each FK 'id' with the joined value
+    for appointment in appointments:
+        row = []
+        for key in keys:
+            if key in fk_keys:
+                table_name, display_key = fk_keys[key]
+                value = appointment.get(joinedKey(key, display_key))
+                row.append(str(value) if value is not None else f"Unknown {table_name.title()}")
+            else:
+                row.append(str(appointment.get(key, "")))
+        table.add_row(*row)
+
+    # Print the table
+    console.print(table)
+
+def printPatientProfile(patient_id, profile):
+    """
+    Prints the summary of a patient's appointments, see getPatientProfile().
+
+    Args:
+    - patient_id (int): The 'id' of the patient.
+    - profile (dict): The summary returned by getPatientProfile().
+    """
+    table = Table(show_header=False, title=f"Patient ID {patient_id}", title_style="bold blue")
+    table.add_column("", style="bold magenta", justify="left")
+    table.add_column("", justify="left")
+    table.add_row("Appointments", str(profile['appointments']))
+    for status in my_db_schema['appointment_join']['status'][1]:
+        table.add_row(f"  {status}", str(profile['by_status'].get(status, 0)))
+    table.add_row("Total spend (EUR)", str(profile['spend']))
+    table.add_row("Last visit", profile['last_visit'] or "-")
+    table.add_row("Next visit", profile['next_visit'] or "-")
+    console.print(table)
+
+def printAppointmentPages(appointments, page_size=J_DB_HISTORY_PAGE_SIZE):
+    """
+    Prints the rows of a report one page at a time, the user moves between the pages.
+
+    Args:
+    - appointments (list of dict): The rows returned by the query, see printAppointmentsTable().
+    - page_size (int): The number of rows per page.
+    """
+    pages = max(1, (len(appointments) + page_size - 1) // page_size)
+    page = 0
+    while True:
+        console.clear()
+        printAppointmentsTable(appointments[page * page_size:(page + 1) * page_size])
+        console.print(f"Page {page + 1} of {pages}", style="bold blue")
+        options = (["Next page"] if page + 1 < pages else []) + (["Previous page"] if page > 0 else []) + ["Go Back"]
+        if len(options) == 1:
+            pause()
+            return
+        match beaupy.select(options, cursor="->", cursor_style='green'):
+            case "Next page":
+                page += 1
+            case "Previous page":
+                page -= 1
+            case _:
+                return
+
+##################
+# the queries behind each report
+
+def queryAppointmentsForDate(date_str, my_appointments='appointment_join', ordered=True, snapshot=None):
+    """
+    Build the query for the appointments on a date.
+
+    Args:
+    - date_str (str): The date in the format 'YYYY-MM-DD'.
+    - my_appointments (str): The name of the appointments table.
+    - ordered (bool): Sort the rows by 'id'. Without sorting, the rows are streamed in file order.
+    - snapshot (Snapshot): Read the tables from this snapshot, see pinSnapshot(). None reads the current files.
+
+    Returns:
+    - Query: The appointments on that date, in 'id' order, joined with the tables of their FK keys.
+      The archive is only read for a date it holds.
+    """
+    query = Query(my_appointments, snapshot).where('booking_date', '==', date_str).withArchive()
+    return joinForeignKeys(query.orderBy('id') if ordered else query)
+
+def queryAppointmentsForPatient(patient_id, my_appointments='appointment_join', ordered=True, snapshot=None):
+    """
+    Build the query for the appointments of a patient.
+
+    Args:
+    - patient_id (int): The 'id' of the patient.
+    - my_appointments (str): The name of the appointments table.
+    - ordered (bool): Sort the rows by 'id'. Without sorting, the rows are streamed in file order.
+    - snapshot (Snapshot): Read the tables from this snapshot, see pinSnapshot(). None reads the current files.
+
+    Returns:
+    - Query: The appointments of that patient, in 'id' order, joined with the tables of their FK keys, archived ones included.
+    """
+    query = Query(my_appointments, snapshot).where('patient_id', '==', patient_id).withArchive()
+    return joinForeignKeys(query.orderBy('id') if ordered else query)
+
+def queryRevenueForDateRange(start_date_str, end_date_str, my_appointments='appointment_join', ordered=True, snapshot=None):
+    """
+    Build the query for the appointments that count as revenue between two dates.
+    Status must be updated to 'Done' after the appointment for revenue to be accounted for.
+
+    Args:
+    - start_date_str (str): The first date in the format 'YYYY-MM-DD', included.
+    - end_date_str (str): The last date in the format 'YYYY-MM-DD', included.
+    - my_appointments (str): The name of the appointments table.
+    - ordered (bool): Sort the rows by 'id'. Without sorting, the rows are streamed in file order.
+    - snapshot (Snapshot): Read the tables from this snapshot, see pinSnapshot(). None reads the current files.
+
+    Returns:
+    - Query: The appointments with status 'Done' between the two dates, in 'id' order, joined with the tables of their FK keys.
+      Only the archive segments of those dates are read.
+    """
+    query = (Query(my_appointments, snapshot)
+             .where('booking_date', 'between', (start_date_str, end_date_str))
+             .where('status', '==', 'Done')
+             .withArchive())
+    return joinForeignKeys(query.orderBy('id') if ordered else query)
+
+def queryDoctorActivity(start_date_str, end_date_str, my_appointments='appointment_join', snapshot=None):
+    """
+    Build the query for the appointments of each doctor between two dates, counted and summed by status.
+
+    Args:
+    - start_date_str (str): The first date in the format 'YYYY-MM-DD', included.
+    - end_date_str (str): The last date in the format 'YYYY-MM-DD', included.
+    - my_appointments (str): The name of the appointments table.
+    - snapshot (Snapshot): Read the tables from this snapshot, see pinSnapshot(). None reads the current files.
+
+    Returns:
+    - Query: One row per 'doctor_id' and 'status' with 'appointments' (the count) and 'revenue' (the sum of 'price'),
+      aggregated in one pass over the packed rows. Only the archive segments of those dates are read.
+    """
+    return (Query(my_appointments, snapshot)
+            .where('booking_date', 'between', (start_date_str, end_date_str))
+            .withArchive()
+            .groupBy('doctor_id', 'status', appointments=('count', None), revenue=('sum', 'price')))
+
+##################
+# the results of each report, cached until one of the tables they read changes
+# each one is computed on a pinned snapshot, so its rows and joined names come from the same state
+# even if a booking is written while the report runs
+
+def reportTables(my_appointments='appointment_join'):
+    """
+    Get the tables read by a report on my_appointments: the table itself and the tables of its FK keys.
+
+    Returns:
+    - tuple: The table names.
+    """
+    return (my_appointments,) + tuple(table_name for table_name, display_key in foreignKeys(my_appointments).values())
+
+@cachedReport(*reportTables())
+def getAppointmentsForDate(date_str):
+    """
+    Get the rows of the report 'All the appointments for a date', see queryAppointmentsForDate().
+    """
+    with pinSnapshot(reportTables()) as snapshot:
+        return queryAppointmentsForDate(date_str, snapshot=snapshot).run()
+
+@cachedReport(*reportTables())
+def getAppointmentsForPatient(patient_id):
+    """
+    Get the rows of the report 'Appointment history for a patient', see queryAppointmentsForPatient().
+    """
+    with pinSnapshot(reportTables()) as snapshot:
+        return queryAppointmentsForPatient(patient_id, snapshot=snapshot).run()
+
+@cachedReport(*reportTables())
+def getRevenueForDateRange(start_date_str, end_date_str):
+    """
+    Get the rows and the total of the report 'Sum of total revenue for a range of dates', see queryRevenueForDateRange().
+
+    Returns:
+    - tuple: (list of rows, total price)
+    """
+    with pinSnapshot(reportTables()) as snapshot:
+        rows = queryRevenueForDateRange(start_date_str, end_date_str, snapshot=snapshot).run()
+    total_price = sum(row['price'] for row in rows if row.get('price') is not None)     # the rows are already read, no second query
+    return rows, total_price
+
+@cachedReport(*reportTables())
+def getDoctorLeaderboard(start_date_str, end_date_str, top_n=J_DB_LEADERBOARD_SIZE):
+    """
+    Get the rankings of the report 'Doctor leaderboard for a range of dates', see queryDoctorActivity().
+
+    Args:
+    - start_date_str (str): The first date in the format 'YYYY-MM-DD', included.
+    - end_date_str (str): The last date in the format 'YYYY-MM-DD', included.
+    - top_n (int): The number of doctors in each ranking.
+
+    Returns:
+    - tuple: (busiest doctors, top earners), each a list of dictionaries with 'doctor_id', 'name', 'status', 'appointments'
+      (not canceled), 'done', 'canceled', 'revenue' (of the 'Done' appointments) and 'utilization' (appointments over the
+      capacity of the range, None for a doctor who isn't 'Available').
+    """
+    Status = setEnum('appointment_join', 'status')
+    totals = {}
+    with pinSnapshot(reportTables()) as snapshot:
+        for row in queryDoctorActivity(start_date_str, end_date_str, snapshot=snapshot):
+            if row['doctor_id'] is None:
+                continue
+            doctor = totals.setdefault(row['doctor_id'], {'doctor_id': row['doctor_id'], 'appointments': 0, 'done': 0, 'canceled': 0, 'revenue': 0})
+            status = setMember('appointment_join', 'status', row['status'])
+            if status == Status.Canceled:
+                doctor['canceled'] += row['appointments']
+                continue
+            doctor['appointments'] += row['appointments']
+            if status == Status.Done:
+                doctor['done'] += row['appointments']
+                doctor['revenue'] += row['revenue']
+
+        # a bounded heap keeps only the top_n of each ranking
+        busiest = heapq.nlargest(top_n, totals.values(), key=lambda doctor: (doctor['appointments'], doctor['revenue']))
+        earners = heapq.nlargest(top_n, totals.values(), key=lambda doctor: (doctor['revenue'], doctor['appointments']))
+
+        # only the ranked doctors are read, with the 'id' index
+        ranked_ids = {doctor['doctor_id'] for doctor in busiest + earners}
+        doctors = {doctor['id']: doctor for doctor in Query('doctor', snapshot).where('id', 'in', ranked_ids).select('id', 'name', 'status')}
+    days = (datetime.strptime(end_date_str, '%Y-%m-%d') - datetime.strptime(start_date_str, '%Y-%m-%d')).days + 1
+    for doctor_id in ranked_ids:
+        doctor = totals[doctor_id]
+        record = doctors.get(doctor_id, {})
+        doctor['name'] = record.get('name')
+        doctor['status'] = record.get('status')
+        available = setMember('doctor', 'status', doctor['status']) == setEnum('doctor', 'status').Available
+        doctor['utilization'] = doctor['appointments'] / (days * J_DB_DOCTOR_DAILY_SLOTS) if available else None
+    return busiest, earners
+
+##################
+# functions to print reports
+
+def printAppointmentsForDate():
+    """
+    Prompts the user for a date and prints a table of appointments for that specific date.
+    The names are joined from the tables referenced by the FK keys of 'appointment_join'.
+
+    """
+    # Prompt user to input a date
+    console.print("You must enter a date that exists in the database", style="bold blue")
+    date_input = getUserInput("appointment_date", ("date", None))
+
+    if date_input is None:
+        console.print("Invalid date input. Exiting.", style="bold red")
+        pause()
+        return    # exit early
+
+    # Filter appointments for the specified date, the booking_date index is used when it exists
+    filtered_appointments = getAppointmentsForDate(date_input)
+
+    if not filtered_appointments:
+        console.print(f"No appointments found for {date_input}.", style="bold yellow")
+        pause()
+        return  # exit early
+
+    printAppointmentsTable(filtered_appointments)
+    pause()
+
+def printAppointmentsForPatient():
+    """
+    Prints the summary of the appointments of a patient selected by the user (see PrU_helper_profiles.py),
+    then the full history, one page at a time, only if the user asks for it.
+    """
+
+    # Get the selected patient's ID
+    patient_id = selectRecordByID('patient')  # safe to call with default args
+
+    if patient_id is None:
+        console.print("No valid patient selected. Exiting.", style="bold red")
+        pause()
+        return
+
+    # The summary is kept up to date with each booking, no appointment is read here
+    profile = getPatientProfile(patient_id)
+
+    if not profile['appointments']:
+        console.print(f"No appointments found for patient ID {patient_id}.", style="bold yellow")
+        pause()
+        return
+
+    printPatientProfile(patient_id, profile)
+    if not beaupy.confirm("Show the full appointment history?"):
+        return
+
+    # Filter appointments for the selected patient, the patient_id index is used when it exists
+    filtered_appointments = getAppointmentsForPatient(patient_id)
+    printAppointmentPages(filtered_appointments)
+
+def printRevenueForDateRange():
+    """
+    Prompts the user for two dates and prints a table of all appointments between those dates with individual prices and the total price.
+    """
+    # Prompt the user to input two dates
+    start_date_str = getUserInput("start_date", ("date", None))
+    end_date_str = getUserInput("end_date", ("date", None))
+
+    if start_date_str is None or end_date_str is None:
+        console.print("Invalid date input. Exiting.", style="bold red")
+        pause()
+        return
+
+    if start_date_str > end_date_str:   # 'YYYY-MM-DD' strings sort like the dates
+        start_date_str, end_date_str = end_date_str, start_date_str  # get them in right order
+
+    # Filter appointments between the specified dates, where status = 'Done'.
+    # Status must be updated after the appointment for revenue to be accounted for.
+    filtered_appointments, total_price = getRevenueForDateRange(start_date_str, end_date_str)
+
+    if not filtered_appointments:
+        console.print(f"No appointments found between {start_date_str} and {end_date_str}.", style="bold yellow")
+        pause()
+        return
+
+    # Initialize the table
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Booking Date", style="dim", justify="left")
+    table.add_column("Patient Name", style="dim", justify="left")
+    table.add_column("Doctor Name", style="dim", justify="left")
+    table.add_column("Price (EUR)", style="dim", justify="left")
+
+    # Add rows to the table
+    for appointment in filtered_appointments:   # follows 'id' order, not the 'date order'
+        booking_date = appointment.get('booking_date', "")
+        patient_name = appointment.get('patient_name') or "Unknown Patient"
+        doctor_name = appointment.get('doctor_name') or "Unknown Doctor"
+        price = appointment.get('price', 0)
+        table.add_row(booking_date, patient_name, doctor_name, str(price))
+
+    # Add the total row, summed from the rows above
+    table.add_row("", "", "Total = ", str(total_price), style="bold green on yellow")
+
+    # Print the table
+    console.print(table)
+    pause()
+
+def printDoctorLeaderboard():
+    """
+    Prompts the user for two dates and prints the busiest doctors and the top earners between those dates,
+    with the utilization of each one against the daily capacity of an 'Available' doctor.
+    """
+    # Prompt the user to input two dates
+    start_date_str = getUserInput("start_date", ("date", None))
+    end_date_str = getUserInput("end_date", ("date", None))
+
+    if start_date_str is None or end_date_str is None:
+        console.print("Invalid date input. Exiting.", style="bold red")
+        pause()
+        return
+
+    if start_date_str > end_date_str:   # 'YYYY-MM-DD' strings sort like the dates
+        start_date_str, end_date_str = end_date_str, start_date_str  # get them in right order
+
+    busiest, earners = getDoctorLeaderboard(start_date_str, end_date_str)
+
+    if not busiest:
+        console.print(f"No appointments found between {start_date_str} and {end_date_str}.", style="bold yellow")
+        pause()
+        return
+
+    for title, doctors in ((f"Busiest doctors from {start_date_str} to {end_date_str}", busiest),
+                           (f"Top earners from {start_date_str} to {end_date_str}", earners)):
+        table = Table(show_header=True, header_style="bold magenta", title=title, title_style="bold blue")
+        for header in ("Rank", "Doctor Name", "Status", "Appointments", "Done", "Canceled", "Revenue (EUR)", "Utilization"):
+            table.add_column(header, style="dim", justify="left")
+        for rank, doctor in enumerate(doctors, start=1):
+            utilization = f"{doctor['utilization']:.0%}" if doctor['utilization'] is not None else "-"
+            table.add_row(str(rank), doctor['name'] or f"Unknown Doctor {doctor['doctor_id']}", str(doctor['status'] or "-"),
+                          str(doctor['appointments']), str(doctor['done']), str(doctor['canceled']), str(doctor['revenue']), utilization)
+        console.print(table)
+    pause()
+
+##################
+# that's all, folks
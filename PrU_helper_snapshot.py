@@ -0,0 +1,276 @@
+# PrU_helper_snapshot.py
+# immutable, versioned snapshots of the tables, for reads that must see one consistent state
+
+# every time a json table changes on disk, the next reader loads it into a new TableVersion (a tuple of records)
+# a fixed-width table is not copied: its TableVersion maps the file as it is when the snapshot is pinned (see FixedFileView)
+# readers pin a Snapshot holding one TableVersion per table, all taken at the same moment;
+# writers don't wait for readers, they keep writing the files and the next pin sees the new versions
+# an old version stays in memory only while a snapshot still holds it
+# when another program wrote the table, the new version is patched from the change feed (see PrU_helper_feed.py) if it can be
+
+import itertools
+import threading
+import time
+from PrU_helper_db import *
+from PrU_helper_json import *
+from PrU_helper_feed import *
+from PrU_helper_transaction import *
+
+SNAPSHOT_RETRIES = 5    # attempts to read every table without a write in between, before locking the tables for the last one
+
+_retired_versions = set()   # older versions still pinned by a snapshot
+_snapshot_lock = threading.Lock()   # only held to swap versions and count pins, never while reading a file
+_version_numbers = itertools.count(1)
+
+##################
+# the versions and the snapshots
+
+class TableVersion:
+    """
+    One immutable version of a table: its records, the stamp from tableVersion() they were read at,
+    its position in the change feed, and the indexes built on them (see PrU_helper_query.py).
+    The records are shared by every reader, they must not be changed (use updateJRecord()).
+    For a fixed-width table the records are a FixedFileView of the file, only held by the snapshot that pinned it.
+    """
+    __slots__ = ('table_name', 'stamp', 'rows', 'feed_position', 'indexes', 'pins', 'number', '_ids')
+
+    def __init__(self, table_name, stamp, rows, feed_position=(None, 0, 0)):
+        self.table_name = table_name
+        self.stamp = stamp
+        self.rows = rows
+        self.feed_position = feed_position
+        self.indexes = {}
+        self.pins = 0
+        self.number = next(_version_numbers)
+        self._ids = None
+
+    def idPositions(self):
+        """
+        Get the position of each record in rows, as {id: position}, built on first use.
+        """
+        if self._ids is None:
+            self._ids = {record.get('id'): position for position, record in enumerate(self.rows)}
+        return self._ids
+
+    def isMapped(self):
+        """
+        Check if the records are read from a mapped fixed-width file, see FixedFileView.
+        """
+        return isinstance(self.rows, FixedFileView)
+
+    def __repr__(self):
+        return f"TableVersion({self.table_name!r}, number={self.number}, rows={len(self.rows)}, pins={self.pins})"
+
+class Snapshot:
+    """
+    A set of table versions pinned together, read with rows(table_name).
+    Release it when done, or use it in a with block.
+    """
+
+    def __init__(self, versions):
+        self._versions = versions
+        self._released = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    @property
+    def tables(self):
+        return tuple(self._versions)
+
+    def version(self, table_name):
+        """
+        Get the TableVersion of a table in this snapshot.
+        """
+        if table_name not in self._versions:
+            raise ValueError(f"The table {table_name} is not in this snapshot")
+        return self._versions[table_name]
+
+    def rows(self, table_name):
+        """
+        Get the records of a table in this snapshot.
+
+        :return: A tuple of records.
+        """
+        return self.version(table_name).rows
+
+    def release(self):
+        """
+        Unpin the versions, an old version is dropped when no snapshot holds it anymore.
+        """
+        if self._released:
+            return
+        self._released = True
+        with _snapshot_lock:
+            for version in self._versions.values():
+                version.pins -= 1
+                if version.pins == 0:
+                    _retired_versions.discard(version)
+                    if version.isMapped():
+                        version.rows.close()
+
+##################
+# helper functions
+
+def _latestVersions():
+    """
+    Get the newest TableVersion loaded of each table of the current database, as {table_name: TableVersion}.
+    """
+    return currentDatabase().state('snapshot.latest_versions')
+
+def _publish(version):
+    """
+    Make a version the newest one of its table, the old one is kept only if it's pinned.
+    Must be called with _snapshot_lock held.
+    """
+    latest_versions = _latestVersions()
+    old = latest_versions.get(version.table_name)
+    if old is not None and old is not version and old.pins > 0:
+        _retired_versions.add(old)
+    latest_versions[version.table_name] = version
+
+def _currentVersion(table_name, stamp, mapped=True):
+    """
+    Get the newest version of a table if it was read at this stamp, or load a new one (not published yet).
+    A fixed-width table gets a new version mapping its file, it's never published.
+
+    :param mapped: Map the fixed-width file, instead of loading its records like a json table.
+    :return: A tuple (TableVersion, True if it was loaded now).
+    """
+    if mapped and isFixedWidthTable(table_name):
+        return TableVersion(table_name, stamp, FixedFileView(table_name)), True
+    with _snapshot_lock:
+        version = _latestVersions().get(table_name)
+    if version is not None and version.stamp == stamp:
+        return version, False
+    if version is not None:
+        patched = _patchVersion(version, stamp)
+        if patched is not None:
+            return patched, True
+    feed_position = feedPosition(table_name)     # before loading, see feedPosition()
+    return TableVersion(table_name, stamp, tuple(loadJTable(table_name)), feed_position), True
+
+def _patchVersion(version, stamp):
+    """
+    Build the version of a table at a stamp from an older one and the change feed, see patchChanges().
+    Only the records written are replaced (or added), and the indexes of the old version are patched the same way.
+
+    :return: The new TableVersion, or None if the table must be loaded again.
+    """
+    table_name = version.table_name
+    patch = patchChanges(table_name, version.feed_position, version.stamp, stamp)
+    if patch is None:
+        return None
+    entries, feed_position = patch
+    rows = list(version.rows)
+    ids = dict(version.idPositions())
+    changed = []    # (position, old record or None, new record)
+    for entry in entries:
+        for old_record, new_record in entry['changes']:
+            if new_record is None:
+                return None     # a deleted record, the positions have moved
+            record = toRecord(table_name, new_record)
+            position = ids.get(record.get('id'))
+            if position is None:
+                position = ids[record.get('id')] = len(rows)
+                rows.append(record)
+                changed.append((position, None, record))
+            else:
+                changed.append((position, rows[position], record))
+                rows[position] = record
+
+    patched = TableVersion(table_name, stamp, tuple(rows), feed_position)
+    patched._ids = ids
+    for key, index in list(version.indexes.items()):
+        get = lambda record: getattr(record, key, None) if key in record._types else record.get(key)    # as in PrU_helper_query.py
+        patched.indexes[key] = patchIndex(index, [(position, [] if old is None else [get(old)], get(new))
+                                                  for position, old, new in changed])
+    return patched
+
+##################
+# functions to read the tables
+
+def latestVersion(table_name):
+    """
+    Get the newest version of one table, loading it if the table changed on disk.
+    The records of a fixed-width table are loaded too, the queries read its file instead (see PrU_helper_query.py).
+
+    :param table_name: The name of the table.
+    :return: The TableVersion, not pinned.
+    """
+    stamp = tableVersion(table_name)
+    version, loaded = _currentVersion(table_name, stamp, mapped=False)
+    if loaded and tableVersion(table_name) == stamp:   # nothing was written while it was loading
+        with _snapshot_lock:
+            _publish(version)
+    return version
+
+def _loadVersions(tables):
+    """
+    Read the stamp of each table and get its version at that stamp, see _currentVersion().
+
+    :return: A tuple ({table_name: stamp}, {table_name: (TableVersion, True if it was loaded now)}).
+    """
+    stamps = {table_name: tableVersion(table_name) for table_name in tables}
+    return stamps, {table_name: _currentVersion(table_name, stamps[table_name]) for table_name in tables}
+
+def pinSnapshot(tables=None):
+    """
+    Pin one consistent version of each table, e.g. for a long report.
+    The stamps of every table are read before and after loading them, and the load is retried if a writer
+    changed any of them in between, or a transaction on them was being committed, so the snapshot never mixes an old and a new state.
+    Writers are not blocked, unless they keep changing the tables for SNAPSHOT_RETRIES attempts:
+    the last load holds the lock of every table then.
+
+    :param tables: The names of the tables, every table in my_db_tables when None.
+    :return: A Snapshot, release it when done (or use it in a with block).
+    :raises TransactionError: If an interrupted commit on the tables can't be replayed.
+    """
+    tables = tuple(tables or my_db_tables)
+    for attempt in range(SNAPSHOT_RETRIES):
+        committing = transactionPending(tables)
+        stamps, loaded = _loadVersions(tables)
+        if not committing and not transactionPending(tables) and all(tableVersion(table_name) == stamps[table_name] for table_name in tables):
+            break
+        for version, is_new in loaded.values():
+            if version.isMapped():
+                version.rows.close()
+        if attempt < SNAPSHOT_RETRIES - 1:
+            time.sleep(0.01 * (attempt + 1))   # give the writer time to finish
+    else:
+        with lockTables(*tables):   # every commit on the tables holds their locks, a log left now was interrupted
+            if transactionPending(tables) and recoverTransactions(tables) == -1:
+                raise TransactionError(f"An interrupted transaction on {', '.join(tables)} could not be replayed")
+            stamps, loaded = _loadVersions(tables)
+
+    with _snapshot_lock:
+        versions = {}
+        for table_name, (version, is_new) in loaded.items():
+            if is_new and not version.isMapped():
+                _publish(version)
+            version.pins += 1
+            versions[table_name] = version
+    return Snapshot(versions)
+
+def snapshotStats():
+    """
+    Get the versions kept in memory, for each table.
+
+    :return: A dictionary {table_name: {'latest': version number, 'rows': count, 'pins': count, 'retired_pinned': count}}.
+    """
+    with _snapshot_lock:
+        stats = {}
+        for table_name, version in _latestVersions().items():
+            stats[table_name] = {
+                'latest': version.number,
+                'rows': len(version.rows),
+                'pins': version.pins,
+                'retired_pinned': sum(1 for old in _retired_versions if old.table_name == table_name)
+            }
+        return stats
+
+##################
+# say cheese
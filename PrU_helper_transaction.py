@@ -0,0 +1,424 @@
+# PrU_helper_transaction.py
+# transactions: many inserts and updates across tables, checked against my_db_schema and committed together
+
+# the changes are kept in memory until commit(), nothing is written before that
+# commit() takes the lock of every table it touches or points to, checks again that the records updated and the FK targets
+# still exist, writes one log record with all the changes (the commit point), writes each table once and deletes the log;
+# if the program stops in between, recoverTransactions() replays the log, so the tables end up with every change of the transaction or with none of them
+
+import glob
+import itertools
+import json
+import os
+from datetime import datetime
+from PrU_helper_db import *
+from PrU_helper_json import *
+
+TRANSACTION_LOG_PREFIX = "transaction"  # each commit writes its changes to <database folder>/transaction.<pid>.<number>.log
+
+_log_numbers = itertools.count(1)
+
+class TransactionError(ValueError):
+    """
+    Raised when a change doesn't match my_db_schema, or a transaction can't be committed.
+    """
+
+##################
+# helper functions
+
+def transactionLogPaths():
+    """
+    Get the paths of the logs of the commits being written, or interrupted, in the current database.
+    """
+    return sorted(glob.glob(os.path.join(databaseFolder(), f"{TRANSACTION_LOG_PREFIX}.*.log")))
+
+def _logTables(log_path):
+    """
+    Get the names of the tables changed by the commit of a log, or an empty list if the log is gone.
+    """
+    try:
+        with open(log_path, 'r', encoding='utf-8') as f:
+            return json.load(f)['tables']
+    except (OSError, ValueError, KeyError):
+        return []
+
+def transactionPending(tables=None):
+    """
+    Check if a commit is being written, or was interrupted and must be replayed.
+    While it's True, the tables may hold only part of a transaction.
+
+    :param tables: Only check the commits changing any of these tables, every commit when None.
+    """
+    if tables is None:
+        return bool(transactionLogPaths())
+    return any(set(_logTables(log_path)) & set(tables) for log_path in transactionLogPaths())
+
+def _applyOperations(operations):
+    """
+    Write the changes of a committed transaction, with one write per table (one append plus one pass of
+    in-place patches for fixed-width tables).
+    Applying the same changes twice gives the same tables, so an interrupted commit can be replayed.
+    An update of a record that is gone (e.g. archived before the log was replayed) can't be applied, it's skipped.
+
+    :return: The list of operations skipped.
+    """
+    by_table = {}
+    for operation in operations:
+        by_table.setdefault(operation['table'], []).append(operation)
+
+    skipped = []
+    for table_name, table_operations in by_table.items():
+        changes = []    # (old record, new record), for the write listeners
+        if isFixedWidthTable(table_name):
+            if not os.path.exists(tableFilePath(table_name)):
+                writeFixedTable(table_name, [])
+            max_id = maxJRecordId(table_name)
+            appends = [operation['record'] for operation in table_operations if operation['op'] == 'insert' and operation['record']['id'] > max_id]
+            appendFixedRecords(table_name, appends, sync=True)
+            changes.extend((None, record) for record in appends)
+            patches = []    # (operation, record_id, values), for the inserts already written by an interrupted commit and the updates
+            for operation in table_operations:
+                if operation['op'] == 'insert' and operation['record']['id'] <= max_id:
+                    patches.append((operation, operation['record']['id'], operation['record']))
+                elif operation['op'] == 'update':
+                    patches.append((operation, operation['id'], operation['values']))
+            results = updateFixedRecords(table_name, [(record_id, values) for operation, record_id, values in patches])
+            for (operation, record_id, values), result in zip(patches, results):
+                if result is None:
+                    skipped.append(operation)
+                else:
+                    changes.append(result)
+            bumpTableVersion(table_name, changes)
+        else:
+            data = loadJTable(table_name)
+            by_id = {record['id']: record for record in data}
+            for operation in table_operations:
+                if operation['op'] == 'insert':
+                    record = recordClass(table_name).fromDict(dict(operation['record']))
+                    if record['id'] in by_id:
+                        changes.append((by_id[record['id']].copy(), by_id[record['id']]))
+                        by_id[record['id']].update(record)
+                    else:
+                        data.append(record)
+                        by_id[record['id']] = record
+                        changes.append((None, record))
+                elif operation['id'] in by_id:
+                    changes.append((by_id[operation['id']].copy(), by_id[operation['id']]))
+                    by_id[operation['id']].update(operation['values'])
+                else:
+                    skipped.append(operation)
+            if not saveJTable(table_name, data, changes):     # bumps the version
+                raise TransactionError(f"Could not save table {table_name}")
+    return skipped
+
+def _replayLog(log_path):
+    """
+    Apply the changes in one log and delete it.
+
+    :return: 1 if it was replayed, 0 if it's gone or invalid.
+    """
+    try:
+        with open(log_path, 'r', encoding='utf-8') as f:
+            log = json.load(f)
+    except json.JSONDecodeError:
+        os.remove(log_path)     # the log is written atomically, so this can't be a committed transaction
+        return 0
+    except OSError:
+        return 0    # removed by its writer in the meantime
+    with lockTables(*log['tables']):
+        if not os.path.exists(log_path):
+            return 0    # written and removed by its writer while waiting for the locks
+        for operation in _applyOperations(log['operations']):
+            console.print(f"Transaction log {log_path}: record {operation['id']} of table {operation['table']} is gone, "
+                          f"its update was skipped: {operation['values']}", style="bold red")
+        os.remove(log_path)
+    return 1
+
+def recoverTransactions(tables=None):
+    """
+    Finish the commits that were interrupted after their log was written, e.g. by a crash.
+    Call it before using the tables, initializeProgramSettings() does.
+
+    :param tables: Only replay the commits changing any of these tables, every commit when None.
+    :return: The number of commits replayed, or -1 on failure (the logs are kept for the next attempt).
+    """
+    replayed = 0
+    for log_path in transactionLogPaths():
+        if tables is not None and not set(_logTables(log_path)) & set(tables):
+            continue
+        try:
+            replayed += _replayLog(log_path)
+        except Exception as err:
+            console.print(f"Error replaying the transaction log {log_path}: {err}", style="bold red")
+            return -1
+    return replayed
+
+##################
+# transactions
+
+class Transaction:
+    """
+    A batch of inserts and updates across tables, committed together or not at all.
+    Each change is checked against my_db_schema when it's added, including the FK keys, which can point to
+    existing records or to records inserted by the same transaction.
+
+    Use it in a with block, it commits at the end of the block, or rolls back if there's an error:
+
+        with Transaction() as transaction:
+            appointment = transaction.insert('appointment_join', {...})
+            transaction.update('doctor', 3, {'status': 'Unavailable'})
+
+    The transaction works on the database current when it's created (see PrU_helper_database.py), or the one given.
+    """
+
+    def __init__(self, database=None):
+        self.database = database or currentDatabase()
+        self._inserts = {}      # table_name -> list of new records, with negative ids until commit()
+        self._updates = {}      # table_name -> {record_id: {key: value}}
+        self._id_sets = {}      # table_name -> set of ids, for the json tables referenced by FK keys
+        self.state = 'open'     # 'open', 'committed' or 'rolled back'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.state != 'open':
+            return
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    ##################
+    # checks
+
+    def _checkOpen(self):
+        if self.state != 'open':
+            raise TransactionError(f"The transaction is already {self.state}")
+
+    def _exists(self, table_name, record_id):
+        """
+        Check if a record exists in a table, or is inserted by this transaction (negative ids).
+        """
+        if record_id < 0:
+            return any(record['id'] == record_id for record in self._inserts.get(table_name, []))
+        if isFixedWidthTable(table_name):
+            try:
+                with useDatabase(self.database):
+                    return fixedSlotOf(table_name, record_id) is not None   # reads the slot of the 'id' first
+            except FileNotFoundError:
+                return False
+        if table_name not in self._id_sets:
+            self._id_sets[table_name] = {record['id'] for record in loadJTable(table_name, database=self.database)}
+        return record_id in self._id_sets[table_name]
+
+    def _checkValue(self, table_name, key, value):
+        """
+        Check one value against its schema type.
+
+        :return: The value to write, set values are given the spelling of the schema.
+        :raises TransactionError: If the value doesn't match.
+        """
+        if key not in my_db_schema[table_name]:
+            raise TransactionError(f"Key {key} is not in the schema of table {table_name}")
+        if value is None:
+            return None
+        value_type, options = my_db_schema[table_name][key]
+        match value_type:
+            case 'int':
+                if type(value) is not int:
+                    raise TransactionError(f"{table_name}.{key} must be an integer, not {value!r}")
+            case 'text':
+                if not isinstance(value, str):
+                    raise TransactionError(f"{table_name}.{key} must be a text, not {value!r}")
+            case 'date':
+                try:
+                    datetime.strptime(value, '%Y-%m-%d')
+                except (ValueError, TypeError):
+                    raise TransactionError(f"{table_name}.{key} must be a date 'YYYY-MM-DD', not {value!r}")
+            case 'set':
+                member = setMember(table_name, key, value) if isinstance(value, str) else None
+                if member is None:
+                    raise TransactionError(f"{table_name}.{key} must be one of {options}, not {value!r}")
+                return member.name
+            case 'FK':
+                target_table = options[0]
+                if type(value) is not int or not self._exists(target_table, value):
+                    raise TransactionError(f"{table_name}.{key} = {value!r} is not an 'id' in table {target_table}")
+        return value
+
+    def _checkValues(self, table_name, values):
+        if table_name not in my_db_schema:
+            raise TransactionError(f"The table {table_name} is not in my_db_schema")
+        return {key: self._checkValue(table_name, key, value) for key, value in values.items() if key != 'id'}
+
+    ##################
+    # changes
+
+    def insert(self, table_name, record):
+        """
+        Add a new record to a table, the record is copied.
+
+        :param table_name: The name of the table.
+        :param record: The dictionary of the new record, its 'id' is ignored. Missing keys are saved as None.
+        :return: The record as it will be saved. Its 'id' is negative until commit() sets the real one,
+                 it can be used in the FK keys of other records in this transaction.
+        :raises TransactionError: If a value doesn't match the schema, or an FK key points to a missing record.
+        """
+        self._checkOpen()
+        values = self._checkValues(table_name, record)
+        pending = self._inserts.setdefault(table_name, [])
+        new_record = {key: values.get(key) for key in my_db_schema[table_name]}
+        new_record['id'] = -(len(pending) + 1)
+        pending.append(new_record)
+        return new_record
+
+    def update(self, table_name, record_id, update_info):
+        """
+        Change fields of a record, an existing one or one inserted by this transaction.
+
+        :param table_name: The name of the table.
+        :param record_id: The 'id' of the record.
+        :param update_info: A dictionary of fields to update with their new values, the 'id' is ignored.
+        :raises TransactionError: If the record doesn't exist, or a value doesn't match the schema.
+        """
+        self._checkOpen()
+        values = self._checkValues(table_name, update_info)
+        if not self._exists(table_name, record_id):
+            raise TransactionError(f"Record {record_id} not found in table {table_name}")
+        if record_id < 0:
+            for record in self._inserts[table_name]:
+                if record['id'] == record_id:
+                    record.update(values)
+        else:
+            self._updates.setdefault(table_name, {}).setdefault(record_id, {}).update(values)
+
+    def rollback(self):
+        """
+        Discard every change, nothing was written.
+        """
+        self._checkOpen()
+        self._inserts.clear()
+        self._updates.clear()
+        self.state = 'rolled back'
+
+    ##################
+    # commit
+
+    def _operations(self):
+        """
+        Give the new records their real ids (after the highest 'id' of each table, contiguous) and
+        replace the negative ids in the FK keys. Must be called with the tables locked.
+
+        :return: The list of changes, as written to the log.
+        """
+        new_ids = {}
+        for table_name, records in self._inserts.items():
+            next_id = maxJRecordId(table_name) + 1
+            for record in records:
+                new_ids[(table_name, record['id'])] = next_id
+                next_id += 1
+
+        def resolve(table_name, values):
+            resolved = dict(values)
+            for key, value in values.items():
+                value_type, options = my_db_schema[table_name][key]
+                if value_type == 'FK' and type(value) is int and value < 0:
+                    resolved[key] = new_ids[(options[0], value)]
+            return resolved
+
+        operations = []
+        for table_name, records in self._inserts.items():
+            for record in records:
+                resolved = resolve(table_name, record)
+                resolved['id'] = new_ids[(table_name, record['id'])]
+                operations.append({'op': 'insert', 'table': table_name, 'record': resolved})
+        for table_name, updates in self._updates.items():
+            for record_id, values in updates.items():
+                operations.append({'op': 'update', 'table': table_name, 'id': record_id, 'values': resolve(table_name, values)})
+        return operations, new_ids
+
+    def commit(self):
+        """
+        Write every change. The log record holding all the changes is written first, so after a crash
+        recoverTransactions() completes the commit. An error before that rolls the transaction back.
+
+        :return: The number of changes written.
+        :raises TransactionError: If the transaction can't be committed.
+        """
+        with useDatabase(self.database):
+            return self._commit()
+
+    def _targetTables(self):
+        """
+        Get the names of the tables referenced by the FK keys of the changes.
+        """
+        targets = set()
+        for table_name, values_list in self._changedValues():
+            for key, value in values_list.items():
+                value_type, options = my_db_schema[table_name][key]
+                if value_type == 'FK' and value is not None:
+                    targets.add(options[0])
+        return targets
+
+    def _changedValues(self):
+        """
+        Iterate over the values of every insert and update, as (table_name, values).
+        """
+        for table_name, records in self._inserts.items():
+            for record in records:
+                yield table_name, {key: value for key, value in record.items() if key != 'id'}
+        for table_name, updates in self._updates.items():
+            for values in updates.values():
+                yield table_name, values
+
+    def _checkStillValid(self):
+        """
+        Check again, with the tables locked, that the records updated and the records the FK keys point to
+        still exist: another writer may have removed them since the change was added.
+
+        :raises TransactionError: If one is gone.
+        """
+        self._id_sets.clear()   # read the tables again
+        for table_name, updates in self._updates.items():
+            for record_id in updates:
+                if not self._exists(table_name, record_id):
+                    raise TransactionError(f"Record {record_id} of table {table_name} was removed before the commit")
+        for table_name, values in self._changedValues():
+            for key, value in values.items():
+                value_type, options = my_db_schema[table_name][key]
+                if value_type == 'FK' and type(value) is int and not self._exists(options[0], value):
+                    raise TransactionError(f"{table_name}.{key} = {value!r}: the record of table {options[0]} was removed before the commit")
+
+    def _commit(self):
+        self._checkOpen()
+        tables = set(self._inserts) | set(self._updates)
+        if not tables:
+            self.state = 'committed'
+            return 0
+        log_path = os.path.join(databaseFolder(), f"{TRANSACTION_LOG_PREFIX}.{os.getpid()}.{next(_log_numbers)}.log")
+        with lockTables(*(tables | self._targetTables())):     # the FK targets can't be removed until the commit is written
+            try:
+                self._checkStillValid()
+                operations, new_ids = self._operations()
+                log = {'tables': sorted(tables), 'operations': operations}
+                writeFileAtomic(log_path, lambda f: json.dump(log, f))     # the commit point
+            except Exception as err:
+                self.rollback()
+                if isinstance(err, TransactionError):
+                    raise
+                raise TransactionError(f"The transaction was rolled back: {err}") from err
+
+            self.state = 'committed'
+            inserted = [record for records in self._inserts.values() for record in records]
+            for record, operation in zip(inserted, operations):     # the inserts come first, in the same order
+                record.update(operation['record'])      # the real ids, also in the FK keys
+            try:
+                _applyOperations(operations)
+                os.remove(log_path)
+            except Exception as err:
+                raise TransactionError(f"The transaction is committed but not fully written, it will be replayed by recoverTransactions(): {err}") from err
+        return len(operations)
+
+##################
+# all or nothing
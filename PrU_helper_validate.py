@@ -0,0 +1,397 @@
+# PrU_helper_validate.py
+# offline validation of every table against my_db_schema: types, dates, 'set' values, unique ids and FK keys
+
+# each table is read once, and the FK keys are checked against the set of ids of the table they point to
+# fixed-width tables are checked on the packed integers, in chunks run in parallel by a pool of processes
+# each problem found is a violation, a tuple (record id, key, problem); repairTable() fixes what it can
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from enum import IntEnum
+from PrU_helper_db import *
+from PrU_helper_json import *
+
+VALIDATION_CHUNK_SIZE = 250000  # records of a fixed-width table checked by each process
+VALIDATION_MAX_SHOWN = 50       # violations printed per table, the others are only counted
+REPAIR_DATE_FORMATS = ('%Y/%m/%d', '%d-%m-%Y', '%d/%m/%Y', '%Y%m%d')  # other ways a date may have been typed
+
+_valid_dates = {}   # YYYYMMDD -> True if it's a real date, the tables only hold a few thousand distinct dates
+_MISSING = object()
+
+##################
+# helper functions
+
+def _isValidDate(date_int):
+    valid = _valid_dates.get(date_int)
+    if valid is None:
+        try:
+            datetime.strptime(decodeDate(date_int), '%Y-%m-%d')
+            valid = True
+        except (ValueError, TypeError):
+            valid = False
+        _valid_dates[date_int] = valid
+    return valid
+
+def _foreignTables(table_name):
+    """
+    Get the tables referenced by the FK keys of a table, as {key: target table}.
+    """
+    return {key: value_type[1][0] for key, value_type in my_db_schema[table_name].items() if value_type[0] == 'FK'}
+
+def tableIds(table_name):
+    """
+    Get the set of ids of a table, reading only the 'id' of each fixed-width record.
+
+    :param table_name: The name of the table.
+    :return: A set of ids.
+    """
+    if isFixedWidthTable(table_name):
+        id_column = list(my_db_schema[table_name]).index('id')
+        try:
+            return {row[id_column] for row in iterFixedRaw(table_name)}
+        except FileNotFoundError:
+            return set()
+    return {record.get('id') for record in loadJTable(table_name)}
+
+def _checkStored(kind, options, value, fk_ids):
+    """
+    Check a value as it's kept in a record (dates as integers, 'set' values as IntEnum members).
+    Values that don't match the schema are kept as they were read, e.g. a date string that can't be parsed.
+
+    :return: The problem, or None.
+    """
+    if value is None:
+        return "FK is empty" if kind == 'FK' else None
+    match kind:
+        case 'int':
+            if type(value) is not int:
+                return f"not an integer: {value!r}"
+        case 'text':
+            if not isinstance(value, str):
+                return f"not a text: {value!r}"
+        case 'date':
+            if type(value) is not int:
+                return f"not a date 'YYYY-MM-DD': {value!r}"
+        case 'set':
+            if not isinstance(value, IntEnum):
+                return f"not one of {options}: {value!r}"
+        case 'FK':
+            if type(value) is not int:
+                return f"not an id: {value!r}"
+            if fk_ids is not None and value not in fk_ids:
+                return f"no {options[0]} with id {value}"
+    return None
+
+def _checkPacked(kind, options, value, fk_ids):
+    """
+    Check a value from a fixed-width file (dates as YYYYMMDD, 'set' values and empty values as codes).
+
+    :return: The problem, or None.
+    """
+    match kind:
+        case 'date':
+            if value != NULL_CODE and not _isValidDate(value):
+                return f"not a date: {value}"
+        case 'set':
+            if not NULL_CODE <= value <= len(options):
+                return f"not a code of {options}: {value}"
+        case 'FK':
+            if value == NULL_CODE:
+                return "FK is empty"
+            if fk_ids is not None and value not in fk_ids:
+                return f"no {options[0]} with id {value}"
+    return None
+
+def _validateFixedChunk(table_name, start, stop, fk_id_sets, folder=None):
+    """
+    Check the packed records in the slots start to stop of a fixed-width file, run by the process pool.
+    The worker processes start on the default database, folder gives them the one being validated.
+
+    :return: A tuple (violations, first id, last id, True if the ids never decrease).
+    """
+    if folder is not None and folder != databaseFolder():
+        with useDatabase(JDatabase(folder, folder)):
+            return _validateFixedChunk(table_name, start, stop, fk_id_sets)
+    schema = my_db_schema[table_name]
+    id_column = list(schema).index('id')
+    checks = [(column, key, kind, options, fk_id_sets.get(key))
+              for column, (key, (kind, options)) in enumerate(schema.items()) if kind in ('date', 'set', 'FK')]
+    violations = []
+    first_id = last_id = None
+    ordered = True
+    for row in iterFixedRaw(table_name, start, stop):
+        record_id = row[id_column]
+        if last_id is not None:
+            if record_id == last_id:
+                violations.append((record_id, 'id', "duplicate id"))
+            elif record_id < last_id:
+                ordered = False
+        if first_id is None:
+            first_id = record_id
+        last_id = record_id
+        for column, key, kind, options, fk_ids in checks:
+            problem = _checkPacked(kind, options, row[column], fk_ids)
+            if problem is not None:
+                violations.append((record_id, key, problem))
+    return violations, first_id, last_id, ordered
+
+def _validateFixed(table_name, fk_id_sets, workers):
+    """
+    Check a fixed-width table in chunks, in parallel when it holds more than one chunk.
+    """
+    try:
+        count = fixedCount(table_name)
+    except FileNotFoundError:
+        return []
+    starts = list(range(0, count, VALIDATION_CHUNK_SIZE))
+    stops = [min(start + VALIDATION_CHUNK_SIZE, count) for start in starts]
+    if len(starts) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_validateFixedChunk, [table_name] * len(starts), starts, stops, [fk_id_sets] * len(starts),
+                                    [databaseFolder()] * len(starts)))
+    else:
+        results = [_validateFixedChunk(table_name, start, stop, fk_id_sets) for start, stop in zip(starts, stops)]
+
+    violations = [violation for result in results for violation in result[0]]
+    # when the ids never decrease, a duplicate is always next to its twin: inside a chunk or across two chunks
+    in_order = all(result[3] for result in results)
+    for previous, current in zip(results, results[1:]):
+        if previous[2] is None or current[1] is None:
+            continue
+        if current[1] == previous[2]:
+            violations.append((current[1], 'id', "duplicate id"))
+        elif current[1] < previous[2]:
+            in_order = False
+    if not in_order:    # count every id instead
+        violations = [violation for violation in violations if violation[2] != "duplicate id"]
+        id_column = list(my_db_schema[table_name]).index('id')
+        seen = set()
+        for row in iterFixedRaw(table_name):
+            if row[id_column] in seen:
+                violations.append((row[id_column], 'id', "duplicate id"))
+            seen.add(row[id_column])
+    return violations
+
+def _validateRecords(table_name, records, fk_id_sets):
+    """
+    Check the records of a table loaded in memory.
+    """
+    schema = my_db_schema[table_name]
+    violations = []
+    seen = set()
+    for record in records:
+        record_id = record.get('id')
+        if record_id in seen:
+            violations.append((record_id, 'id', "duplicate id"))
+        seen.add(record_id)
+        for key, (kind, options) in schema.items():
+            value = getattr(record, key, _MISSING) if isinstance(record, JRecord) else record.get(key, _MISSING)
+            if value is _MISSING:
+                violations.append((record_id, key, "missing key"))
+                continue
+            problem = _checkStored(kind, options, value, fk_id_sets.get(key))
+            if problem is not None:
+                violations.append((record_id, key, problem))
+        for key in record:
+            if key not in schema:
+                violations.append((record_id, key, "not in the schema"))
+    return violations
+
+##################
+# functions to validate the tables
+
+def validateTable(table_name, id_sets=None, workers=None):
+    """
+    Check every record of a table against my_db_schema, in one pass.
+
+    :param table_name: The name of the table.
+    :param id_sets: {table_name: set of ids} for the tables referenced by the FK keys, read when missing.
+    :param workers: The number of processes for the fixed-width tables, os.cpu_count() when None, 1 to check in this process.
+    :return: The list of violations, each a tuple (record id, key, problem).
+    """
+    id_sets = id_sets if id_sets is not None else {}
+    fk_id_sets = {}
+    for key, target_table in _foreignTables(table_name).items():
+        if target_table not in id_sets:
+            id_sets[target_table] = tableIds(target_table)
+        fk_id_sets[key] = id_sets[target_table]
+    if isFixedWidthTable(table_name):
+        return _validateFixed(table_name, fk_id_sets, workers)
+    return _validateRecords(table_name, loadJTable(table_name), fk_id_sets)
+
+def validateDatabase(tables=None, workers=None):
+    """
+    Check every table, the set of ids of each table is read only once.
+
+    :param tables: The names of the tables, my_db_tables when None.
+    :param workers: The number of processes for the fixed-width tables, see validateTable().
+    :return: A dictionary {table_name: list of violations}.
+    """
+    tables = tables or my_db_tables
+    id_sets = {}
+    return {table_name: validateTable(table_name, id_sets, workers) for table_name in tables}
+
+##################
+# functions to repair the tables
+
+def _repairValue(kind, options, value):
+    """
+    Get the value that replaces one that doesn't match the schema, None when it can't be guessed.
+    FK keys are never changed, the right record can't be guessed.
+    """
+    match kind:
+        case 'int':
+            try:
+                return int(str(value).strip())
+            except ValueError:
+                return None
+        case 'text':
+            return str(value)
+        case 'date':
+            for date_format in REPAIR_DATE_FORMATS:
+                try:
+                    return datetime.strptime(str(value).strip(), date_format).strftime('%Y-%m-%d')
+                except ValueError:
+                    continue
+            return None
+        case 'set':
+            for option in options:
+                if str(value).strip().lower() == option.lower():
+                    return option
+            return None
+    return value
+
+def _repairRecords(table_name, records):
+    """
+    Fix the records of a table in memory.
+
+    :return: The number of records changed.
+    """
+    schema = my_db_schema[table_name]
+    next_id = maxJRecordId(table_name, [record for record in records if type(record.get('id')) is int]) + 1
+    seen = set()
+    changed = 0
+    for record in records:
+        before = dict(record)
+        if record.get('id') in seen or type(record.get('id')) is not int:
+            record['id'] = next_id      # duplicates keep their data under a new id
+            next_id += 1
+        seen.add(record['id'])
+        for key in [key for key in record if key not in schema]:
+            del record[key]
+        for key, (kind, options) in schema.items():
+            if key == 'id':
+                continue
+            value = getattr(record, key, _MISSING) if isinstance(record, JRecord) else record.get(key, _MISSING)
+            if value is _MISSING:
+                record[key] = None
+            elif kind != 'FK' and _checkStored(kind, options, value, None) is not None:
+                record[key] = _repairValue(kind, options, value)
+        if dict(record) != before:
+            changed += 1
+    return changed
+
+def _repairFixed(table_name):
+    """
+    Fix a fixed-width table on the packed integers: invalid dates and codes are emptied, duplicate ids get new ids.
+
+    :return: The number of records changed.
+    """
+    schema = my_db_schema[table_name]
+    id_column = list(schema).index('id')
+    columns = [(column, kind, options) for column, (key, (kind, options)) in enumerate(schema.items()) if kind in ('date', 'set')]
+    rows = list(iterFixedRaw(table_name))
+    next_id = maxJRecordId(table_name) + 1
+    seen = set()
+    changed = 0
+    for number, row in enumerate(rows):
+        fixed = list(row)
+        if fixed[id_column] in seen:
+            fixed[id_column] = next_id
+            next_id += 1
+        seen.add(fixed[id_column])
+        for column, kind, options in columns:
+            if _checkPacked(kind, options, fixed[column], None) is not None:
+                fixed[column] = NULL_CODE
+        if tuple(fixed) != row:
+            rows[number] = tuple(fixed)
+            changed += 1
+    if changed:
+        writeFixedRaw(table_name, rows)
+    return changed
+
+def repairTable(table_name):
+    """
+    Fix the violations that have an obvious fix, and save the table if anything changed:
+    - duplicate ids: the later records get new ids
+    - keys not in the schema: removed, missing keys: added as None
+    - values of the wrong type: converted when possible (e.g. '12' to 12, a date typed as 'DD/MM/YYYY', 'done' to 'Done'), otherwise None
+    FK keys that point to a missing record are left as they are, they need a manual fix.
+
+    :param table_name: The name of the table.
+    :return: The number of records changed.
+    """
+    with lockTables(table_name):
+        if isFixedWidthTable(table_name):
+            try:
+                changed = _repairFixed(table_name)
+            except FileNotFoundError:
+                return 0
+            if changed:
+                bumpTableVersion(table_name)    # writeFixedRaw() doesn't, saveJTable() does
+        else:
+            records = loadJTable(table_name)
+            changed = _repairRecords(table_name, records)
+            if changed and not saveJTable(table_name, records):
+                return 0
+    return changed
+
+##################
+# functions to print the results
+
+def printValidationReport(results):
+    """
+    Prints the violations found in each table, the first VALIDATION_MAX_SHOWN of each table in a table.
+
+    Args:
+    - results (dict): {table_name: list of violations}, as returned by validateDatabase().
+    """
+    for table_name, violations in results.items():
+        if not violations:
+            console.print(f"--- {table_name}: no problems found", style="bold green")
+            continue
+        console.print(f"--- {table_name}: {len(violations)} problem(s) found", style="bold red")
+        table = Table(show_header=True, header_style="bold magenta")
+        table.add_column("ID", style="dim", justify="left")
+        table.add_column("Key", style="dim", justify="left")
+        table.add_column("Problem", justify="left")
+        for record_id, key, problem in violations[:VALIDATION_MAX_SHOWN]:
+            table.add_row(str(record_id), key, problem)
+        console.print(table)
+        if len(violations) > VALIDATION_MAX_SHOWN:
+            console.print(f"... and {len(violations) - VALIDATION_MAX_SHOWN} more", style="bold yellow")
+
+def checkDatabase(repair=False, workers=None):
+    """
+    Validate every table and print the results, optionally repairing the tables first.
+
+    Args:
+    - repair (bool): Run repairTable() on each table with violations, then validate again.
+    - workers (int): The number of processes for the fixed-width tables, see validateTable().
+
+    Returns:
+    - int: The number of violations left.
+    """
+    results = validateDatabase(workers=workers)
+    if repair:
+        for table_name, violations in results.items():
+            if violations:
+                changed = repairTable(table_name)
+                console.print(f"--- {table_name}: {changed} record(s) repaired", style="bold blue")
+        results = validateDatabase(workers=workers)
+    printValidationReport(results)
+    return sum(len(violations) for violations in results.values())
+
+##################
+# valid until proven otherwise
@@ -0,0 +1,206 @@
+# PrU_helper_warmup.py
+# the warm-up of the tables when the program starts: load them, build their indexes and check them, in the background
+
+# each table of each clinic is warmed up by a pool of threads, while the menu is already shown:
+# the json tables are parsed into their newest TableVersion (see PrU_helper_snapshot.py), the fixed-width ones are mapped,
+# and the indexes listed in my_db_indexes are built, so the first report doesn't pay for them
+# threads are used, not processes: what is loaded must stay in this program, and the fixed-width files are read through mmap
+# the checks only read the indexes: duplicate or missing ids, and FK keys pointing to no record (python PrU_main.py --validate checks everything)
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PrU_helper_db import *
+from PrU_helper_database import *
+from PrU_helper_json import *
+from PrU_helper_query import *
+from PrU_helper_snapshot import *
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+_warmup = None
+
+##################
+# warming up one table
+
+def _quickChecks(table_name):
+    """
+    Check a table with its indexes only, see warmTable().
+
+    :return: A list of problems, as texts.
+    """
+    problems = []
+    id_index = getIndex(table_name, 'id')
+    if id_index is not None:
+        duplicates = sum(1 for value, positions in id_index[0].items() if value is not None and len(positions) > 1)
+        if duplicates:
+            problems.append(f"{duplicates} duplicate id(s)")
+        if None in id_index[0]:
+            problems.append(f"{len(id_index[0][None])} record(s) without an id")
+    for key, (value_type, options) in my_db_schema[table_name].items():
+        if value_type != 'FK' or key not in my_db_indexes.get(table_name, []):
+            continue
+        target_index = getIndex(options[0], 'id')
+        if target_index is None:
+            continue
+        index = getIndex(table_name, key)
+        missing = sum(len(positions) for value, positions in index[0].items() if value is not None and value not in target_index[0])
+        if missing:
+            problems.append(f"{missing} {key} value(s) not found in {options[0]}")
+    return problems
+
+def warmTable(database, table_name):
+    """
+    Load a table of a database, build its indexes and check them.
+
+    :param database: The JDatabase.
+    :param table_name: The name of the table.
+    :return: A dictionary with 'database' (its name), 'table', 'rows', 'indexes' (the keys indexed), 'seconds',
+             'problems' (a list of texts) and 'error' (a text, or None).
+    """
+    result = {'database': database.name, 'table': table_name, 'rows': None, 'indexes': [], 'seconds': 0.0, 'problems': [], 'error': None}
+    started = time.perf_counter()
+    try:
+        with useDatabase(database):
+            if isFixedWidthTable(table_name):
+                result['rows'] = fixedCount(table_name)
+            else:
+                result['rows'] = len(latestVersion(table_name).rows)     # parsed once, shared by the next readers
+            for key in my_db_indexes.get(table_name, []):
+                if getIndex(table_name, key) is not None:
+                    result['indexes'].append(key)
+            result['problems'] = _quickChecks(table_name)
+    except Exception as err:
+        result['error'] = str(err) or type(err).__name__
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+##################
+# the warm-up of every table
+
+class Warmup:
+    """
+    The warm-up of the tables of some databases, run by a pool of threads in the background.
+    The results can be read while it runs: each table is added to results once it's done.
+    """
+
+    def __init__(self, databases, workers=J_DB_WARMUP_WORKERS):
+        """
+        :param databases: The JDatabases to warm up.
+        :param workers: The number of tables warmed up at the same time.
+        """
+        self.databases = list(databases)
+        self.workers = workers
+        self.results = []       # one dictionary per table, see warmTable(), in the order they finish
+        self.total = len(self.databases) * len(my_db_tables)
+        self.seconds = None     # the time it took, once it's done
+        self._started = None
+        self._thread = None
+
+    def start(self):
+        """
+        Start the warm-up in a background thread.
+
+        :return: The Warmup itself.
+        """
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as pool:
+            futures = [pool.submit(warmTable, database, table_name) for database in self.databases for table_name in my_db_tables]
+            for future in as_completed(futures):
+                self.results.append(future.result())
+        self.seconds = time.perf_counter() - self._started
+
+    def done(self):
+        """
+        Check if every table is warmed up.
+        """
+        return self.seconds is not None
+
+    def wait(self, timeout=None):
+        """
+        Wait until the warm-up is done.
+
+        :param timeout: The most seconds to wait, or None.
+        :return: True if it's done.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.done()
+
+    def progress(self):
+        """
+        Get the number of tables warmed up, and the number of tables.
+        """
+        return len(self.results), self.total
+
+    def problems(self):
+        """
+        Get the number of problems found (errors included).
+        """
+        return sum(len(result['problems']) + (result['error'] is not None) for result in list(self.results))
+
+def startWarmup(databases=None, workers=J_DB_WARMUP_WORKERS):
+    """
+    Start warming up the tables in the background, the warm-up is kept for currentWarmup().
+
+    :param databases: The JDatabases to warm up, the current one when None.
+    :param workers: The number of tables warmed up at the same time.
+    :return: The Warmup.
+    """
+    global _warmup
+    _warmup = Warmup(databases or [currentDatabase()], workers).start()
+    return _warmup
+
+def currentWarmup():
+    """
+    Get the warm-up started by startWarmup(), or None.
+    """
+    return _warmup
+
+##################
+# functions to print the warm-up
+
+def printWarmupReport(warmup=None):
+    """
+    Prints the time taken to warm up each table, and the problems found, even while the warm-up is running.
+
+    Args:
+    - warmup (Warmup): The warm-up, the one started by startWarmup() when None.
+    """
+    warmup = warmup or currentWarmup()
+    if warmup is None:
+        console.print("The tables were not warmed up, see J_DB_WARMUP_ON_START in PrU_helper_db.py.", style="bold yellow")
+        pause()
+        return
+
+    ready, total = warmup.progress()
+    title = f"Warm-up: {total} tables in {warmup.seconds:.2f} s" if warmup.done() else f"Warm-up running: {ready} of {total} tables"
+    table = Table(show_header=True, header_style="bold magenta", title=title, title_style="bold blue")
+    if len(warmup.databases) > 1:
+        table.add_column("Clinic", style="dim", justify="left")
+    table.add_column("Table", style="dim", justify="left")
+    table.add_column("Rows", style="dim", justify="right")
+    table.add_column("Indexes", style="dim", justify="left")
+    table.add_column("Time (s)", style="dim", justify="right")
+    table.add_column("Checks", justify="left")
+    for result in sorted(warmup.results, key=lambda result: (str(result['database']), result['table'])):
+        if result['error'] is not None:
+            checks = f"[bold red]error: {result['error']}[/bold red]"
+        elif result['problems']:
+            checks = f"[bold yellow]{'; '.join(result['problems'])}[/bold yellow]"
+        else:
+            checks = "[green]ok[/green]"
+        row = [result['table'], str(result['rows']), ", ".join(result['indexes']), f"{result['seconds']:.2f}", checks]
+        table.add_row(*([str(result['database'])] if len(warmup.databases) > 1 else []) + row)
+    console.print(table)
+    pause()
+
+##################
+# stretch before you run
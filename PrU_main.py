@@ -4,6 +4,11 @@
 from PrU_helper_json import *
 from PrU_helper_db import *
 from PrU_helper_menus import *
+from PrU_helper_reports import *
+from PrU_helper_validate import *
+from PrU_helper_clinics import *
+from PrU_helper_warmup import *
+import sys
 import beaupy
 from rich.console import Console
 from art import text2art
@@ -12,7 +17,24 @@ console = Console()
 
 def initializeProgramSettings():
     """
-    Initialize program settings by creating the database files.
+    Initialize program settings by creating the database files of every clinic in my_db_clinics,
+    or of J_DB_FOLDER when there's only one. The first clinic is selected.
+    The tables are then warmed up in the background (see PrU_helper_warmup.py), the menu doesn't wait for it.
+    """
+    router = clinicRouter()
+    databases = [router.route(clinic_id) for clinic_id in router.clinicIds()] or [defaultDatabase()]
+    for database in databases:
+        if my_db_clinics:
+            console.print(f"--- Clinic {database.name}", style="bold blue")
+        with useDatabase(database):
+            initializeDatabase()
+    selectDatabase(databases[0])
+    if J_DB_WARMUP_ON_START:
+        startWarmup(databases)
+
+def initializeDatabase():
+    """
+    Create the files of the current database.
     If the file already exists, do nothing.
     """
     for table in my_db_tables:
@@ -27,17 +49,42 @@ def initializeProgramSettings():
             case 1:
                 console.print(f"--- The {table} table was initialized with an empty table", style="bold green")
 
+    # finish the transactions interrupted while they were being written, e.g. by a crash
+    match recoverTransactions():
+        case -1:
+            console.print(f"--- Error replaying an interrupted transaction, the tables may be incomplete", style="bold red")
+        case 0:
+            pass
+        case replayed:
+            console.print(f"--- {replayed} interrupted transaction(s) completed", style="bold green")
+
+    # finish moving the records of an interrupted archiving out of the live tables
+    if recoverArchives():
+        console.print(f"--- An interrupted archiving was completed", style="bold green")
+
+    # check every table against the schema, see PrU_helper_validate.py
+    if J_DB_VALIDATE_ON_START:
+        console.print(f"--- Validating the tables...", style="bold blue")
+        checkDatabase()
+
 def mainLoop():
     """
     Main loop of the program, displaying the home menu and handling user selections.
     """
     # Set the Home Menu
-    menu_home = ["Print the records in a table", "Update the records in a Table", "Print Reports", "Manage appointments", "Reset a table", "Exit"]
+    menu_home = ["Print the records in a table", "Update the records in a Table", "Print Reports", "Manage appointments", "Reset a table", "Export a table or report", "Archive finished appointments", "Switch clinic", "Exit"]
 
     # The main loop starts here
     while True:
         console.clear()
         console.print("Doctors 'R' Us - Booking system", style="bold blue")
+        if my_db_clinics:
+            console.print(f"Clinic: {currentDatabase().name}", style="bold blue")
+        warmup = currentWarmup()
+        if warmup is not None and not warmup.done():
+            console.print("Loading the tables: {} of {} ready".format(*warmup.progress()), style="dim")
+        elif warmup is not None and warmup.problems():
+            console.print(f"The warm-up found {warmup.problems()} problem(s), see Print Reports > Startup warm-up of the tables", style="bold yellow")
         console.print("Main Menu", style="bold green")
         op = beaupy.select(menu_home, cursor="->", cursor_style='green', return_index=True) + 1  # Returns index of the menuList
 
@@ -69,7 +116,7 @@ def mainLoop():
             case 3:     # Select a report to print
                 console.clear()
                 console.print("Select the report to print:", style="bold blue")
-                menu_list = ['All the appointments for a date', 'Sum of total revenue for a range of dates', 'Appointment history for a patient']
+                menu_list = ['All the appointments for a date', 'Sum of total revenue for a range of dates', 'Appointment history for a patient', 'Doctor leaderboard for a range of dates', 'Revenue of every clinic for a range of dates', 'Doctor leaderboard of every clinic for a range of dates', 'Startup warm-up of the tables']
                 op = beaupy.select(menu_list, cursor="->", cursor_style='green')
                 match op:
 
@@ -82,6 +129,18 @@ def mainLoop():
                     case 'Appointment history for a patient':
                         printAppointmentsForPatient()
 
+                    case 'Doctor leaderboard for a range of dates':
+                        printDoctorLeaderboard()
+
+                    case 'Revenue of every clinic for a range of dates':
+                        printRevenueForAllClinics()
+
+                    case 'Doctor leaderboard of every clinic for a range of dates':
+                        printDoctorLeaderboardForAllClinics()
+
+                    case 'Startup warm-up of the tables':
+                        printWarmupReport()
+
             case 4:     # manage join tables, in this case the 'appointment_join' table
                 console.clear()
                 printMenuEditJoinTable()        # safe to call function with default args
@@ -94,13 +153,45 @@ def mainLoop():
                     console.clear()
                     if beaupy.confirm(f"Reset this table: {op}?"):
                         initJTable(op, True)
+                        if op in my_db_archives:
+                            dropArchive(op)     # the archived records are part of the table
                         console.print("The table was reset.", style="bold green")
                         pause()
                     else:
                         console.print("Table reset is cancelled.", style="bold yellow")
                         pause()
 
-            case 6:     # exit the program
+            case 6:     # export a table or a report to a CSV or JSONL file
+                console.clear()
+                printMenuExport()
+
+            case 7:     # move the finished appointments to the archive, see PrU_helper_archive.py
+                console.clear()
+                console.print(f"Finished appointments older than {J_DB_ARCHIVE_AFTER_DAYS} days are moved to the archive.", style="bold blue")
+                console.print("They are still shown in the reports, but can't be edited.", style="bold blue")
+                if beaupy.confirm("Archive them now?"):
+                    for table_name in my_db_archives:
+                        archived = archiveTable(table_name)
+                        console.print(f"{archived} record(s) of {table_name} archived.", style="bold green")
+                        for year, count in archiveStats(table_name).items():
+                            console.print(f"  {year}: {count} record(s) in the archive", style="dim")
+                else:
+                    console.print("Archiving cancelled.", style="bold yellow")
+                pause()
+
+            case 8:     # work on another clinic, see my_db_clinics in PrU_helper_db.py
+                console.clear()
+                router = clinicRouter()
+                if not router.clinicIds():
+                    console.print("Only one clinic is set up, add the clinics to my_db_clinics in PrU_helper_db.py.", style="bold yellow")
+                    pause()
+                else:
+                    console.print("Select the clinic:", style="bold blue")
+                    clinic_id = beaupy.select(router.clinicIds(), cursor="->", cursor_style='green')
+                    if clinic_id is not None:
+                        selectDatabase(router.route(clinic_id))
+
+            case 9:     # exit the program
                 console.clear()
                 if beaupy.confirm("Are you sure you want to exit the program?"):
                     break       # exit the main loop
@@ -112,25 +203,41 @@ def mainLoop():
                 console.print("Try again", style="bold yellow") # just in case something goes wrong
                 pause()
 
-###
-# Initialize program settings
-###
-console.clear()
-console.print(text2art("Doctors 'R' Us", font='small'))
-console.print("Doctors 'R' Us", style="bold blue")
-initializeProgramSettings()
-console.print("Welcome to the appoitment booking system", style="bold blue")
-pause()
-
-###
-# Start the main loop
-###
-mainLoop()
-
-# exit the main loop
-console.print(text2art("Doctors 'R' Us", font='small'))
-console.print("Thank you for using our booking system.", style="bold blue")
-console.print("Bye :)", style="bold yellow")
+# the program only starts when this file is run, not when it's imported (e.g. by the worker processes of the validator)
+if __name__ == "__main__":
+
+    ###
+    # Command line: python PrU_main.py --validate [--repair] checks the tables (of every clinic) and exits
+    ###
+    if '--validate' in sys.argv or '--repair' in sys.argv:
+        router = clinicRouter()
+        problems = 0
+        for database in [router.route(clinic_id) for clinic_id in router.clinicIds()] or [defaultDatabase()]:
+            if my_db_clinics:
+                console.print(f"--- Clinic {database.name}", style="bold blue")
+            with useDatabase(database):
+                problems += checkDatabase(repair='--repair' in sys.argv)
+        raise SystemExit(1 if problems else 0)
+
+    ###
+    # Initialize program settings
+    ###
+    console.clear()
+    console.print(text2art("Doctors 'R' Us", font='small'))
+    console.print("Doctors 'R' Us", style="bold blue")
+    initializeProgramSettings()
+    console.print("Welcome to the appoitment booking system", style="bold blue")
+    pause()
+
+    ###
+    # Start the main loop
+    ###
+    mainLoop()
+
+    # exit the main loop
+    console.print(text2art("Doctors 'R' Us", font='small'))
+    console.print("Thank you for using our booking system.", style="bold blue")
+    console.print("Bye :)", style="bold yellow")
 
 ##################
 # You've reached the end of the file, well done!
\ No newline at end of file
@@ -0,0 +1,33 @@
+# conftest.py
+# the fixtures shared by the tests: an empty database in a temporary folder, and a few records to start from
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from PrU_helper_database import *
+from PrU_helper_json import *
+
+def seedTables(patients=3, doctors=2, appointments=6):
+    """
+    Save a few records to the tables of the current database, the appointments alternate between 'Booked' and 'Done' in 2020.
+    """
+    saveJTable('patient', [{'id': i, 'name': f"Patient {i}", 'date_of_birth': '1990-01-01', 'status': 'Active'} for i in range(1, patients + 1)])
+    saveJTable('doctor', [{'id': i, 'name': f"Doctor {i}", 'salary': 1000, 'status': 'Available'} for i in range(1, doctors + 1)])
+    saveJTable('appointment_join', [{'id': i, 'booking_date': f"2020-01-{i:02d}", 'patient_id': i % patients + 1, 'doctor_id': i % doctors + 1,
+                                     'price': 10 * i, 'status': 'Done' if i % 2 else 'Booked'} for i in range(1, appointments + 1)])
+
+@pytest.fixture
+def database(tmp_path):
+    """
+    A database in a temporary folder, current for the whole test, with every table initialized.
+    """
+    folder = tmp_path / "clinic"
+    folder.mkdir()
+    my_database = JDatabase('test', str(folder))
+    with useDatabase(my_database):
+        for table_name in my_db_tables:
+            initJTable(table_name)
+        yield my_database
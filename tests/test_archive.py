@@ -0,0 +1,57 @@
+# test_archive.py
+# archiving: a move interrupted after the segments were written is completed, and no record is counted twice meanwhile
+
+import json
+import os
+from datetime import date
+import PrU_helper_archive
+from PrU_helper_archive import *
+from PrU_helper_json import *
+from PrU_helper_query import *
+from conftest import seedTables
+
+def _archive():
+    return archiveTable('appointment_join', older_than_days=365, today=date(2024, 1, 1))
+
+def _interruptedArchive(monkeypatch):
+    """
+    Archive the finished appointments, stopping before they're removed from the live table.
+    """
+    with monkeypatch.context() as patch:
+        patch.setattr(PrU_helper_archive, 'saveJTable', lambda *args, **kwargs: 0)
+        try:
+            _archive()
+        except OSError:
+            pass
+        else:
+            raise AssertionError("the archiving was not interrupted")
+
+def test_recover_interrupted_archive_move(database, monkeypatch):
+    seedTables(appointments=6)
+    _interruptedArchive(monkeypatch)
+    assert sorted(loadArchiveManifest('appointment_join')['moving']) == [1, 3, 5]
+    assert [record['id'] for record in loadJTable('appointment_join')] == [1, 2, 3, 4, 5, 6]
+
+    assert recoverArchives() == 3
+    manifest = loadArchiveManifest('appointment_join')
+    assert 'moving' not in manifest
+    assert [record['id'] for record in loadJTable('appointment_join')] == [2, 4, 6]
+    assert sorted(record['id'] for record in iterArchive('appointment_join')) == [1, 3, 5]
+    listed = {segment['file'] for segment in manifest['segments'].values()} | {'manifest.json'}
+    assert set(os.listdir(archiveFolder('appointment_join'))) == listed
+    assert recoverArchives() == 0
+
+def test_query_during_interrupted_move_counts_once(database, monkeypatch):
+    seedTables(appointments=6)
+    _interruptedArchive(monkeypatch)
+    assert Query('appointment_join').withArchive().count() == 6
+    assert 'moving' not in loadArchiveManifest('appointment_join')
+
+def test_archive_then_archive_again(database):
+    seedTables(appointments=6)
+    assert _archive() == 3
+    updateJRecord('appointment_join', 2, {'status': 'Done'})
+    assert _archive() == 1
+    (segment,) = loadArchiveManifest('appointment_join')['segments'].values()
+    assert segment['rows'] == 4
+    assert Query('appointment_join').withArchive().count() == 6
@@ -0,0 +1,29 @@
+# test_cache.py
+# the report cache: a result is reused until one of the tables the report reads is written
+
+from PrU_helper_json import *
+from PrU_helper_cache import *
+from PrU_helper_reports import *
+from conftest import seedTables
+
+def test_cached_report_is_dropped_on_write(database):
+    seedTables()
+    clearReportCache()
+    rows, total = getRevenueForDateRange('2020-01-01', '2020-01-31')
+    assert ([row['id'] for row in rows], total) == ([1, 3, 5], 90)
+
+    hits = reportCacheInfo()['hits']
+    assert getRevenueForDateRange('2020-01-01', '2020-01-31') == (rows, total)
+    assert reportCacheInfo()['hits'] == hits + 1
+
+    updateJRecord('appointment_join', 2, {'status': 'Done'})
+    rows, total = getRevenueForDateRange('2020-01-01', '2020-01-31')
+    assert ([row['id'] for row in rows], total) == ([1, 2, 3, 5], 110)
+    assert reportCacheInfo()['hits'] == hits + 1
+
+def test_write_to_a_joined_table_drops_the_report(database):
+    seedTables()
+    clearReportCache()
+    assert getAppointmentsForDate('2020-01-03')[0]['patient_name'] == "Patient 1"
+    updateJRecord('patient', 1, {'name': "Renamed"})
+    assert getAppointmentsForDate('2020-01-03')[0]['patient_name'] == "Renamed"
@@ -0,0 +1,42 @@
+# test_clinics.py
+# several clinic databases in one program: each helper works on the database it's given, and the reports are merged
+
+import PrU_helper_clinics
+from PrU_helper_database import *
+from PrU_helper_json import *
+from PrU_helper_clinics import *
+from conftest import seedTables
+
+def _router(tmp_path, monkeypatch):
+    router = ClinicRouter({'north': str(tmp_path / "north"), 'south': str(tmp_path / "south")})
+    for clinic_id, appointments in (('north', 6), ('south', 3)):
+        with useDatabase(router.route(clinic_id)):
+            for table_name in my_db_tables:
+                initJTable(table_name)
+            seedTables(appointments=appointments)
+            updateJRecord('doctor', 1, {'name': f"Doctor 1 of {clinic_id}"})
+    monkeypatch.setattr(PrU_helper_clinics, '_router', router)
+    return router
+
+def test_helpers_work_on_the_database_given(tmp_path, monkeypatch):
+    router = _router(tmp_path, monkeypatch)
+    north, south = router.route('north'), router.route('south')
+    assert len(loadJTable('appointment_join', database=north)) == 6
+    assert len(loadJTable('appointment_join', database=south)) == 3
+
+    with useDatabase(south):
+        records = iterJTable('doctor', database=north)     # a generator, stepped while south is current
+        assert next(records)['name'] == "Doctor 1 of north"
+        assert currentDatabase() is south
+        assert [record['name'] for record in records] == ["Doctor 2"]
+        assert getJRecord('doctor', 1)['name'] == "Doctor 1 of south"
+
+def test_reports_across_every_clinic(tmp_path, monkeypatch):
+    _router(tmp_path, monkeypatch)
+    totals, total_price = getRevenueForAllClinics('2020-01-01', '2020-01-31')
+    assert totals == {'north': (3, 90), 'south': (2, 40)}
+    assert total_price == 130
+
+    busiest, earners = getDoctorLeaderboardForAllClinics('2020-01-01', '2020-01-31', top_n=2)
+    assert [(doctor['clinic'], doctor['doctor_id'], doctor['appointments']) for doctor in busiest] == [('north', 2, 3), ('north', 1, 3)]
+    assert [(doctor['clinic'], doctor['name'], doctor['revenue']) for doctor in earners] == [('north', "Doctor 2", 90), ('south', "Doctor 2", 40)]
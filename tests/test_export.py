@@ -0,0 +1,40 @@
+# test_export.py
+# streaming exports: every row of a table or a report is written, in CSV or JSONL, gzip compressed or not
+
+import csv
+import gzip
+import json
+import pytest
+from PrU_helper_json import *
+from PrU_helper_export import *
+from conftest import seedTables
+
+def _readBack(file_path, file_format, compress):
+    opener = gzip.open if compress else open
+    with opener(file_path, 'rt', encoding='utf-8', newline='') as f:
+        if file_format == 'csv':
+            return list(csv.DictReader(f))
+        return [json.loads(line) for line in f]
+
+@pytest.mark.parametrize('file_format', ['csv', 'jsonl'])
+@pytest.mark.parametrize('compress', [False, True])
+def test_table_export_round_trip(database, tmp_path, file_format, compress):
+    seedTables(appointments=25)
+    file_path = str(tmp_path / exportFileName('appointment_join', file_format, compress))
+    assert exportTable('appointment_join', file_path, file_format, compress) == 25
+
+    rows = _readBack(file_path, file_format, compress)
+    assert len(rows) == 25
+    assert list(rows[0]) == list(my_db_schema['appointment_join']) + ['patient_name', 'doctor_name']
+    assert (rows[0]['booking_date'], str(rows[0]['price']), rows[0]['patient_name']) == ('2020-01-01', '10', "Patient 2")
+
+def test_rows_are_written_in_chunks(tmp_path):
+    rows = ({'id': i, 'name': f"Row {i}"} for i in range(1, 1001))     # a generator, never held in memory
+    file_path = str(tmp_path / "rows.jsonl")
+    assert writeRows(rows, file_path, 'jsonl', chunk_size=64) == 1000
+    assert _readBack(file_path, 'jsonl', False)[-1] == {'id': 1000, 'name': "Row 1000"}
+
+def test_report_export(database, tmp_path):
+    seedTables()
+    file_path = str(tmp_path / "revenue.csv")
+    assert exportReport('revenue_for_date_range', file_path, start_date_str='2020-01-01', end_date_str='2020-01-31') == 3
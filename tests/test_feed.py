@@ -0,0 +1,59 @@
+# test_feed.py
+# the change feed: what another program wrote is patched into the indexes and the snapshot versions,
+# and gives the same result as loading the table again
+
+import PrU_helper_query
+import PrU_helper_snapshot
+from PrU_helper_database import *
+from PrU_helper_json import *
+from PrU_helper_feed import *
+from PrU_helper_query import *
+from PrU_helper_snapshot import *
+from conftest import seedTables
+
+def _fail(*args, **kwargs):
+    raise AssertionError("the table was read again instead of patched")
+
+def test_index_is_patched_like_a_rebuild(database, monkeypatch):
+    seedTables(appointments=20)
+    getIndex('appointment_join', 'patient_id')
+    other = JDatabase('other', database.folder)     # another program on the same folder
+    updateJRecord('appointment_join', 4, {'patient_id': 3}, database=other)
+    addJRecord('appointment_join', {'booking_date': '2020-02-01', 'patient_id': 1, 'doctor_id': 1, 'price': 1, 'status': 'Booked'}, database=other)
+
+    monkeypatch.setattr(PrU_helper_query, 'createIndex', _fail)
+    patched = getIndex('appointment_join', 'patient_id')
+    monkeypatch.undo()
+    assert patched == createIndex('appointment_join', 'patient_id')
+    assert 3 in patched[0][3] and 20 in patched[0][1]     # the slots of the records 4 and 21
+
+def test_snapshot_version_is_patched_like_a_reload(database, monkeypatch):
+    seedTables()
+    latestVersion('patient')
+    other = JDatabase('other', database.folder)
+    updateJRecord('patient', 2, {'name': "Patched"}, database=other)
+    addJRecord('patient', {'name': "New", 'date_of_birth': '2002-02-02', 'status': 'Active'}, database=other)
+
+    monkeypatch.setattr(PrU_helper_snapshot, 'loadJTable', _fail)
+    patched = latestVersion('patient')
+    monkeypatch.undo()
+    assert [dict(record) for record in patched.rows] == [dict(record) for record in loadJTable('patient')]
+    assert patched.rows[1]['name'] == "Patched"
+
+def test_whole_table_write_reloads(database):
+    seedTables()
+    old = latestVersion('patient')
+    other = JDatabase('other', database.folder)
+    saveJTable('patient', [{'id': 7, 'name': "Only one", 'date_of_birth': None, 'status': 'Active'}], database=other)   # no changes given
+    assert patchChanges('patient', old.feed_position, old.stamp, tableVersion('patient')) is None
+    assert [record['id'] for record in latestVersion('patient').rows] == [7]
+
+def test_change_feed_skips_own_writes(database):
+    seedTables()
+    feed = ChangeFeed(['patient'])
+    updateJRecord('patient', 1, {'name': "Mine"})
+    assert feed.poll() == {}
+    other = JDatabase('other', database.folder)
+    updateJRecord('patient', 2, {'name': "Theirs"}, database=other)
+    (entry,) = feed.poll()['patient']
+    assert entry['changes'][0][1]['name'] == "Theirs"
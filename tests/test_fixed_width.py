@@ -0,0 +1,35 @@
+# test_fixed_width.py
+# the appointments stored in a fixed-width file: read back as saved, and migrated from the old json file
+
+import json
+import os
+from PrU_helper_json import *
+from PrU_helper_mmap import *
+from conftest import seedTables
+
+def test_records_read_back_as_saved(database):
+    seedTables()
+    assert tableFilePath('appointment_join').endswith(".dat")
+    appointments = [dict(record) for record in loadJTable('appointment_join')]
+    assert len(appointments) == 6
+    assert appointments[2] == {'id': 3, 'booking_date': '2020-01-03', 'patient_id': 1, 'doctor_id': 2, 'price': 30, 'status': 'Done'}
+    assert dict(getJRecord('appointment_join', 4)) == appointments[3]
+
+    addJRecord('appointment_join', {'booking_date': '2020-02-01', 'patient_id': None, 'doctor_id': 1, 'price': None, 'status': 'Booked'})
+    assert dict(getJRecord('appointment_join', 7)) == {'id': 7, 'booking_date': '2020-02-01', 'patient_id': None, 'doctor_id': 1, 'price': None, 'status': 'Booked'}
+    assert len(loadJTable('appointment_join')) == 7
+
+def test_json_records_are_migrated_without_failing_on_bad_values(database):
+    json_path = os.path.splitext(tableFilePath('appointment_join'))[0] + ".json"
+    os.remove(tableFilePath('appointment_join'))
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump([{'id': 1, 'booking_date': '2021-05-04', 'patient_id': 1, 'doctor_id': 1, 'price': 15, 'status': 'Done'},
+                   {'id': 2, 'booking_date': '04/05/2021', 'patient_id': 1, 'doctor_id': 1, 'price': 'free', 'status': 'Postponed', 'note': "x"},
+                   "not a record"], f)
+
+    assert initJTable('appointment_join') == 0
+    appointments = [dict(record) for record in loadJTable('appointment_join')]
+    assert appointments[0]['status'] == 'Done'
+    assert appointments[1] == {'id': 2, 'booking_date': None, 'patient_id': 1, 'doctor_id': 1, 'price': None, 'status': None}
+    assert len(appointments) == 2
+    assert os.path.exists(json_path)    # kept as it was
@@ -0,0 +1,26 @@
+# test_join.py
+# the hash join on FK keys: the same result whether the referenced table fits in one hash table or is read per chunk
+
+import pytest
+from PrU_helper_json import *
+from PrU_helper_query import *
+from conftest import seedTables
+
+def _expected(fk_key, target_table):
+    names = {record['id']: record['name'] for record in loadJTable(target_table)}
+    return [(record['id'], names.get(record[fk_key])) for record in loadJTable('appointment_join')]
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 5, 1000])
+def test_join_matches_a_dictionary_lookup(database, chunk_size):
+    seedTables(patients=7, doctors=3, appointments=20)
+    updateJRecord('appointment_join', 4, {'patient_id': 99})   # points to no record
+    joined = hashJoin(loadJTable('appointment_join'), 'appointment_join', 'patient_id', chunk_size=chunk_size)
+    assert [(row['id'], values['name'] if values else None) for row, values in joined] == _expected('patient_id', 'patient')
+
+def test_query_join_adds_the_named_columns(database):
+    seedTables()
+    rows = Query('appointment_join').where('status', '==', 'Done').join('patient_id').join('doctor_id', 'name', 'salary').orderBy('id').run()
+    assert [row['id'] for row in rows] == [1, 3, 5]
+    assert rows[0]['patient_name'] == "Patient 2"
+    assert (rows[0]['doctor_name'], rows[0]['doctor_salary']) == ("Doctor 2", 1000)
+    assert set(rows[0]) == set(my_db_schema['appointment_join']) | {'patient_name', 'doctor_name', 'doctor_salary'}
@@ -0,0 +1,40 @@
+# test_leaderboard.py
+# the doctor leaderboard: the top-N of each ranking matches a full sort, canceled appointments don't count
+
+from PrU_helper_db import *
+from PrU_helper_json import *
+from PrU_helper_reports import *
+from conftest import seedTables
+
+def _appointments():
+    # doctor d has d booked, d * 2 done (at 10 * d each) and one canceled appointment, plus doctor 3 earns more per visit
+    appointments = []
+    for doctor_id in (1, 2, 3, 4):
+        for status, count in (('Booked', doctor_id), ('Done', doctor_id * 2), ('Canceled', 1)):
+            price = 100 if doctor_id == 3 else 10 * doctor_id
+            appointments.extend({'booking_date': '2020-01-05', 'patient_id': 1, 'doctor_id': doctor_id, 'price': price, 'status': status}
+                                for _ in range(count))
+    appointments.append({'booking_date': '2020-02-01', 'patient_id': 1, 'doctor_id': 1, 'price': 1000, 'status': 'Done'})   # out of the range
+    return [dict(appointment, id=number) for number, appointment in enumerate(appointments, start=1)]
+
+def test_rankings_match_a_full_sort(database):
+    seedTables(doctors=4)
+    updateJRecord('doctor', 4, {'status': 'Unavailable'})
+    saveJTable('appointment_join', _appointments())
+
+    busiest, earners = getDoctorLeaderboard('2020-01-01', '2020-01-10', top_n=2)
+    assert [(doctor['doctor_id'], doctor['appointments'], doctor['done'], doctor['canceled']) for doctor in busiest] == [(4, 12, 8, 1), (3, 9, 6, 1)]
+    assert [(doctor['doctor_id'], doctor['revenue']) for doctor in earners] == [(3, 600), (4, 320)]
+
+    every_busiest, every_earner = getDoctorLeaderboard('2020-01-01', '2020-01-10', top_n=10)
+    assert [doctor['doctor_id'] for doctor in every_busiest] == [4, 3, 2, 1]
+    assert every_busiest[:2] == busiest
+    assert sorted(every_earner, key=lambda doctor: doctor['revenue'], reverse=True) == every_earner
+
+    assert busiest[1]['name'] == "Doctor 3"
+    assert busiest[1]['utilization'] == 9 / (10 * J_DB_DOCTOR_DAILY_SLOTS)
+    assert busiest[0]['utilization'] is None    # not 'Available'
+
+def test_empty_range_has_no_ranking(database):
+    seedTables()
+    assert getDoctorLeaderboard('2030-01-01', '2030-12-31') == ([], [])
@@ -0,0 +1,104 @@
+# test_partial_writes.py
+# an update writes only what changed: the delta file of the json tables (merged on load, kept with its json file when
+# the folder is copied, ignored once stale) and the bytes of the record patched in place in the fixed-width file
+
+import os
+import shutil
+import PrU_helper_mmap
+from PrU_helper_database import *
+from PrU_helper_json import *
+from PrU_helper_mmap import *
+from PrU_helper_snapshot import *
+from conftest import seedTables
+
+def _patients(database):
+    return {record['id']: dict(record) for record in loadJTable('patient', database=database)}
+
+def test_update_goes_to_the_delta_and_is_merged_on_reload(database):
+    seedTables()
+    with open(tableFilePath('patient'), 'rb') as f:
+        saved = f.read()
+    assert updateJRecord('patient', 2, {'name': "Renamed"}) == 1
+    with open(tableFilePath('patient'), 'rb') as f:
+        assert f.read() == saved    # only the delta file was written
+    assert os.path.exists(deltaFilePath('patient'))
+
+    reloaded = JDatabase('reload', database.folder)     # a new program on the same folder
+    patients = _patients(reloaded)
+    assert patients[2]['name'] == "Renamed"
+    assert len(patients) == 3
+
+def test_delta_survives_a_folder_copy(database, tmp_path):
+    seedTables()
+    updateJRecord('patient', 1, {'name': "Copied"})
+    addJRecord('patient', {'name': "Added", 'date_of_birth': '2001-02-03', 'status': 'Active'})
+    copy_folder = str(tmp_path / "backup")
+    shutil.copytree(database.folder, copy_folder)     # new inodes and mtimes
+
+    patients = _patients(JDatabase('backup', copy_folder))
+    assert patients[1]['name'] == "Copied"
+    assert patients[4]['name'] == "Added"
+    assert patients == _patients(database)
+
+def test_stale_delta_is_ignored_and_never_appended_to(database):
+    seedTables()
+    updateJRecord('patient', 1, {'name': "Old delta"})
+    with open(deltaFilePath('patient'), 'rb') as f:
+        stale = f.read()
+    saveJTable('patient', [{'id': 1, 'name': "Saved in full", 'date_of_birth': None, 'status': 'Active'}])
+    assert not os.path.exists(deltaFilePath('patient'))
+
+    # a delta file left by a save that stopped before removing it
+    with open(deltaFilePath('patient'), 'wb') as f:
+        f.write(stale)
+    assert _patients(database)[1]['name'] == "Saved in full"
+
+    assert updateJRecord('patient', 1, {'status': 'Innactive'}) == 1
+    patients = _patients(JDatabase('reload', database.folder))
+    assert patients[1]['name'] == "Saved in full"
+    assert patients[1]['status'] == 'Innactive'
+
+def _fixedFile():
+    with open(fixedTablePath('appointment_join'), 'rb') as f:
+        return os.fstat(f.fileno()).st_ino, f.read()
+
+def _changedBytes(before, after):
+    return [position for position, (old, new) in enumerate(zip(before, after)) if old != new]
+
+def _priceRange(record_id):
+    layout = fixedLayout('appointment_join')
+    (start, end), = [(start, end) for key, start, end in PrU_helper_mmap._fieldRanges('appointment_join') if key == 'price']
+    offset = FIXED_HEADER.size + (record_id - 1) * layout.size
+    return range(offset + start, offset + end)
+
+def test_fixed_update_patches_the_file_in_place(database):
+    seedTables()
+    inode, before = _fixedFile()
+    assert updateJRecord('appointment_join', 3, {'price': 1234}) == 1
+    after_inode, after = _fixedFile()
+    assert after_inode == inode
+    assert len(after) == len(before)
+    assert set(_changedBytes(before, after)) <= set(_priceRange(3))
+    assert getJRecord('appointment_join', 3)['price'] == 1234
+
+def test_fixed_update_stays_in_place_under_a_pinned_snapshot(database):
+    seedTables()
+    inode, before = _fixedFile()
+    with pinSnapshot(['appointment_join']) as snapshot:
+        assert updateJRecord('appointment_join', 3, {'price': 1234}) == 1
+        assert updateJRecord('appointment_join', 3, {'price': 4321}) == 1
+        after_inode, after = _fixedFile()
+        assert after_inode == inode
+        assert set(_changedBytes(before, after)) <= set(_priceRange(3))
+
+        # the snapshot still reads the record as it was when it was pinned, the current file has the new price
+        rows = snapshot.rows('appointment_join')
+        assert [record['price'] for record in rows] == [10, 20, 30, 40, 50, 60]
+        assert rows[2]['price'] == 30
+        assert list(rows.rawSlots([2])) == [list(rows.raw())[2]]
+        assert getJRecord('appointment_join', 3)['price'] == 4321
+
+    # no view left: the next update empties the undo file
+    assert updateJRecord('appointment_join', 4, {'price': 1}) == 1
+    assert os.path.getsize(fixedUndoPath('appointment_join')) == 0
+    assert _fixedFile()[0] == inode
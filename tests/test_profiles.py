@@ -0,0 +1,25 @@
+# test_profiles.py
+# the per-patient profiles: built once, then kept up to date by each write to the appointments
+
+from PrU_helper_json import *
+from PrU_helper_profiles import *
+from conftest import seedTables
+
+def test_profile_follows_the_writes(database):
+    seedTables()
+    profile = getPatientProfile(2)
+    assert profile == {'appointments': 2, 'by_status': {'Done': 1, 'Booked': 1}, 'spend': 10, 'last_visit': '2020-01-01', 'next_visit': None}
+
+    addJRecord('appointment_join', {'booking_date': '2099-01-01', 'patient_id': 2, 'doctor_id': 1, 'price': 70, 'status': 'Booked'})
+    updateJRecord('appointment_join', 4, {'status': 'Done'})
+    profile = getPatientProfile(2)
+    assert profile['by_status'] == {'Done': 2, 'Booked': 1}
+    assert (profile['spend'], profile['last_visit'], profile['next_visit']) == (50, '2020-01-04', '2099-01-01')
+
+    updateJRecord('appointment_join', 4, {'patient_id': 3})    # moved to another patient
+    assert getPatientProfile(2)['by_status'] == {'Done': 1, 'Booked': 1}
+    assert getPatientProfile(3)['spend'] == 50 + 40
+
+def test_unknown_patient_has_an_empty_profile(database):
+    seedTables()
+    assert getPatientProfile(42)['appointments'] == 0
@@ -0,0 +1,54 @@
+# test_query.py
+# the query engine: an index lookup returns the same rows as a full scan, and the planner picks the index
+
+import pytest
+from PrU_helper_db import *
+from PrU_helper_json import *
+from PrU_helper_query import *
+from conftest import seedTables
+
+def _appointments():
+    return [{'id': i, 'booking_date': f"2021-{i % 12 + 1:02d}-{i % 28 + 1:02d}", 'patient_id': i % 3 + 1, 'doctor_id': i % 2 + 1,
+             'price': i, 'status': ('Booked', 'Canceled', 'Done')[i % 3]} for i in range(1, 121)]
+
+def _ids(rows):
+    return sorted(row['id'] for row in rows)
+
+QUERIES = [
+    lambda: Query('appointment_join').where('doctor_id', '==', 2),
+    lambda: Query('appointment_join').where('booking_date', 'between', ('2021-03-01', '2021-06-15')).where('status', '==', 'done'),
+    lambda: Query('appointment_join').where('patient_id', 'in', [1, 3]).where('price', '>', 50),
+    lambda: Query('appointment_join').where('booking_date', '<', '2021-02-10'),
+    lambda: Query('appointment_join').where('id', '==', 77),
+]
+
+@pytest.mark.parametrize('build', QUERIES)
+def test_index_and_scan_return_the_same_rows(database, monkeypatch, build):
+    seedTables()
+    saveJTable('appointment_join', _appointments())
+    assert build().explain().startswith("Index")
+    with_index = build().run()
+
+    monkeypatch.setitem(my_db_indexes, 'appointment_join', [])
+    dropIndexes()
+    assert not build().explain().startswith("Index")
+    assert _ids(build().run()) == _ids(with_index)
+    assert build().run() == with_index
+
+def test_rows_match_a_plain_filter(database):
+    seedTables()
+    saveJTable('appointment_join', _appointments())
+    expected = [record['id'] for record in loadJTable('appointment_join') if record['doctor_id'] == 1 and record['status'] == 'Done']
+    rows = Query('appointment_join').where('doctor_id', '==', 1).where('status', '==', 'Done').orderBy('id').run()
+    assert [row['id'] for row in rows] == expected
+
+    totals = Query('appointment_join').where('status', '==', 'Done').groupBy('doctor_id', total=('sum', 'price')).run()
+    assert {row['doctor_id']: row['total'] for row in totals} == {
+        doctor_id: sum(record['price'] for record in loadJTable('appointment_join') if record['doctor_id'] == doctor_id and record['status'] == 'Done')
+        for doctor_id in (1, 2)}
+
+def test_index_follows_the_writes(database):
+    seedTables()
+    assert _ids(Query('appointment_join').where('doctor_id', '==', 1).run()) == [2, 4, 6]
+    updateJRecord('appointment_join', 3, {'doctor_id': 1})
+    assert _ids(Query('appointment_join').where('doctor_id', '==', 1).run()) == [2, 3, 4, 6]
@@ -0,0 +1,33 @@
+# test_records.py
+# the slots-based record classes: they read and write like the dictionaries of the json files
+
+from PrU_helper_json import *
+from PrU_helper_records import *
+from conftest import seedTables
+
+def test_record_converts_dates_and_sets_both_ways():
+    data = {'id': 4, 'booking_date': '2024-02-29', 'patient_id': 2, 'doctor_id': 1, 'price': 25, 'status': 'done', 'note': "first visit"}
+    record = toRecord('appointment_join', data)
+    assert type(record).__name__ == 'AppointmentJoinRecord'
+    assert not hasattr(record, '__dict__')
+    assert record.booking_date == 20240229
+    assert record['booking_date'] == '2024-02-29'
+    assert record['status'] == 'Done'   # the spelling of the schema
+    assert record['note'] == "first visit"
+    assert dict(record) == dict(data, status='Done')
+
+    copy = record.copy()
+    copy['status'] = 'Canceled'
+    assert record['status'] == 'Done'
+
+def test_bad_values_are_kept_as_they_are():
+    record = toRecord('patient', {'id': 1, 'name': "Ann", 'date_of_birth': '31/12/1990', 'status': 'Away'})
+    assert record['date_of_birth'] == '31/12/1990'
+    assert record['status'] == 'Away'
+
+def test_tables_load_as_records(database):
+    seedTables()
+    patients = loadJTable('patient')
+    assert all(isinstance(record, recordClass('patient')) for record in patients)
+    assert [record['name'] for record in patients] == ["Patient 1", "Patient 2", "Patient 3"]
+    assert all(isinstance(record, recordClass('appointment_join')) for record in loadJTable('appointment_join'))
@@ -0,0 +1,36 @@
+# test_recurrence.py
+# recurring appointments: the dates of each rule, and a series booked all together or not at all
+
+import pytest
+from PrU_helper_json import *
+from PrU_helper_recurrence import *
+from conftest import seedTables
+
+def test_monthly_dates_are_clamped_to_the_end_of_the_month():
+    assert expandRecurrence('2023-01-31', 'monthly', count=5) == ['2023-01-31', '2023-02-28', '2023-03-31', '2023-04-30', '2023-05-31']
+    assert expandRecurrence('2024-01-31', 'monthly', count=2) == ['2024-01-31', '2024-02-29']    # leap year
+    assert expandRecurrence('2023-11-30', 'monthly', interval=3, end_date_str='2024-08-30') == ['2023-11-30', '2024-02-29', '2024-05-30', '2024-08-30']
+    assert expandRecurrence('2024-01-31', 'monthly', end_date_str='2024-03-30') == ['2024-01-31', '2024-02-29']
+
+def test_daily_and_weekly_dates():
+    assert expandRecurrence('2024-12-30', 'daily', interval=2, count=3) == ['2024-12-30', '2025-01-01', '2025-01-03']
+    assert expandRecurrence('2025-01-06', 'weekly', interval=2, end_date_str='2025-02-03') == ['2025-01-06', '2025-01-20', '2025-02-03']
+
+def test_invalid_rules_are_refused():
+    with pytest.raises(ValueError):
+        expandRecurrence('2025-01-06', 'yearly', count=2)
+    with pytest.raises(ValueError):
+        expandRecurrence('2025-01-06', 'weekly')    # no end date and no count
+    with pytest.raises(ValueError):
+        expandRecurrence('2025-01-06', 'daily', count=J_DB_RECURRENCE_MAX_OCCURRENCES + 1)
+
+def test_series_is_booked_together_or_not_at_all(database):
+    seedTables()
+    appointment = {'patient_id': 1, 'doctor_id': 2, 'price': 30, 'status': 'Booked'}
+    booked = bookRecurringAppointments(appointment, expandRecurrence('2099-01-31', 'monthly', count=3))
+    assert [record['id'] for record in booked] == [7, 8, 9]
+    assert [getJRecord('appointment_join', record_id)['booking_date'] for record_id in (7, 8, 9)] == ['2099-01-31', '2099-02-28', '2099-03-31']
+
+    with pytest.raises(TransactionError):
+        bookRecurringAppointments(dict(appointment, doctor_id=99), expandRecurrence('2099-05-01', 'weekly', count=4))
+    assert len(loadJTable('appointment_join')) == 9
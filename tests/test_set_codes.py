@@ -0,0 +1,33 @@
+# test_set_codes.py
+# 'set' values kept as their integer codes: compared as integers, packed and unpacked without any string work
+
+import pytest
+from PrU_helper_codec import *
+from PrU_helper_mmap import *
+from PrU_helper_records import *
+
+STATUS = my_db_schema['appointment_join']['status']
+
+def test_codes_round_trip():
+    for code, value in enumerate(STATUS[1], start=1):
+        assert encodeSet(STATUS, value) == encodeSet(STATUS, value.upper()) == code
+        assert decodeSet(STATUS, code) == value
+        assert setMember('appointment_join', 'status', value.lower()) == code
+        assert encodeSet(STATUS, setMember('appointment_join', 'status', code)) == code
+    assert encodeSet(STATUS, None) == NULL_CODE and decodeSet(STATUS, NULL_CODE) is None
+    with pytest.raises(ValueError):
+        encodeSet(STATUS, 'Postponed')
+    assert setMember('appointment_join', 'status', 'Postponed') is None
+
+def test_packed_record_round_trip():
+    layout = fixedLayout('appointment_join')
+    for status in STATUS[1] + (None,):
+        record = toRecord('appointment_join', {'id': 5, 'booking_date': '2024-03-01', 'patient_id': 2, 'doctor_id': 1, 'price': 45, 'status': status})
+        packed = packRecord('appointment_join', record)
+        assert packed == packRecord('appointment_join', dict(record))    # the same bytes as packing the decoded values
+        values = layout.unpack(packed)
+        assert values[-1] == encodeSet(STATUS, status)
+        unpacked = unpackRecord('appointment_join', values)
+        assert dict(unpacked) == dict(record)
+        assert unpacked.raw('status') is setMember('appointment_join', 'status', status)
+        assert rawValue(unpacked, 'booking_date') == 20240301
@@ -0,0 +1,48 @@
+# test_snapshot.py
+# pinned snapshots: a report sees the tables as they were when it pinned them, and never a half-written state
+
+import contextvars
+import threading
+import PrU_helper_snapshot
+from PrU_helper_json import *
+from PrU_helper_query import *
+from PrU_helper_snapshot import *
+from conftest import seedTables
+
+def test_snapshot_keeps_its_version_while_the_tables_change(database):
+    seedTables()
+    with pinSnapshot() as snapshot:
+        updateJRecord('patient', 1, {'name': "Renamed"})
+        updateJRecord('appointment_join', 2, {'price': 999})
+        addJRecord('appointment_join', {'booking_date': '2020-01-02', 'patient_id': 1, 'doctor_id': 1, 'price': 5, 'status': 'Booked'})
+
+        assert [record['name'] for record in snapshot.rows('patient')] == ["Patient 1", "Patient 2", "Patient 3"]
+        assert [record['price'] for record in snapshot.rows('appointment_join')] == [10, 20, 30, 40, 50, 60]
+        rows = Query('appointment_join', snapshot).where('booking_date', '==', '2020-01-02').join('patient_id').run()
+        assert [(row['id'], row['price'], row['patient_name']) for row in rows] == [(2, 20, "Patient 3")]
+
+    with pinSnapshot() as snapshot:
+        rows = Query('appointment_join', snapshot).where('booking_date', '==', '2020-01-02').join('patient_id').orderBy('id').run()
+        assert [(row['id'], row['price'], row['patient_name']) for row in rows] == [(2, 999, "Patient 3"), (7, 5, "Renamed")]
+
+def test_pin_locks_the_tables_when_the_writers_never_stop(database, monkeypatch):
+    seedTables()
+    load = PrU_helper_snapshot._loadVersions
+    writers = []
+
+    def loadThenWrite(tables):
+        # a writer gets in after every load, it has to wait for the locks during the last one
+        loaded = load(tables)
+        writer = threading.Thread(target=contextvars.copy_context().run, args=(updateJRecord, 'appointment_join', 1, {'price': 100 + len(writers)}))
+        writers.append(writer)
+        writer.start()
+        writer.join(timeout=0.2)
+        return loaded
+
+    monkeypatch.setattr(PrU_helper_snapshot, '_loadVersions', loadThenWrite)
+    with pinSnapshot(['appointment_join']) as snapshot:
+        assert len(writers) == SNAPSHOT_RETRIES + 1
+        assert snapshot.rows('appointment_join')[0]['price'] == 100 + SNAPSHOT_RETRIES - 1
+    for writer in writers:
+        writer.join()
+    assert getJRecord('appointment_join', 1)['price'] == 100 + SNAPSHOT_RETRIES
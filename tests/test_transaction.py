@@ -0,0 +1,111 @@
+# test_transaction.py
+# transactions: a rollback writes nothing, and a commit interrupted while it's applied is completed from its log
+
+import json
+import os
+import shutil
+import pytest
+import PrU_helper_transaction
+from PrU_helper_json import *
+from PrU_helper_transaction import *
+from conftest import seedTables
+
+def _records(table_name):
+    return sorted((dict(record) for record in loadJTable(table_name)), key=lambda record: record['id'])
+
+def test_rollback_on_error_writes_nothing(database):
+    seedTables()
+    before = {table_name: _records(table_name) for table_name in my_db_tables}
+    with pytest.raises(RuntimeError):
+        with Transaction() as transaction:
+            patient = transaction.insert('patient', {'name': "New", 'date_of_birth': '2000-01-01', 'status': 'Active'})
+            transaction.insert('appointment_join', {'booking_date': '2030-01-01', 'patient_id': patient['id'], 'doctor_id': 1, 'price': 5, 'status': 'Booked'})
+            raise RuntimeError("the clerk closed the window")
+    assert transaction.state == 'rolled back'
+    assert {table_name: _records(table_name) for table_name in my_db_tables} == before
+    assert not transactionPending()
+
+def test_invalid_change_rolls_back(database):
+    seedTables()
+    before = _records('appointment_join')
+    with pytest.raises(TransactionError):
+        with Transaction() as transaction:
+            transaction.insert('appointment_join', {'booking_date': '2030-01-01', 'patient_id': 1, 'doctor_id': 1, 'price': 5, 'status': 'Booked'})
+            transaction.insert('appointment_join', {'booking_date': '2030-01-02', 'patient_id': 999, 'doctor_id': 1, 'price': 5, 'status': 'Booked'})
+    assert _records('appointment_join') == before
+    assert not transactionPending()
+
+def test_replay_after_crash_mid_apply(database, monkeypatch):
+    seedTables()
+
+    def crash(*args, **kwargs):
+        raise OSError("the disk went away")
+
+    # the appointments (inserts first) are written, then the program stops before the patient table is saved
+    with monkeypatch.context() as patch:
+        patch.setattr(PrU_helper_transaction, 'saveJTable', crash)
+        transaction = Transaction()
+        transaction.insert('appointment_join', {'booking_date': '2030-01-01', 'patient_id': 1, 'doctor_id': 1, 'price': 5, 'status': 'Booked'})
+        transaction.insert('appointment_join', {'booking_date': '2030-01-02', 'patient_id': 2, 'doctor_id': 2, 'price': 7, 'status': 'Booked'})
+        transaction.update('patient', 1, {'status': 'Innactive'})
+        with pytest.raises(TransactionError):
+            transaction.commit()
+
+    assert transactionPending()
+    assert [record['id'] for record in _records('appointment_join')] == [1, 2, 3, 4, 5, 6, 7, 8]
+    assert _records('patient')[0]['status'] == 'Active'
+    (log_path,) = transactionLogPaths()
+    kept_log = log_path + ".copy"
+    shutil.copy(log_path, kept_log)
+
+    assert recoverTransactions() == 1
+    assert not transactionPending()
+    appointments = _records('appointment_join')
+    patients = _records('patient')
+    assert [record['id'] for record in appointments] == [1, 2, 3, 4, 5, 6, 7, 8]
+    assert appointments[-1]['price'] == 7
+    assert patients[0]['status'] == 'Innactive'
+
+    # replaying the same log again changes nothing
+    os.replace(kept_log, log_path)
+    assert recoverTransactions() == 1
+    assert _records('appointment_join') == appointments
+    assert _records('patient') == patients
+
+def test_record_removed_before_commit_rolls_back(database):
+    seedTables()
+    transaction = Transaction()
+    transaction.update('appointment_join', 3, {'status': 'Done'})
+    transaction.insert('appointment_join', {'booking_date': '2030-01-01', 'patient_id': 1, 'doctor_id': 2, 'price': 5, 'status': 'Booked'})
+    # another clerk removes the appointment between the update and the commit
+    saveJTable('appointment_join', [record for record in loadJTable('appointment_join') if record['id'] != 3])
+    before = {table_name: _records(table_name) for table_name in my_db_tables}
+    with pytest.raises(TransactionError):
+        transaction.commit()
+    assert transaction.state == 'rolled back'
+    assert {table_name: _records(table_name) for table_name in my_db_tables} == before
+    assert not transactionPending()
+
+def test_fk_target_removed_before_commit_rolls_back(database):
+    seedTables()
+    transaction = Transaction()
+    transaction.insert('appointment_join', {'booking_date': '2030-01-01', 'patient_id': 1, 'doctor_id': 2, 'price': 5, 'status': 'Booked'})
+    saveJTable('doctor', [record for record in loadJTable('doctor') if record['id'] != 2])
+    with pytest.raises(TransactionError):
+        transaction.commit()
+    assert [record['id'] for record in _records('appointment_join')] == [1, 2, 3, 4, 5, 6]
+    assert not transactionPending()
+
+def test_replay_skips_an_update_of_a_removed_record(database):
+    seedTables()
+    log = {'tables': ['appointment_join', 'patient'],
+           'operations': [{'op': 'update', 'table': 'appointment_join', 'id': 3, 'values': {'price': 99}},
+                          {'op': 'update', 'table': 'appointment_join', 'id': 4, 'values': {'price': 44}},
+                          {'op': 'update', 'table': 'patient', 'id': 2, 'values': {'status': 'Innactive'}}]}
+    saveJTable('appointment_join', [record for record in loadJTable('appointment_join') if record['id'] != 3])
+    writeFileAtomic(os.path.join(databaseFolder(), "transaction.1.1.log"), lambda f: json.dump(log, f))
+
+    assert recoverTransactions() == 1
+    assert not transactionPending()
+    assert {record['id']: record['price'] for record in _records('appointment_join')}[4] == 44
+    assert _records('patient')[1]['status'] == 'Innactive'
@@ -0,0 +1,37 @@
+# test_validate.py
+# the bulk validator: it finds the records that don't match the schema, and repair mode fixes the obvious ones
+
+from PrU_helper_json import *
+from PrU_helper_mmap import *
+from PrU_helper_validate import *
+from conftest import seedTables
+
+def test_repair_fixes_the_json_records(database):
+    seedTables()
+    saveJTable('patient', [{'id': 1, 'name': "Ann", 'date_of_birth': '1990-01-01', 'status': 'Active'},
+                           {'id': 2, 'name': "Bob", 'date_of_birth': '31/12/1985', 'status': 'active', 'nickname': "B"},
+                           {'id': 2, 'name': "Bob's twin", 'date_of_birth': 'someday', 'status': 'Away'}])
+    problems = validateTable('patient')
+    assert {(record_id, key) for record_id, key, problem in problems} >= {(2, 'date_of_birth'), (2, 'status'), (2, 'nickname'), (2, 'id')}
+
+    assert repairTable('patient') == 2
+    assert validateTable('patient') == []
+    patients = {record['id']: dict(record) for record in loadJTable('patient')}
+    assert patients[2] == {'id': 2, 'name': "Bob", 'date_of_birth': '1985-12-31', 'status': 'Active'}
+    assert patients[3] == {'id': 3, 'name': "Bob's twin", 'date_of_birth': None, 'status': None}
+    assert repairTable('patient') == 0
+
+def test_fixed_width_checks_and_repair(database):
+    seedTables()
+    rows = list(iterFixedRaw('appointment_join'))
+    rows[1] = (rows[1][0], 20200231) + rows[1][2:]     # February 31st
+    rows[2] = (rows[2][0], rows[2][1], 42) + rows[2][3:]    # a patient that doesn't exist
+    writeFixedRaw('appointment_join', rows)
+
+    problems = validateTable('appointment_join', workers=1)
+    assert {(record_id, key) for record_id, key, problem in problems} == {(2, 'booking_date'), (3, 'patient_id')}
+    version = tableVersion('appointment_join')
+    assert repairTable('appointment_join') == 1
+    assert tableVersion('appointment_join') != version
+    assert getJRecord('appointment_join', 2)['booking_date'] is None
+    assert [(record_id, key) for record_id, key, problem in validateTable('appointment_join', workers=1)] == [(3, 'patient_id')]    # needs a manual fix